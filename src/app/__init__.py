@@ -0,0 +1,3 @@
+# Pacote do pipeline de extração de guias federais e arquivos SPED.
+# Os módulos pesados (PyMuPDF, cv2, office365, google-cloud) só são importados
+# pelos subcomandos que precisam deles.
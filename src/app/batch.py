@@ -0,0 +1,386 @@
+import re
+import sys
+import json
+import tempfile
+import datetime
+from array import array
+
+# Lote de registros de guias em colunas, para os lotes grandes (dezenas de milhares de
+# guias) que hoje vivem como listas de dicts com as mesmas chaves longas repetidas em
+# cada registro. Cada campo vira uma coluna (chave guardada uma vez):
+#
+#   category  códigos inteiros + tabela de valores distintos (CNPJ, códigos de receita,
+#             descrições, nomes de arquivo, períodos)
+#   date      "dd/mm/aaaa" como dia ordinal (array de int32)
+#   amount    "1.234,56" como centavos (array de int64)
+#   int       inteiros (página)
+#   ref       referências "sha256:<hex>" do armazém de textos como 32 bytes
+#   object    qualquer outro valor (lista comum)
+#
+# A conversão é sem perdas: valor que não volta idêntico da codificação (data fora do
+# formato, valor com outra pontuação, None) fica guardado como está numa tabela de
+# exceções da coluna. A ordem e a presença das chaves de cada registro são guardadas
+# como "formatos" (tuplas de chaves, também categóricas), então o JSON gerado a partir
+# do lote é igual ao original.
+
+COLUMN_TYPES = {
+    "Nome do Arquivo": "category", "File Name": "category",
+    "Página": "int",
+    "CNPJ": "category", "Company Name": "category",
+    "Periodo de Apuração": "category", "Apuration Date": "category",
+    "Data de Vencimento": "date", "Due Date": "date",
+    "Valor Total do Documento": "amount", "Total Value": "amount",
+    "Código Denominação": "category", "Tax Code": "category",
+    "Descrição Cod Denominação": "category", "Tax Description": "category",
+    "Texto": "ref", "Content Ref": "ref",
+}
+
+DATE_PATTERN = re.compile(r'^(\d{2})/(\d{2})/(\d{4})$')
+AMOUNT_PATTERN = re.compile(r'^-?\d{1,3}(?:\.\d{3})*,\d{2}$')
+REF_PREFIX = "sha256:"
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False)
+
+
+# Chave repetida num objeto JSON desalinharia as colunas (e o json comum fica só com a última)
+def _check_unique(pairs):
+    keys = set()
+    for key, _ in pairs:
+        if key in keys:
+            raise ValueError(f"Chave repetida no registro JSON: {key!r}")
+        keys.add(key)
+
+
+def _unique_dict(pairs):
+    _check_unique(pairs)
+    return dict(pairs)
+
+
+# Marca, no lugar do dict, de um registro já gravado nas colunas pelo parser
+_ROW = object()
+
+
+class _NotFlat(Exception):
+    pass
+
+
+class _ObjectColumn:
+    def __init__(self):
+        self.values = []
+
+    def __len__(self):
+        return len(self.values)
+
+    def append(self, value):
+        self.values.append(value)
+
+    # Posição de um registro sem o campo (não é lida: o formato do registro não tem a chave)
+    def fill(self):
+        self.values.append(None)
+
+    def get(self, row):
+        return self.values[row]
+
+    def encoded(self, row):
+        return _dumps(self.values[row])
+
+
+class _CategoryColumn:
+    def __init__(self):
+        self.codes = array('I')
+        self.categories = []
+        self._index = {}
+        self._encoded = []
+
+    def __len__(self):
+        return len(self.codes)
+
+    def code_of(self, value):
+        # True e 1 têm o mesmo hash: só strings entram no índice pelo próprio valor
+        key = value if type(value) is str else (type(value), value)
+        code = self._index.get(key)
+        if code is None:
+            code = len(self.categories)
+            self.categories.append(value)
+            self._encoded.append(None)
+            self._index[key] = code
+        return code
+
+    def append(self, value):
+        self.codes.append(self.code_of(value))
+
+    def fill(self):
+        self.append(None)
+
+    def get(self, row):
+        return self.categories[self.codes[row]]
+
+    # Cada valor distinto é serializado uma vez só
+    def encoded(self, row):
+        code = self.codes[row]
+        text = self._encoded[code]
+        if text is None:
+            text = self._encoded[code] = _dumps(self.categories[code])
+        return text
+
+
+# Coluna tipada: valores que não voltam idênticos da codificação vão para `exceptions`
+class _EncodedColumn:
+    typecode = 'q'
+
+    def __init__(self):
+        self.data = array(self.typecode)
+        self.exceptions = {}
+
+    def __len__(self):
+        return len(self.data)
+
+    def append(self, value):
+        encoded = self.encode(value)
+        if encoded is None or self.decode(encoded) != value:
+            self.exceptions[len(self.data)] = value
+            encoded = 0
+        self.data.append(encoded)
+
+    def fill(self):
+        self.data.append(0)
+
+    def get(self, row):
+        if row in self.exceptions:
+            return self.exceptions[row]
+        return self.decode(self.data[row])
+
+    def encoded(self, row):
+        return _dumps(self.get(row))
+
+
+class _IntColumn(_EncodedColumn):
+    def encode(self, value):
+        return value if type(value) is int and -2 ** 63 <= value < 2 ** 63 else None
+
+    def decode(self, encoded):
+        return encoded
+
+    def encoded(self, row):
+        return _dumps(self.exceptions[row]) if row in self.exceptions else str(self.data[row])
+
+
+class _DateColumn(_EncodedColumn):
+    typecode = 'i'
+
+    def encode(self, value):
+        match = DATE_PATTERN.match(value) if type(value) is str else None
+        if not match:
+            return None
+        try:
+            return datetime.date(int(match.group(3)), int(match.group(2)), int(match.group(1))).toordinal()
+        except ValueError:
+            return None
+
+    def decode(self, encoded):
+        day = datetime.date.fromordinal(encoded)
+        return f"{day.day:02d}/{day.month:02d}/{day.year:04d}"
+
+    # Datas como dias ordinais, para filtros e ordenação sem decodificar (None nas exceções)
+    def ordinals(self):
+        return [None if row in self.exceptions else ordinal for row, ordinal in enumerate(self.data)]
+
+
+class _AmountColumn(_EncodedColumn):
+    def encode(self, value):
+        if type(value) is not str or not AMOUNT_PATTERN.match(value):
+            return None
+        return int(value.replace('.', '').replace(',', ''))
+
+    def decode(self, encoded):
+        sign = '-' if encoded < 0 else ''
+        reais, centavos = divmod(abs(encoded), 100)
+        return f"{sign}{reais:,}".replace(',', '.') + f",{centavos:02d}"
+
+    # Valores em centavos (None nas exceções), para somas sem converter texto
+    def cents(self):
+        return [None if row in self.exceptions else cents for row, cents in enumerate(self.data)]
+
+
+class _RefColumn:
+    def __init__(self):
+        self.data = bytearray()
+        self.exceptions = {}
+
+    def __len__(self):
+        return len(self.data) // 32
+
+    def append(self, value):
+        if type(value) is str and value.startswith(REF_PREFIX) and len(value) == len(REF_PREFIX) + 64:
+            try:
+                digest = bytes.fromhex(value[len(REF_PREFIX):])
+            except ValueError:
+                digest = None
+            if digest is not None and REF_PREFIX + digest.hex() == value:
+                self.data += digest
+                return
+        self.exceptions[len(self)] = value
+        self.data += bytes(32)
+
+    def fill(self):
+        self.data += bytes(32)
+
+    def get(self, row):
+        if row in self.exceptions:
+            return self.exceptions[row]
+        return REF_PREFIX + self.data[row * 32:(row + 1) * 32].hex()
+
+    def encoded(self, row):
+        return _dumps(self.get(row))
+
+
+COLUMN_CLASSES = {
+    "category": _CategoryColumn, "date": _DateColumn, "amount": _AmountColumn, "int": _IntColumn, "ref": _RefColumn,
+    "object": _ObjectColumn,
+}
+
+
+class GuiaBatch:
+    def __init__(self, column_types=None):
+        self.column_types = COLUMN_TYPES if column_types is None else column_types
+        self.columns = {}
+        self._shapes = _CategoryColumn()
+
+    def __len__(self):
+        return len(self._shapes)
+
+    @classmethod
+    def from_records(cls, records):
+        batch = cls()
+        batch.extend(records)
+        return batch
+
+    # Função para ler um JSON de saída direto para as colunas: numa lista de registros
+    # planos o parser entrega os pares de cada registro sem montar o dict. Qualquer outro
+    # formato (objetos aninhados, JSON que não é lista) é lido inteiro e convertido
+    # registro a registro.
+    @classmethod
+    def from_json(cls, path):
+        batch = cls()
+
+        # O parser chama o hook de dentro para fora: um objeto aninhado já virou linha
+        # quando o registro que o contém aparece, então a leitura direta é abandonada
+        def append_flat(pairs):
+            _check_unique(pairs)
+            for _, value in pairs:
+                if value is _ROW or type(value) is list:
+                    raise _NotFlat()
+            batch._append_pairs(pairs)
+            return _ROW
+
+        with open(path, 'r', encoding='utf-8') as json_file:
+            try:
+                data = json.load(json_file, object_pairs_hook=append_flat)
+            except _NotFlat:
+                data = None
+            if type(data) is list and all(item is _ROW for item in data):
+                return batch
+            json_file.seek(0)
+            records = json.load(json_file, object_pairs_hook=_unique_dict)
+        if type(records) is not list or not all(type(record) is dict for record in records):
+            raise ValueError(f"{path} não é uma lista de registros JSON")
+        return cls.from_records(records)
+
+    @classmethod
+    def from_ndjson(cls, path):
+        batch = cls()
+        with open(path, 'r', encoding='utf-8') as ndjson_file:
+            for line in ndjson_file:
+                if line.strip():
+                    record = json.loads(line, object_pairs_hook=_unique_dict)
+                    if type(record) is not dict:
+                        raise ValueError(f"Linha de {path} não é um registro JSON: {line[:80]!r}")
+                    batch.append(record)
+        return batch
+
+    def append(self, record):
+        self._append_pairs(record.items())
+
+    def extend(self, records):
+        for record in records:
+            self._append_pairs(record.items())
+
+    def _append_pairs(self, pairs):
+        row = len(self)
+        keys = []
+        for key, value in pairs:
+            column = self.columns.get(key)
+            if column is None:
+                key = sys.intern(key)
+                column = self.columns[key] = COLUMN_CLASSES[self.column_types.get(key, "object")]()
+                for _ in range(row):
+                    column.fill()
+            column.append(value)
+            keys.append(key)
+        if len(keys) < len(self.columns):
+            for column in self.columns.values():
+                if len(column) == row:
+                    column.fill()
+        self._shapes.append(tuple(keys))
+
+    def keys(self, row):
+        return self._shapes.get(row)
+
+    def record(self, row):
+        return {key: self.columns[key].get(row) for key in self.keys(row)}
+
+    # Registros como dicts, um de cada vez (para quem ainda precisa do formato antigo)
+    def iter_records(self):
+        for row in range(len(self)):
+            yield self.record(row)
+
+    # Valores decodificados de um campo (None nos registros sem o campo)
+    def column(self, key):
+        column = self.columns[key]
+        return [column.get(row) if key in self.keys(row) else None for row in range(len(self))]
+
+    # Linhas NDJSON, montadas coluna a coluna sem criar os dicts; `key_func` troca o nome
+    # dos campos na saída (ex.: load.clean_field_name para o BigQuery)
+    def ndjson_lines(self, key_func=None):
+        prefixes = self._key_prefixes(key_func, '', ': ')
+        for row in range(len(self)):
+            shape = self._shapes.codes[row]
+            yield '{' + ', '.join(prefix + column.encoded(row) for prefix, column in prefixes[shape]) + '}\n'
+
+    def to_ndjson(self, path, key_func=None):
+        with open(path, 'w', encoding='utf-8') as ndjson_file:
+            ndjson_file.writelines(self.ndjson_lines(key_func))
+
+    # NDJSON num arquivo temporário binário (já no início), para cargas que recebem um
+    # arquivo: as linhas são gravadas uma a uma, sem montar o texto inteiro na memória
+    def to_ndjson_stream(self, key_func=None):
+        stream = tempfile.TemporaryFile()
+        for line in self.ndjson_lines(key_func):
+            stream.write(line.encode('utf-8'))
+        stream.seek(0)
+        return stream
+
+    # Mesmo texto de json.dump(registros, ensure_ascii=False, indent=4)
+    def to_json(self, path):
+        prefixes = self._key_prefixes(None, '        ', ': ')
+        with open(path, 'w', encoding='utf-8') as json_file:
+            if not len(self):
+                json_file.write('[]')
+                return
+            json_file.write('[\n')
+            for row in range(len(self)):
+                fields = prefixes[self._shapes.codes[row]]
+                if fields:
+                    body = ',\n'.join(prefix + column.encoded(row) for prefix, column in fields)
+                    json_file.write('    {\n' + body + '\n    }')
+                else:
+                    json_file.write('    {}')
+                json_file.write(',\n' if row < len(self) - 1 else '\n')
+            json_file.write(']')
+
+    # Prefixo serializado ('"chave": ') e coluna de cada campo, por formato de registro
+    def _key_prefixes(self, key_func, indent, separator):
+        return [[(indent + _dumps(key_func(key) if key_func else key) + separator, self.columns[key]) for key in shape]
+                for shape in self._shapes.categories]
@@ -0,0 +1,238 @@
+import os
+import sys
+import json
+import math
+import time
+import base64
+import shutil
+import logging
+import platform
+import subprocess
+from collections import defaultdict
+
+from .corpus import load_manifest
+from .batch import GuiaBatch
+from .load import clean_field_name
+from .parser import process_text_and_generate_json
+
+# Benchmark do pipeline de guias sobre um corpus sintético (ver corpus.py).
+# Mede cada etapa isolada e o fluxo completo e gera um relatório JSON que pode
+# ser comparado com o de outro commit para detectar regressões.
+
+PAGE_STAGES = ["render", "enhance", "ocr", "parse"]
+FILE_STAGES = ["serialize", "load"]
+STAGES = PAGE_STAGES + FILE_STAGES
+
+
+class StubOCR:
+    # OCR local de referência: devolve o texto esperado do manifest. Monta o mesmo
+    # payload base64 enviado ao Vision para que o custo de serialização seja medido.
+    def __init__(self, manifest, latency=0.0):
+        self.latency = latency
+        self.texts = {plan["name"]: [page["text"] for page in plan["pages"]] for plan in manifest["files"]}
+
+    def __call__(self, file_name, page_num, image_path):
+        with open(image_path, "rb") as image_file:
+            payload = {'requests': [{'image': {'content': base64.b64encode(image_file.read()).decode('utf-8')},
+                                     'features': [{'type': 'TEXT_DETECTION'}]}]}
+        json.dumps(payload)
+        if self.latency:
+            time.sleep(self.latency)
+        return self.texts[file_name][page_num]
+
+
+def serialize_records(records):
+    return json.dumps(records, ensure_ascii=False, indent=4)
+
+
+# Simula a carga no BigQuery: lote em colunas e NDJSON com os nomes dos campos limpos
+def load_stub(records):
+    return ''.join(GuiaBatch.from_records(records).ndjson_lines(clean_field_name))
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies, units=None):
+    total = sum(latencies)
+    units = len(latencies) if units is None else units
+    return {
+        "count": len(latencies),
+        "total_seconds": round(total, 6),
+        "items_per_sec": round(units / total, 3) if total else None,
+        "p50_ms": _ms(percentile(latencies, 50)),
+        "p90_ms": _ms(percentile(latencies, 90)),
+        "p99_ms": _ms(percentile(latencies, 99)),
+        "max_ms": _ms(max(latencies) if latencies else None),
+    }
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3) if seconds is not None else None
+
+
+def _timed(timings, stage, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    timings[stage].append(time.perf_counter() - start)
+    return result
+
+
+# Pico de memória residente do processo em KB (indisponível no Windows)
+def peak_rss_kb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def git_commit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        return result.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Executa o pipeline completo arquivo a arquivo, medindo cada etapa no caminho
+def run_end_to_end(corpus_dir, manifest, work_dir, ocr):
+    from .ocr import enhance_image, render_page
+    import fitz  # PyMuPDF
+
+    timings = defaultdict(list)
+    file_latencies = []
+    pages = 0
+    artifacts = []
+
+    start = time.perf_counter()
+    for file_index, plan in enumerate(manifest["files"]):
+        file_start = time.perf_counter()
+        records = []
+        with fitz.open(os.path.join(corpus_dir, plan["name"])) as doc:
+            for page_num in range(len(doc)):
+                image_path = os.path.join(work_dir, f"{file_index}_page_{page_num}.png")
+                _timed(timings, "render", render_page, doc, page_num, image_path)
+                enhanced_path = _timed(timings, "enhance", enhance_image, image_path)
+                text = _timed(timings, "ocr", ocr, plan["name"], page_num, enhanced_path)
+                record = _timed(timings, "parse", process_text_and_generate_json, text, plan["name"])
+                if record:
+                    records.append(record)
+                artifacts.append((file_index, page_num, image_path, enhanced_path, text))
+                pages += 1
+        _timed(timings, "serialize", serialize_records, records)
+        _timed(timings, "load", load_stub, records)
+        file_latencies.append(time.perf_counter() - file_start)
+    elapsed = time.perf_counter() - start
+
+    result = {
+        "pages": pages,
+        "files": len(manifest["files"]),
+        "seconds": round(elapsed, 6),
+        "pages_per_sec": round(pages / elapsed, 3) if elapsed else None,
+        "file_latency": summarize(file_latencies),
+        "stages": {stage: summarize(timings[stage]) for stage in STAGES},
+    }
+    return result, artifacts
+
+
+# Executa cada etapa sozinha sobre as entradas já produzidas pelo fluxo completo
+def run_isolated(corpus_dir, manifest, artifacts, ocr):
+    from .ocr import enhance_image, render_page
+    import fitz  # PyMuPDF
+
+    plans = manifest["files"]
+    timings = defaultdict(list)
+
+    by_file = defaultdict(list)
+    for artifact in artifacts:
+        by_file[artifact[0]].append(artifact)
+
+    for file_index, file_artifacts in by_file.items():
+        with fitz.open(os.path.join(corpus_dir, plans[file_index]["name"])) as doc:
+            for _, page_num, image_path, _, _ in file_artifacts:
+                _timed(timings, "render", render_page, doc, page_num, image_path)
+    for _, _, image_path, _, _ in artifacts:
+        _timed(timings, "enhance", enhance_image, image_path)
+    for file_index, page_num, _, enhanced_path, _ in artifacts:
+        _timed(timings, "ocr", ocr, plans[file_index]["name"], page_num, enhanced_path)
+
+    records_by_file = defaultdict(list)
+    for file_index, _, _, _, text in artifacts:
+        record = _timed(timings, "parse", process_text_and_generate_json, text, plans[file_index]["name"])
+        if record:
+            records_by_file[file_index].append(record)
+    for file_index in by_file:
+        _timed(timings, "serialize", serialize_records, records_by_file[file_index])
+    for file_index in by_file:
+        _timed(timings, "load", load_stub, records_by_file[file_index])
+
+    return {stage: summarize(timings[stage]) for stage in STAGES}
+
+
+# Função principal do benchmark: retorna o relatório como dicionário
+def run_benchmark(corpus_dir, work_dir=None, ocr_latency=0.0, isolated=True, engine=None):
+    manifest = load_manifest(corpus_dir)
+    if engine is None:
+        ocr = StubOCR(manifest, ocr_latency)
+    else:
+        # Motor real: a imagem já chega pré-processada pela etapa enhance
+        engine.enhance = False
+        ocr = lambda file_name, page_num, image_path: engine.recognize_page(image_path)
+    work_dir = work_dir or os.path.join(corpus_dir, "_bench_images")
+    os.makedirs(work_dir, exist_ok=True)
+
+    # O parser registra um aviso por página fora do formato; não interessa aqui
+    root_logger = logging.getLogger()
+    previous_level = root_logger.level
+    root_logger.setLevel(logging.ERROR)
+    try:
+        end_to_end, artifacts = run_end_to_end(corpus_dir, manifest, work_dir, ocr)
+        isolated_stages = run_isolated(corpus_dir, manifest, artifacts, ocr) if isolated else None
+    finally:
+        root_logger.setLevel(previous_level)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "corpus": {"seed": manifest.get("seed"), "files": end_to_end["files"], "pages": end_to_end["pages"]},
+        "ocr_engine": engine.name if engine else "stub",
+        "ocr_latency_seconds": ocr_latency,
+        "end_to_end": end_to_end,
+        "isolated": isolated_stages,
+        "peak_rss_kb": peak_rss_kb(),
+    }
+
+
+# Função para comparar dois relatórios; retorna as regressões acima da tolerância
+def compare_reports(current, baseline, tolerance=0.15):
+    regressions = []
+
+    def check_throughput(name, value, base):
+        if value and base and value < base * (1 - tolerance):
+            regressions.append(f"{name}: {value} itens/s (base {base})")
+
+    def check_latency(name, value, base):
+        if value and base and value > base * (1 + tolerance):
+            regressions.append(f"{name}: {value} ms (base {base})")
+
+    check_throughput("end_to_end.pages_per_sec", current["end_to_end"]["pages_per_sec"], baseline["end_to_end"]["pages_per_sec"])
+    for section in ("isolated", "end_to_end"):
+        current_stages = current[section] if section == "isolated" else current[section]["stages"]
+        baseline_stages = baseline.get(section) if section == "isolated" else baseline[section]["stages"]
+        if not current_stages or not baseline_stages:
+            continue
+        for stage in STAGES:
+            if stage not in current_stages or stage not in baseline_stages:
+                continue
+            check_throughput(f"{section}.{stage}.items_per_sec", current_stages[stage]["items_per_sec"], baseline_stages[stage]["items_per_sec"])
+            check_latency(f"{section}.{stage}.p90_ms", current_stages[stage]["p90_ms"], baseline_stages[stage]["p90_ms"])
+    return regressions
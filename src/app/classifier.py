@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import logging
+import unicodedata
+from collections import namedtuple
+
+import fitz  # PyMuPDF
+
+from . import config
+
+# Pré-classificador barato de páginas: decide, antes da renderização em alta
+# resolução e da chamada de OCR, se a página parece uma guia DARF.
+#  - Com camada de texto nativa: presença das palavras-chave do DARF.
+#  - Sem camada de texto (escaneada): página em branco pela proporção de tinta
+#    na miniatura (pixels mais escuros que o fundo da própria página); caso
+#    contrário, hash perceptual (dHash) do cabeçalho comparado com hashes de
+#    referência de cabeçalhos de DARF conhecidos.
+# Na dúvida a página vai para o OCR: o classificador só descarta o que tem certeza.
+
+Decision = namedtuple('Decision', ['ocr', 'reason'])
+
+DARF_KEYWORDS = [
+    "documento de arrecadacao",
+    "receitas federais",
+    "numero do documento",
+    "valor total do documento",
+    "data de vencimento",
+    "periodo de apuracao",
+]
+
+# Mínimo de caracteres para considerar que a página tem camada de texto
+MIN_TEXT_CHARS = 40
+# Mínimo de palavras-chave encontradas para considerar a página um DARF
+MIN_KEYWORDS = 3
+# Zoom da miniatura para medir a tinta: em 0.1 o texto escaneado some na média dos
+# pixels e uma DARF inteira sai com tinta zero
+INK_ZOOM = 0.25
+# Diferença mínima de brilho em relação ao fundo (percentil 95) para contar como tinta
+INK_CONTRAST = 48
+# Proporção de tinta abaixo da qual a página é considerada em branco. Fica cerca de
+# 10x abaixo da menor DARF escaneada do corpus (0,026): só descarta página vazia.
+MIN_INK_RATIO = 0.002
+# Distância de Hamming máxima (de 64 bits) para o cabeçalho casar com uma referência
+MAX_HASH_DISTANCE = 12
+# Fração superior da página usada como cabeçalho
+HEADER_FRACTION = 0.2
+
+
+def strip_accents(text):
+    return ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c)).lower()
+
+
+def count_keywords(text):
+    text = ' '.join(strip_accents(text).split())
+    return sum(1 for keyword in DARF_KEYWORDS if keyword in text)
+
+
+# Miniatura em tons de cinza da página (ou de um recorte), como lista de linhas de pixels
+def thumbnail(page, zoom, clip=None):
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip, colorspace=fitz.csGRAY, alpha=False)
+    samples = pix.samples
+    return [samples[y * pix.stride:y * pix.stride + pix.width] for y in range(pix.height)]
+
+
+# Proporção de pixels mais escuros que o fundo da página (limiar adaptativo: vale
+# para digitalizações claras, escuras ou com fundo acinzentado)
+def ink_ratio(rows):
+    values = sorted(value for row in rows for value in row)
+    if not values:
+        return 0.0
+    threshold = values[int(len(values) * 0.95)] - INK_CONTRAST
+    return sum(1 for value in values if value < threshold) / len(values)
+
+
+# Redimensiona por média de blocos para width x height
+def downsample(rows, width, height):
+    src_height, src_width = len(rows), len(rows[0])
+    result = []
+    for y in range(height):
+        y0, y1 = y * src_height // height, max((y + 1) * src_height // height, y * src_height // height + 1)
+        row = []
+        for x in range(width):
+            x0, x1 = x * src_width // width, max((x + 1) * src_width // width, x * src_width // width + 1)
+            block = [rows[yy][xx] for yy in range(y0, y1) for xx in range(x0, x1)]
+            row.append(sum(block) / len(block))
+        result.append(row)
+    return result
+
+
+# dHash de 64 bits: compara cada pixel com o vizinho da direita numa grade 9x8
+def dhash(rows):
+    small = downsample(rows, 9, 8)
+    value = 0
+    for row in small:
+        for x in range(8):
+            value = (value << 1) | (1 if row[x] > row[x + 1] else 0)
+    return value
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+def header_hash(page):
+    rect = page.rect
+    header = fitz.Rect(rect.x0, rect.y0, rect.x1, rect.y0 + rect.height * HEADER_FRACTION)
+    return dhash(thumbnail(page, 0.25, clip=header))
+
+
+class PageClassifier:
+    def __init__(self, references=None):
+        self.references = list(references or [])
+
+    @classmethod
+    def load(cls, path=config.CLASSIFIER_REFERENCE_PATH):
+        if not path or not os.path.exists(path):
+            logging.info("Sem hashes de referência de DARF em %s; páginas escaneadas não em branco irão para o OCR.", path)
+            return cls()
+        with open(path, 'r', encoding='utf-8') as reference_file:
+            return cls(int(value, 16) for value in json.load(reference_file)["header_hashes"])
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as reference_file:
+            json.dump({"header_hashes": [f"{value:016x}" for value in self.references]}, reference_file, indent=4)
+
+    def classify(self, page):
+        text = page.get_text()
+        if len(text.strip()) >= MIN_TEXT_CHARS:
+            if count_keywords(text) >= MIN_KEYWORDS:
+                return Decision(True, "text_keywords")
+            return Decision(False, "text_not_darf")
+
+        if ink_ratio(thumbnail(page, INK_ZOOM)) < MIN_INK_RATIO:
+            return Decision(False, "blank")
+
+        if not self.references:
+            return Decision(True, "no_reference")
+        distance = min(hamming(header_hash(page), reference) for reference in self.references)
+        if distance <= MAX_HASH_DISTANCE:
+            return Decision(True, "header_hash")
+        return Decision(False, "header_mismatch")
+
+
+# Função para gerar os hashes de referência a partir de um corpus rotulado
+# (manifest.json com files[].pages[].darf, como o gerado por corpus.py)
+def train(corpus_dir, max_references=64):
+    from .corpus import load_manifest
+
+    references = []
+    for plan in load_manifest(corpus_dir)["files"]:
+        with fitz.open(os.path.join(corpus_dir, plan["name"])) as doc:
+            for page_num, page_plan in enumerate(plan["pages"]):
+                if not page_plan["darf"]:
+                    continue
+                value = header_hash(doc.load_page(page_num))
+                if all(hamming(value, reference) > 2 for reference in references):
+                    references.append(value)
+                if len(references) >= max_references:
+                    return PageClassifier(references)
+    return PageClassifier(references)
+
+
+# Função para medir precisão e recall do classificador em um corpus rotulado.
+# Positivo = página enviada ao OCR; o que importa é não perder nenhum DARF (recall).
+def evaluate(classifier, corpus_dir):
+    from .corpus import load_manifest
+
+    tp = fp = tn = fn = 0
+    reasons = {}
+    elapsed = 0.0
+    for plan in load_manifest(corpus_dir)["files"]:
+        with fitz.open(os.path.join(corpus_dir, plan["name"])) as doc:
+            for page_num, page_plan in enumerate(plan["pages"]):
+                start = time.perf_counter()
+                decision = classifier.classify(doc.load_page(page_num))
+                elapsed += time.perf_counter() - start
+                reasons[decision.reason] = reasons.get(decision.reason, 0) + 1
+                if decision.ocr and page_plan["darf"]:
+                    tp += 1
+                elif decision.ocr:
+                    fp += 1
+                elif page_plan["darf"]:
+                    fn += 1
+                else:
+                    tn += 1
+
+    pages = tp + fp + tn + fn
+    return {
+        "pages": pages,
+        "true_positives": tp,
+        "false_positives": fp,
+        "true_negatives": tn,
+        "false_negatives": fn,
+        "precision": round(tp / (tp + fp), 4) if tp + fp else None,
+        "recall": round(tp / (tp + fn), 4) if tp + fn else None,
+        "skip_rate": round((tn + fn) / pages, 4) if pages else None,
+        "ms_per_page": round(elapsed / pages * 1000, 3) if pages else None,
+        "reasons": reasons,
+    }
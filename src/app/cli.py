@@ -0,0 +1,701 @@
+import sys
+import logging
+import argparse
+import datetime
+
+# Apenas a biblioteca padrão é importada aqui; cada subcomando importa os
+# módulos pesados de que precisa dentro do próprio handler.
+
+
+def cmd_list(args):
+    from .storage import get_source_storage
+
+    source = get_source_storage(args.source_mirror)
+    for folder in source.list_folders(args.carteira):
+        print(f"Folder name: {folder.name}")
+
+
+def cmd_crawl(args):
+    from .crawl import list_fiscal_subfolders
+    from .storage import get_source_storage
+
+    source = get_source_storage(args.source_mirror)
+    plan = compile_crawl_plan(args)
+    for folder in plan.client_folders(source, args.carteira):
+        for subfolder in list_fiscal_subfolders(source, folder.path, plan, folder.name):
+            print(f"{folder.name}/{subfolder}/Fiscal")
+
+
+# Função para compilar o plano da varredura: FOLDERS_ACCESS/FOLDERS_IGNORED de --config,
+# restrito pelo arquivo de --rules e pelas opções --client, --cnpj, --month, --doc-type
+# e --subfolder (uma regra avulsa)
+def compile_crawl_plan(args):
+    from .crawl_rules import compile_plan
+
+    restriction = {field: values for field, values in [
+        ("clients", args.client), ("cnpjs", args.cnpj), ("months", args.month),
+        ("doc_types", args.doc_type), ("subfolders", args.subfolder)] if values}
+    return compile_plan(args.config, args.rules, restriction)
+
+
+# Função para abrir o diário de trabalho quando --journal foi informado
+def open_journal(args):
+    if not args.journal:
+        return None
+    from .journal import Journal
+    return Journal(args.journal)
+
+
+# Função para abrir o armazém de textos quando --text-store foi informado
+def open_text_store(args):
+    if not args.text_store:
+        return None
+    from .textstore import TextStore
+    return TextStore(args.text_store)
+
+
+# Função para abrir a base local das guias quando --guias-db foi informado
+def open_guia_db(args):
+    if not args.guias_db:
+        return None
+    from .guias_db import GuiaDB
+    return GuiaDB(args.guias_db)
+
+
+def cmd_journal(args):
+    import json
+    from .journal import Journal
+
+    journal = Journal(args.path)
+    try:
+        if args.action == "reset":
+            logging.info("%d unidades apagadas do diário.", journal.reset(args.kind, args.state))
+        else:
+            print(json.dumps(journal.status(), ensure_ascii=False, indent=4))
+    finally:
+        journal.close()
+
+
+def cmd_copy(args):
+    from .crawl import copy_carteira
+    from .storage import get_landing_zone_storage, get_source_storage
+
+    source = get_source_storage(args.source_mirror)
+    target = get_landing_zone_storage(args.mirror)
+    dedup = None
+    if not args.no_dedup:
+        from .dedup import DedupIndex
+        dedup = DedupIndex(args.dedup_index)
+    journal = open_journal(args)
+    try:
+        copy_carteira(source, target, args.carteira, args.config, range(args.year_from, args.year_to + 1), dedup, journal,
+                      compile_crawl_plan(args))
+    finally:
+        if dedup is not None:
+            dedup.close()
+        if journal is not None:
+            journal.close()
+
+
+def cmd_ocr(args):
+    from . import ocr
+    from .ocr_engines import get_engine
+    from .storage import get_landing_zone_storage
+
+    engine_options = {"enhance": not args.no_enhance}
+    if args.engine == "tesseract" and args.workers:
+        engine_options["workers"] = args.workers
+    engine = get_engine(args.engine, **engine_options)
+    classifier = None
+    if args.classifier:
+        from .classifier import PageClassifier
+        classifier = PageClassifier.load(args.classifier_references)
+    dedup = None
+    if not args.no_dedup:
+        from .dedup import DedupIndex
+        dedup = DedupIndex(args.dedup_index)
+    journal = open_journal(args)
+    text_store = open_text_store(args)
+    guia_db = open_guia_db(args)
+    try:
+        ocr.run(get_landing_zone_storage(args.mirror), args.folder, file_names=args.file, output_json_path=args.output,
+                engine=engine, classifier=classifier, dedup=dedup, workers=args.processes,
+                early_stop=not args.no_early_stop, cascade=not args.no_cascade, journal=journal,
+                text_store=text_store, guia_db=guia_db)
+    finally:
+        engine.close()
+        if dedup is not None:
+            dedup.close()
+        if journal is not None:
+            journal.close()
+        if text_store is not None:
+            text_store.close()
+        if guia_db is not None:
+            guia_db.close()
+
+
+def cmd_parse(args):
+    from . import text_layer
+    from .storage import get_landing_zone_storage
+
+    journal = open_journal(args)
+    text_store = open_text_store(args)
+    guia_db = open_guia_db(args)
+    try:
+        text_layer.run(get_landing_zone_storage(args.mirror), args.folder, output_filename=args.output, journal=journal,
+                       text_store=text_store, guia_db=guia_db, stream=args.stream, workers=args.workers,
+                       prefetch=args.prefetch)
+    finally:
+        if journal is not None:
+            journal.close()
+        if text_store is not None:
+            text_store.close()
+        if guia_db is not None:
+            guia_db.close()
+
+
+def cmd_reports(args):
+    from . import reports
+    from .storage import get_landing_zone_storage
+
+    reports.run(get_landing_zone_storage(args.mirror), args.folder, output_path=args.output, workers=args.workers)
+
+
+def cmd_load(args):
+    from .load import load_to_bigquery
+
+    journal = open_journal(args)
+    if journal is None:
+        load_to_bigquery(args.input)
+        return
+    # A carga substitui a tabela: com o diário, o mesmo arquivo (mesmo conteúdo) não é carregado de novo
+    from .dedup import sha256_of
+    with open(args.input, 'rb') as input_file:
+        key = f"{args.input}:{sha256_of(input_file)}"
+    try:
+        journal.run("load", key, load_to_bigquery, args.input)
+    finally:
+        journal.close()
+
+
+def cmd_daemon(args):
+    from .daemon import IngestionDaemon
+    from .journal import Journal
+    from .storage import get_landing_zone_storage, get_source_storage
+
+    engine_options = {"enhance": not args.no_enhance}
+    # O diário é obrigatório aqui: é ele que separa as guias novas das já processadas
+    journal = Journal(args.journal)
+    guia_db = open_guia_db(args)
+    try:
+        IngestionDaemon(
+            get_landing_zone_storage(args.mirror),
+            source=None if args.no_crawl else get_source_storage(args.source_mirror),
+            journal=journal, workers=args.processes, engine_name=args.engine, engine_options=engine_options,
+            classifier_path=args.classifier_references if args.classifier else None, mirror=args.mirror,
+            folder_url=args.folder, poll_seconds=args.poll_interval, crawl_seconds=args.crawl_interval,
+            load_seconds=args.load_interval, recent_months=args.recent_months, carteira_url=args.carteira,
+            config_file_path=args.config, load=not args.no_load, guia_db=guia_db,
+        ).run()
+    finally:
+        journal.close()
+        if guia_db is not None:
+            guia_db.close()
+
+
+def cmd_serve(args):
+    from .ocr_engines import get_engine
+    from .service import ExtractionService, serve
+    from .storage import get_landing_zone_storage
+
+    engine = get_engine(args.engine, enhance=not args.no_enhance)
+    classifier = None
+    if args.classifier:
+        from .classifier import PageClassifier
+        classifier = PageClassifier.load(args.classifier_references)
+    dedup = None
+    if not args.no_dedup:
+        from .dedup import DedupIndex
+        dedup = DedupIndex(args.dedup_index)
+    try:
+        serve(ExtractionService(get_landing_zone_storage(args.mirror), engine, classifier, dedup,
+                                early_stop=not args.no_early_stop, cascade=not args.no_cascade),
+              args.host, args.port)
+    finally:
+        engine.close()
+        if dedup is not None:
+            dedup.close()
+
+
+def cmd_shard(args):
+    import json
+    from . import config
+    from .leases import LeaseStore
+
+    store = LeaseStore(args.store, owner=args.owner, ttl=args.ttl)
+    if args.action in ("status", "reset"):
+        try:
+            if args.action == "reset":
+                logging.info("%d shards apagados.", store.reset(args.kind))
+            else:
+                print(json.dumps(store.status(args.kind), ensure_ascii=False, indent=4))
+        finally:
+            store.close()
+        return
+
+    from .storage import get_landing_zone_storage
+
+    target = get_landing_zone_storage(args.mirror)
+    dedup = None
+    if not args.no_dedup:
+        from .dedup import DedupIndex
+        dedup = DedupIndex(args.dedup_index)
+    journal = open_journal(args)
+    try:
+        if args.action == "copy":
+            from .leases import copy_sharded
+            from .storage import get_source_storage
+            copy_sharded(store, get_source_storage(args.source_mirror), target, args.carteira or [config.CARTEIRA_URL],
+                         args.config, range(args.year_from, args.year_to + 1), dedup, journal)
+        else:
+            from .leases import ocr_sharded
+            from .ocr_engines import get_engine
+            engine = get_engine(args.engine)
+            classifier = None
+            if args.classifier:
+                from .classifier import PageClassifier
+                classifier = PageClassifier.load(args.classifier_references)
+            try:
+                ocr_sharded(store, target, args.folder, args.shards, args.output, engine=engine, classifier=classifier,
+                            dedup=dedup, workers=args.processes, journal=journal)
+            finally:
+                engine.close()
+    finally:
+        store.close()
+        if dedup is not None:
+            dedup.close()
+        if journal is not None:
+            journal.close()
+
+
+def cmd_text(args):
+    import json
+    from .textstore import TextStore, collect_refs, reparse
+
+    store = TextStore(args.store)
+    try:
+        if args.action == "stats":
+            print(json.dumps(store.stats(), indent=4))
+        elif args.action == "get":
+            for ref in args.ref:
+                print(store.get_text(ref))
+        elif args.action == "compact":
+            store.compact(collect_refs(args.keep) if args.keep else None)
+            print(json.dumps(store.stats(), indent=4))
+        else:
+            reparse(store, args.input, args.output)
+    finally:
+        store.close()
+
+
+def cmd_guias(args):
+    import json
+    from . import config
+    from .guias_db import GuiaDB
+
+    db = GuiaDB(args.db)
+    try:
+        if args.action == "ingest":
+            db.ingest(args.input or [f"{config.OUTPUT_DIR}/consolidated_data.json"])
+            return
+        if args.action == "due":
+            rows = db.due(args.cnpj, args.start, args.end)
+        elif args.action == "totals":
+            rows = db.totals(args.tributo, args.year, args.periodo, args.cnpj)
+        else:
+            rows = db.find(args.cnpj, args.periodo, args.codigo, args.documento)
+        for row in rows:
+            print(json.dumps(row, ensure_ascii=False))
+    finally:
+        db.close()
+
+
+def cmd_dedup(args):
+    from .dedup import DedupIndex
+
+    dedup = DedupIndex(args.dedup_index)
+    try:
+        dedup.write_report(args.output)
+    finally:
+        dedup.close()
+
+
+def cmd_classify(args):
+    import json
+    from .classifier import PageClassifier, evaluate, train
+
+    if args.action == "train":
+        classifier = train(args.corpus)
+        classifier.save(args.references)
+        logging.info("%d hashes de referência salvos em %s", len(classifier.references), args.references)
+    else:
+        print(json.dumps(evaluate(PageClassifier.load(args.references), args.corpus), ensure_ascii=False, indent=4))
+
+
+def cmd_sped(args):
+    import os
+    import sys
+    import json
+    from .sped import fetch_sped, iter_registers
+
+    path = args.path
+    if not os.path.exists(path):
+        from .storage import get_landing_zone_storage
+        path = fetch_sped(get_landing_zone_storage(args.mirror), path)
+
+    if args.action == "index":
+        from .sped_index import get_index
+        get_index(path)
+        return
+    if args.action == "query":
+        from .sped_index import query
+        registers = query(path, args.register, args.cnpj)
+    else:
+        registers = iter_registers(path, args.register, workers=args.workers)
+
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        for register in registers:
+            output.write(json.dumps({"offset": register.offset, **register.fields}, ensure_ascii=False, default=str) + '\n')
+    finally:
+        if args.output:
+            output.close()
+
+
+def cmd_reconcile(args):
+    import os
+    from . import config, reconcile
+    from .storage import get_landing_zone_storage
+
+    darf_paths = args.darf or [os.path.join(config.OUTPUT_DIR, "consolidated_data.json")]
+    reconcile.run(get_landing_zone_storage(args.mirror), darf_paths, args.sped_folder, args.tolerance, args.output)
+
+
+def cmd_corpus(args):
+    from .corpus import generate_corpus
+
+    generate_corpus(args.output, files=args.files, seed=args.seed)
+
+
+def cmd_bench(args):
+    import os
+    import json
+    from .bench import compare_reports, run_benchmark
+    from .corpus import MANIFEST_NAME, generate_corpus
+
+    if not os.path.exists(os.path.join(args.corpus, MANIFEST_NAME)):
+        generate_corpus(args.corpus, files=args.files, seed=args.seed)
+
+    engine = None
+    if args.engine != "stub":
+        from .ocr_engines import get_engine
+        engine = get_engine(args.engine)
+    report = run_benchmark(args.corpus, ocr_latency=args.ocr_latency, isolated=not args.no_isolated, engine=engine)
+    output = json.dumps(report, ensure_ascii=False, indent=4)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as report_file:
+            report_file.write(output)
+        logging.info("Relatório do benchmark salvo em %s", args.output)
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as baseline_file:
+            regressions = compare_reports(report, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            logging.error("Regressão: %s", regression)
+        if regressions:
+            return 1
+
+
+# Opções de restrição da varredura (compiladas por compile_crawl_plan)
+def add_crawl_rule_arguments(p):
+    p.add_argument("--rules", default=None, metavar="ARQUIVO", help="arquivo JSON com regras de inclusão/exclusão (crawl_rules)")
+    p.add_argument("--client", action="append", metavar="NOME", help="só esta pasta de cliente (nome exato ou glob); pode repetir")
+    p.add_argument("--cnpj", action="append", help="só clientes com este CNPJ (ou raiz) no nome da pasta; pode repetir")
+    p.add_argument("--month", action="append", metavar="AAAA-MM[:AAAA-MM]",
+                   help="só este mês ou intervalo (no lugar de --year-from/--year-to); pode repetir")
+    p.add_argument("--doc-type", action="append", choices=["sped", "relatorios", "guias"], help="só este tipo de documento; pode repetir")
+    p.add_argument("--subfolder", action="append", metavar="NOME",
+                   help="só esta subpasta do cliente (nome exato dispensa a busca da pasta Fiscal); pode repetir")
+
+
+# Função para montar o parser de argumentos com todos os subcomandos
+def build_parser():
+    from . import config
+
+    parser = argparse.ArgumentParser(prog="app", description="Extração de guias federais e arquivos SPED do SharePoint.")
+    parser.add_argument("-v", "--verbose", action="store_true", help="habilita logs de depuração")
+    parser.add_argument("--log-json", action="store_true", help="logs em JSON lines (com execução, arquivo e página)")
+    parser.add_argument("--log-file", default=None, help="grava os logs também neste arquivo")
+    parser.add_argument("--log-sample", type=int, default=20, metavar="N",
+                        help="máximo de mensagens iguais por item a cada 10s (0 = sem amostragem)")
+    parser.add_argument("--mirror", default=None, help="diretório local com o espelho da landing zone (no lugar do SharePoint)")
+    parser.add_argument("--source-mirror", default=None, help="diretório local com o espelho da pasta Arquivos (no lugar do SharePoint)")
+    parser.add_argument("--metrics-dir", default=config.OUTPUT_DIR, help="onde gravar metrics.json e metrics.prom ao fim da execução")
+    parser.add_argument("--profile", action="append", default=[], metavar="ETAPA",
+                        help="perfila a etapa (crawl, copy, download, render, enhance, ocr, parse ou all); pode repetir")
+    parser.add_argument("--profiler", choices=["pyinstrument", "cprofile"], default="pyinstrument")
+    parser.add_argument("--record", default=None, metavar="CASSETE", help="grava as chamadas HTTP (SharePoint e Vision) neste cassete")
+    parser.add_argument("--replay", default=None, metavar="CASSETE", help="responde as chamadas HTTP a partir deste cassete, sem rede")
+    parser.add_argument("--replay-latency", type=float, default=0.0, help="latência fixa somada a cada resposta reproduzida (segundos)")
+    parser.add_argument("--replay-latency-scale", type=float, default=0.0, help="fração da latência gravada aplicada na reprodução (1.0 = tempos reais)")
+    parser.add_argument("--replay-error-rate", type=float, default=0.0, help="fração das respostas trocada por HTTP 503")
+    parser.add_argument("--replay-timeout-rate", type=float, default=0.0, help="fração das chamadas que falham com timeout")
+    parser.add_argument("--replay-seed", type=int, default=0)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p = subparsers.add_parser("list", help="lista as pastas de clientes da carteira")
+    p.add_argument("--carteira", default=config.CARTEIRA_URL)
+    p.set_defaults(func=cmd_list)
+
+    p = subparsers.add_parser("crawl", help="lista as pastas Fiscal dos clientes liberados")
+    p.add_argument("--carteira", default=config.CARTEIRA_URL)
+    p.add_argument("--config", default=config.CONFIG_FILE_PATH)
+    add_crawl_rule_arguments(p)
+    p.set_defaults(func=cmd_crawl)
+
+    p = subparsers.add_parser("copy", help="copia SPED, relatórios e guias para a landing zone")
+    p.add_argument("--carteira", default=config.CARTEIRA_URL)
+    p.add_argument("--config", default=config.CONFIG_FILE_PATH)
+    p.add_argument("--year-from", type=int, default=2024)
+    p.add_argument("--year-to", type=int, default=2024)
+    add_crawl_rule_arguments(p)
+    p.add_argument("--no-dedup", action="store_true", help="copia mesmo os arquivos com conteúdo já copiado")
+    p.add_argument("--dedup-index", default=config.DEDUP_INDEX_PATH)
+    p.add_argument("--journal", nargs="?", const=config.JOURNAL_PATH, default=None,
+                   help="grava cada unidade no diário de trabalho e retoma a execução interrompida")
+    p.set_defaults(func=cmd_copy)
+
+    p = subparsers.add_parser("ocr", help="extrai as guias da landing zone via OCR (Google Vision)")
+    p.add_argument("--folder", default=config.GUIAS_FOLDER_URL)
+    p.add_argument("--file", action="append", help="processa apenas este arquivo (pode repetir)")
+    p.add_argument("--engine", choices=["vision", "tesseract"], default=None, help="motor de OCR (padrão: OCR_ENGINE do .env ou vision)")
+    p.add_argument("--workers", type=int, default=None, help="páginas em paralelo no motor local")
+    p.add_argument("--processes", type=int, default=1, help="processos para o OCR por página (1 = sequencial)")
+    p.add_argument("--no-enhance", action="store_true", help="envia a página renderizada sem o pré-processamento do cv2")
+    p.add_argument("--classifier", action="store_true",
+                   help="descarta antes do OCR as páginas que o pré-classificador garante não serem DARF (confira antes com classify eval)")
+    p.add_argument("--no-cascade", action="store_true", help="sempre OCR em alta resolução com realce, sem tentar os níveis baratos antes")
+    p.add_argument("--no-early-stop", action="store_true", help="processa todas as páginas mesmo de arquivos com uma guia só")
+    p.add_argument("--classifier-references", default=config.CLASSIFIER_REFERENCE_PATH)
+    p.add_argument("--no-dedup", action="store_true", help="não reaproveita o texto de páginas já processadas")
+    p.add_argument("--dedup-index", default=config.DEDUP_INDEX_PATH)
+    p.add_argument("--output", default=None)
+    p.add_argument("--journal", nargs="?", const=config.JOURNAL_PATH, default=None,
+                   help="grava cada unidade no diário de trabalho e retoma a execução interrompida")
+    p.add_argument("--text-store", nargs="?", const=config.TEXT_STORE_DIR, default=None,
+                   help="guarda o texto bruto de cada página no armazém comprimido e só a referência no JSON")
+    p.add_argument("--guias-db", nargs="?", const=config.GUIAS_DB_PATH, default=None,
+                   help="grava os registros extraídos na base local de consultas")
+    p.set_defaults(func=cmd_ocr)
+
+    p = subparsers.add_parser("parse", help="extrai as guias da landing zone pela camada de texto do PDF")
+    p.add_argument("--folder", default=config.GUIAS_FOLDER_URL)
+    p.add_argument("--output", default=None)
+    p.add_argument("--journal", nargs="?", const=config.JOURNAL_PATH, default=None,
+                   help="grava cada unidade no diário de trabalho e retoma a execução interrompida")
+    p.add_argument("--text-store", nargs="?", const=config.TEXT_STORE_DIR, default=None,
+                   help="guarda o conteúdo do PDF no armazém comprimido e só a referência no JSON")
+    p.add_argument("--guias-db", nargs="?", const=config.GUIAS_DB_PATH, default=None,
+                   help="grava os registros extraídos na base local de consultas")
+    p.add_argument("--stream", action="store_true", help="baixa os PDFs em paralelo, em memória, e lê a camada de texto em vários processos")
+    p.add_argument("--workers", type=int, default=None, help="--stream: processos de leitura (padrão: núcleos da máquina)")
+    p.add_argument("--prefetch", type=int, default=8, help="--stream: downloads simultâneos à frente da leitura")
+    p.set_defaults(func=cmd_parse)
+
+    p = subparsers.add_parser("reports", help="extrai as tabelas de contas recebidas dos relatórios de Composição")
+    p.add_argument("--folder", default=config.RELATORIOS_FOLDER_URL)
+    p.add_argument("--workers", type=int, default=None, help="processos para as páginas (padrão: núcleos da máquina)")
+    p.add_argument("--output", default=None)
+    p.set_defaults(func=cmd_reports)
+
+    p = subparsers.add_parser("load", help="carrega o JSON consolidado no BigQuery")
+    p.add_argument("--input", default=f"{config.OUTPUT_DIR}/consolidated_data.json")
+    p.add_argument("--journal", nargs="?", const=config.JOURNAL_PATH, default=None,
+                   help="grava cada unidade no diário de trabalho e retoma a execução interrompida")
+    p.set_defaults(func=cmd_load)
+
+    p = subparsers.add_parser("daemon", help="serviço contínuo: copia, extrai e carrega as guias novas assim que chegam")
+    p.add_argument("--folder", default=config.GUIAS_FOLDER_URL)
+    p.add_argument("--carteira", default=config.CARTEIRA_URL)
+    p.add_argument("--config", default=config.CONFIG_FILE_PATH)
+    p.add_argument("--engine", choices=["vision", "tesseract"], default=None, help="motor de OCR (padrão: OCR_ENGINE do .env ou vision)")
+    p.add_argument("--processes", type=int, default=2, help="processos aquecidos para o OCR das guias")
+    p.add_argument("--no-enhance", action="store_true", help="envia a página renderizada sem o pré-processamento do cv2")
+    p.add_argument("--classifier", action="store_true",
+                   help="descarta antes do OCR as páginas que o pré-classificador garante não serem DARF (confira antes com classify eval)")
+    p.add_argument("--classifier-references", default=config.CLASSIFIER_REFERENCE_PATH)
+    p.add_argument("--poll-interval", type=int, default=60, help="segundos entre as varreduras da landing zone")
+    p.add_argument("--crawl-interval", type=int, default=900, help="segundos entre as varreduras da carteira")
+    p.add_argument("--load-interval", type=int, default=60, help="segundos entre as cargas no BigQuery")
+    p.add_argument("--recent-months", type=int, default=2, help="meses varridos na carteira (o atual e os anteriores)")
+    p.add_argument("--no-crawl", action="store_true", help="só acompanha a landing zone, sem copiar da carteira")
+    p.add_argument("--no-load", action="store_true", help="não carrega no BigQuery")
+    p.add_argument("--journal", default=config.JOURNAL_PATH)
+    p.add_argument("--guias-db", nargs="?", const=config.GUIAS_DB_PATH, default=None,
+                   help="grava os registros extraídos na base local de consultas")
+    p.set_defaults(func=cmd_daemon)
+
+    p = subparsers.add_parser("serve", help="serviço HTTP residente que extrai uma guia por requisição")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--engine", choices=["vision", "tesseract"], default=None, help="motor de OCR (padrão: OCR_ENGINE do .env ou vision)")
+    p.add_argument("--no-enhance", action="store_true", help="envia a página renderizada sem o pré-processamento do cv2")
+    p.add_argument("--classifier", action="store_true",
+                   help="descarta antes do OCR as páginas que o pré-classificador garante não serem DARF (confira antes com classify eval)")
+    p.add_argument("--no-cascade", action="store_true", help="sempre OCR em alta resolução com realce, sem tentar os níveis baratos antes")
+    p.add_argument("--no-early-stop", action="store_true", help="processa todas as páginas mesmo de arquivos com uma guia só")
+    p.add_argument("--classifier-references", default=config.CLASSIFIER_REFERENCE_PATH)
+    p.add_argument("--no-dedup", action="store_true", help="não reaproveita o texto de páginas já processadas")
+    p.add_argument("--dedup-index", default=config.DEDUP_INDEX_PATH)
+    p.set_defaults(func=cmd_serve)
+
+    p = subparsers.add_parser("shard", help="divide a cópia ou o OCR entre vários processos/máquinas com leases em um banco compartilhado")
+    p.add_argument("action", choices=["copy", "ocr", "status", "reset"])
+    p.add_argument("--store", default=config.LEASES_PATH, help="banco SQLite dos leases (em pasta compartilhada entre as máquinas)")
+    p.add_argument("--owner", default=None, help="identificação deste processo (padrão: máquina:pid)")
+    p.add_argument("--ttl", type=float, default=120, help="duração do lease em segundos; um processo parado perde o shard depois disso")
+    p.add_argument("--carteira", action="append", help="carteira a copiar (pode repetir; padrão: a carteira do config)")
+    p.add_argument("--config", default=config.CONFIG_FILE_PATH)
+    p.add_argument("--year-from", type=int, default=2024)
+    p.add_argument("--year-to", type=int, default=2024)
+    p.add_argument("--folder", default=config.GUIAS_FOLDER_URL)
+    p.add_argument("--shards", type=int, default=8, help="grupos de arquivos (pelo hash do nome) no OCR")
+    p.add_argument("--engine", choices=["vision", "tesseract"], default=None, help="motor de OCR (padrão: OCR_ENGINE do .env ou vision)")
+    p.add_argument("--processes", type=int, default=1, help="processos para o OCR por página dentro de cada shard")
+    p.add_argument("--classifier", action="store_true",
+                   help="descarta antes do OCR as páginas que o pré-classificador garante não serem DARF (confira antes com classify eval)")
+    p.add_argument("--classifier-references", default=config.CLASSIFIER_REFERENCE_PATH)
+    p.add_argument("--no-dedup", action="store_true", help="não usa o índice de duplicatas")
+    p.add_argument("--dedup-index", default=config.DEDUP_INDEX_PATH)
+    p.add_argument("--output", default=None, help="JSON consolidado dos shards de OCR")
+    p.add_argument("--kind", choices=["copy", "ocr"], default=None, help="status/reset: só os shards deste tipo")
+    p.add_argument("--journal", nargs="?", const=config.JOURNAL_PATH, default=None,
+                   help="grava cada unidade no diário de trabalho e retoma a execução interrompida")
+    p.set_defaults(func=cmd_shard)
+
+    p = subparsers.add_parser("text", help="armazém dos textos brutos extraídos: estatísticas, leitura, compactação e novo parse")
+    p.add_argument("action", choices=["stats", "get", "compact", "reparse"])
+    p.add_argument("ref", nargs="*", help="get: referências sha256:... a imprimir")
+    p.add_argument("--store", default=config.TEXT_STORE_DIR)
+    p.add_argument("--keep", action="append", help="compact: JSON de saída cujas referências são mantidas (pode repetir; sem ele nada é descartado)")
+    p.add_argument("--input", default=f"{config.OUTPUT_DIR}/consolidated_data.json", help="reparse: JSON com as referências")
+    p.add_argument("--output", default=f"{config.OUTPUT_DIR}/reparsed_data.json", help="reparse: JSON com os registros refeitos")
+    p.set_defaults(func=cmd_text)
+
+    p = subparsers.add_parser("guias", help="consultas na base local das guias extraídas (sem ir ao BigQuery)")
+    p.add_argument("action", choices=["ingest", "due", "totals", "find"],
+                   help="ingest: carrega JSONs do ocr/parse; due: vencimentos; totals: total por cliente e tributo; find: busca")
+    p.add_argument("--db", default=config.GUIAS_DB_PATH)
+    p.add_argument("--input", action="append", help="ingest: JSON do ocr ou do parse (pode repetir)")
+    p.add_argument("--cnpj", default=None)
+    p.add_argument("--start", type=datetime.date.fromisoformat, default=None, help="due: início (AAAA-MM-DD; padrão: segunda-feira desta semana)")
+    p.add_argument("--end", type=datetime.date.fromisoformat, default=None, help="due: fim (AAAA-MM-DD; padrão: domingo desta semana)")
+    p.add_argument("--tributo", choices=["PIS", "COFINS", "IRPJ", "CSLL", "IRRF"], default=None)
+    p.add_argument("--year", type=int, default=None)
+    p.add_argument("--periodo", default=None, help="período de apuração AAAA-MM")
+    p.add_argument("--codigo", default=None, help="find: código de receita")
+    p.add_argument("--documento", default=None, help="find: número do documento")
+    p.set_defaults(func=cmd_guias)
+
+    p = subparsers.add_parser("journal", help="mostra ou limpa o diário de trabalho das execuções")
+    p.add_argument("action", choices=["status", "reset"])
+    p.add_argument("--path", default=config.JOURNAL_PATH)
+    p.add_argument("--kind", choices=["crawl", "copy", "ocr_file", "ocr_page", "parse", "load", "ingest"], default=None)
+    p.add_argument("--state", choices=["done", "failed", "running"], default=None, help="reset: só as unidades neste estado")
+    p.set_defaults(func=cmd_journal)
+
+    p = subparsers.add_parser("dedup", help="gera o relatório de arquivos e páginas duplicados")
+    p.add_argument("--dedup-index", default=config.DEDUP_INDEX_PATH)
+    p.add_argument("--output", default=f"{config.OUTPUT_DIR}/duplicates.json")
+    p.set_defaults(func=cmd_dedup)
+
+    p = subparsers.add_parser("classify", help="treina ou avalia o pré-classificador de páginas em um corpus rotulado")
+    p.add_argument("action", choices=["train", "eval"])
+    p.add_argument("--corpus", default="data/bench/corpus", help="diretório com os PDFs e o manifest.json com os rótulos")
+    p.add_argument("--references", default=config.CLASSIFIER_REFERENCE_PATH)
+    p.set_defaults(func=cmd_classify)
+
+    p = subparsers.add_parser("sped", help="lê um arquivo SPED EFD-Contribuições e gera os registros em JSON lines")
+    p.add_argument("action", choices=["parse", "index", "query"], help="parse: lê o arquivo inteiro; index: monta o índice; query: consulta pelo índice")
+    p.add_argument("path", help="arquivo local ou caminho na landing zone")
+    p.add_argument("--register", action="append", help="tipo de registro a extrair, ex.: M200 (pode repetir)")
+    p.add_argument("--cnpj", default=None, help="só os registros do estabelecimento (query)")
+    p.add_argument("--workers", type=int, default=1, help="processos para ler os blocos do arquivo (parse)")
+    p.add_argument("--output", default=None, help="arquivo JSON lines (padrão: saída padrão)")
+    p.set_defaults(func=cmd_sped)
+
+    p = subparsers.add_parser("reconcile", help="concilia os DARFs extraídos com os totais declarados nos SPEDs")
+    p.add_argument("--darf", action="append", help="JSON do ocr ou do parse (padrão: consolidated_data.json; pode repetir)")
+    p.add_argument("--sped-folder", default=config.SPED_FOLDER_URL)
+    p.add_argument("--tolerance", type=float, default=0.01, help="diferença máxima em reais para considerar conciliado")
+    p.add_argument("--output", default=None)
+    p.set_defaults(func=cmd_reconcile)
+
+    p = subparsers.add_parser("corpus", help="gera um corpus sintético de DARFs para benchmark")
+    p.add_argument("--output", default="data/bench/corpus")
+    p.add_argument("--files", type=int, default=24)
+    p.add_argument("--seed", type=int, default=2024)
+    p.set_defaults(func=cmd_corpus)
+
+    p = subparsers.add_parser("bench", help="mede o pipeline sobre o corpus sintético e gera um relatório JSON")
+    p.add_argument("--corpus", default="data/bench/corpus", help="gerado automaticamente se não existir")
+    p.add_argument("--files", type=int, default=24)
+    p.add_argument("--seed", type=int, default=2024)
+    p.add_argument("--engine", choices=["stub", "tesseract", "vision"], default="stub", help="motor de OCR medido (padrão: stub local)")
+    p.add_argument("--ocr-latency", type=float, default=0.0, help="latência simulada por chamada do stub de OCR (segundos)")
+    p.add_argument("--no-isolated", action="store_true", help="mede apenas o fluxo completo")
+    p.add_argument("--output", default=None, help="arquivo do relatório (padrão: stdout)")
+    p.add_argument("--baseline", default=None, help="relatório anterior para detectar regressões")
+    p.add_argument("--tolerance", type=float, default=0.15)
+    p.set_defaults(func=cmd_bench)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    from . import logs
+    logs.setup(logging.DEBUG if args.verbose else logging.INFO, json_format=args.log_json, log_file=args.log_file,
+               sample_burst=args.log_sample)
+
+    from . import metrics
+    from .sharepoint import AuthenticationError
+
+    if args.profile:
+        stages = metrics.STAGES if "all" in args.profile else args.profile
+        metrics.enable_profiling(stages, args.profiler, f"{args.metrics_dir}/profiles")
+    if args.record and args.replay:
+        logging.error("Use --record ou --replay, não os dois.")
+        return 2
+    if args.record or args.replay:
+        from . import replay
+        if args.record:
+            replay.start_recording(args.record)
+        else:
+            replay.start_replay(args.replay, args.replay_latency, args.replay_latency_scale,
+                                args.replay_error_rate, args.replay_timeout_rate, args.replay_seed)
+    try:
+        return args.func(args) or 0
+    except AuthenticationError as e:
+        logging.error(str(e))
+        return 1
+    finally:
+        if args.record or args.replay:
+            replay.stop()
+        metrics.write_reports(args.metrics_dir, args.command)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
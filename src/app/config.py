@@ -0,0 +1,71 @@
+import os
+
+# Arquivo de variáveis de ambiente
+ENV_PATH = 'envs/.env'
+
+# URLs base do SharePoint
+SITE_URL = "https://planningassessoriaetributos-my.sharepoint.com/personal/arquivo_planning_com_br"
+LANDING_ZONE_URL = "https://planningassessoriaetributos-my.sharepoint.com/personal/erick_bryan_planning_com_br"
+
+# Caminhos relativos do SharePoint
+SITE_ROOT = '/personal/arquivo_planning_com_br/Documents/Arquivos'
+CARTEIRA_URL = f"{SITE_ROOT}/Carteiras 2023/Carteira Eduardo"
+LANDING_ZONE_ROOT = '/personal/erick_bryan_planning_com_br/Documents/landing_zone'
+SPED_FOLDER_URL = f"{LANDING_ZONE_ROOT}/SpedContribuicoes"
+RELATORIOS_FOLDER_URL = f"{LANDING_ZONE_ROOT}/RelatoriosContasRecebidas"
+GUIAS_FOLDER_URL = f"{LANDING_ZONE_ROOT}/GuiasImpostos"
+
+# Caminho do arquivo JSON de configuração das pastas
+CONFIG_FILE_PATH = 'configs/folders_test.json'
+
+# Hashes de referência do cabeçalho do DARF usados pelo pré-classificador de páginas
+CLASSIFIER_REFERENCE_PATH = 'configs/darf_header_hashes.json'
+
+# Índice de duplicatas (hash dos arquivos e das páginas já processadas)
+DEDUP_INDEX_PATH = 'data/output/dedup.sqlite'
+JOURNAL_PATH = 'data/output/journal.sqlite'
+# Leases dos shards de uma execução dividida entre processos/máquinas (pasta compartilhada)
+LEASES_PATH = 'data/output/leases.sqlite'
+# Base local das guias extraídas para consultas operacionais
+GUIAS_DB_PATH = 'data/output/guias.sqlite'
+
+# Diretórios de armazenamento
+PDF_DIR = 'data/files'
+IMAGES_DIR = 'data/images'
+OUTPUT_DIR = 'data/output'
+SPED_DIR = 'data/sped'
+# Armazém comprimido dos textos brutos extraídos (endereçado pelo hash)
+TEXT_STORE_DIR = 'data/output/texts'
+
+# Configurações do BigQuery
+BIGQUERY_PROJECT_ID = "bi-planning-367317"
+BIGQUERY_DATASET_ID = "BI_AUDITORIA_SPED"
+BIGQUERY_TABLE_ID = "bi_guias_impostos_federais"
+BIGQUERY_CREDENTIALS_PATH = "keys/bi-planning.json"
+
+_env_loaded = False
+
+
+# Função para carregar o .env apenas uma vez, no primeiro acesso
+def load_env():
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv(ENV_PATH)
+        _env_loaded = True
+
+
+# Função para ler uma variável de ambiente (carrega o .env sob demanda)
+def get_env(name, default=None):
+    load_env()
+    return os.getenv(name, default)
+
+
+# Função para carregar o arquivo JSON de configuração das pastas
+def load_folders_config(config_file_path=CONFIG_FILE_PATH):
+    import json
+    with open(config_file_path, 'r') as config_file:
+        config = json.load(config_file)
+    folders_access = {folder['Folder name'] for folder in config['FOLDERS_ACCESS']}
+    folders_ignored = {folder['Folder name'] for folder in config['FOLDERS_IGNORED']}
+    return folders_access, folders_ignored
@@ -0,0 +1,155 @@
+import os
+import json
+import random
+import logging
+import calendar
+
+from .parser import CODIGOS_DENOMINACAO
+
+# Gerador de um corpus sintético de DARFs para benchmark, sem dados de clientes.
+# Cada PDF é gravado junto de um manifest.json com o texto esperado de cada página,
+# usado pelo OCR local de referência (stub) no lugar do Google Vision.
+
+MANIFEST_NAME = "manifest.json"
+
+EMPRESAS = [
+    "Jardim Imperial Empreendimentos Imobiliarios Ltda",
+    "Loteamento Alto do Cruzeiro SPE Ltda",
+    "Residencial Bela Vista Incorporadora Ltda",
+    "Parque das Flores Urbanismo Ltda",
+    "Vale Verde Loteadora e Construtora Ltda",
+    "Recanto dos Ipes Empreendimentos Ltda",
+]
+
+IMPOSTOS = {"8109": "PIS", "2172": "COFINS", "2372": "CSLL", "2089": "IRPJ", "1708": "IRRF"}
+
+INSTRUCOES = (
+    "Instruções para pagamento\n"
+    "Este documento deve ser pago em qualquer agência bancária autorizada.\n"
+    "Após o vencimento, recalcule o valor no Sicalc Web.\n"
+    "Guarde o comprovante de pagamento pelo prazo legal."
+)
+
+# Variantes geradas: camada de texto nativa ou página escaneada (somente imagem)
+VARIANTS = ["text", "scanned"]
+# Layouts: uma guia, uma guia com páginas extras (instruções/branco) e vários lotes
+LAYOUTS = ["single", "padded", "lots"]
+
+
+def random_cnpj(rng):
+    return f"{rng.randint(10, 99)}.{rng.randint(100, 999)}.{rng.randint(100, 999)}/0001-{rng.randint(10, 99)}"
+
+
+def format_valor(valor):
+    inteiro, centavos = f"{valor:.2f}".split('.')
+    return f"{int(inteiro):,}".replace(',', '.') + f",{centavos}"
+
+
+# Função para gerar o texto de uma guia no mesmo formato devolvido pelo Vision
+def make_darf_text(rng, empresa, cnpj, codigo, month, year):
+    last_day = calendar.monthrange(year, month)[1]
+    next_month, next_year = (1, year + 1) if month == 12 else (month + 1, year)
+    apuracao = f"{last_day:02d}/{month:02d}/{year}"
+    vencimento = f"25/{next_month:02d}/{next_year}"
+    numero = f"07.{rng.randint(10, 99)}.{rng.randint(10000, 99999)}.{rng.randint(1000000, 9999999)}-{rng.randint(0, 9)}"
+    valor = format_valor(rng.uniform(50, 250000))
+
+    lines = [
+        "Receita Federal",
+        "Documento de Arrecadação",
+        "de Receitas Federais",
+        empresa,
+        "CNPJ",
+        cnpj,
+        "Periodo de Apuração",
+        apuracao,
+        "Data de Vencimento",
+        vencimento,
+        "Número do Documento",
+        numero,
+        "Valor Total do Documento",
+        valor,
+        "Composição do Documento de Arrecadação",
+        "Código Denominação",
+        f"{codigo} {CODIGOS_DENOMINACAO[codigo]}",
+        "Observações",
+        "Darf emitido pelo Sicalc Web Versão 2.14",
+    ]
+    return '\n'.join(lines)
+
+
+# Função para montar o plano de páginas de um arquivo (texto e se é uma guia)
+def make_file_plan(rng, index, variant, layout):
+    empresa = rng.choice(EMPRESAS)
+    cnpj = random_cnpj(rng)
+    codigo = rng.choice(list(IMPOSTOS))
+    month = rng.randint(1, 12)
+    year = 2024
+
+    if layout == "lots":
+        lots = rng.randint(2, 18)
+        pages = [{"text": make_darf_text(rng, empresa, cnpj, codigo, month, year), "darf": True} for _ in range(lots)]
+        suffix = f" ({lots} lotes)"
+    else:
+        pages = [{"text": make_darf_text(rng, empresa, cnpj, codigo, month, year), "darf": True}]
+        suffix = ""
+        if layout == "padded":
+            pages.append({"text": INSTRUCOES, "darf": False})
+            pages.extend({"text": "", "darf": False} for _ in range(rng.randint(0, 2)))
+
+    name = f"{index:04d} {empresa.split(' Ltda')[0]} - Darf de {IMPOSTOS[codigo]} {month:02d}.{year}{suffix}.pdf"
+    return {"name": name, "variant": variant, "layout": layout, "pages": pages}
+
+
+# Função para gravar o PDF de um plano de arquivo
+def write_pdf(plan, path, dpi=150):
+    import fitz  # PyMuPDF
+
+    doc = fitz.open()
+    for page_plan in plan["pages"]:
+        text_doc = fitz.open()
+        text_page = text_doc.new_page(width=595, height=842)
+        y = 60
+        for line in page_plan["text"].split('\n'):
+            if line:
+                text_page.insert_text((50, y), line, fontsize=11)
+            y += 18
+
+        if plan["variant"] == "scanned":
+            # Página escaneada: apenas a imagem, sem camada de texto
+            pix = text_page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+            page = doc.new_page(width=595, height=842)
+            page.insert_image(page.rect, pixmap=pix)
+        else:
+            doc.insert_pdf(text_doc)
+        text_doc.close()
+
+    doc.save(path, garbage=3, deflate=True)
+    doc.close()
+
+
+# Função para gerar o corpus completo em um diretório
+def generate_corpus(output_dir, files=24, seed=2024):
+    rng = random.Random(seed)
+    os.makedirs(output_dir, exist_ok=True)
+
+    manifest = {"seed": seed, "files": []}
+    for index in range(files):
+        variant = VARIANTS[index % len(VARIANTS)]
+        layout = LAYOUTS[(index // len(VARIANTS)) % len(LAYOUTS)]
+        plan = make_file_plan(rng, index, variant, layout)
+        write_pdf(plan, os.path.join(output_dir, plan["name"]))
+        manifest["files"].append(plan)
+
+    with open(os.path.join(output_dir, MANIFEST_NAME), 'w', encoding='utf-8') as manifest_file:
+        json.dump(manifest, manifest_file, ensure_ascii=False, indent=4)
+
+    pages = sum(len(plan["pages"]) for plan in manifest["files"])
+    logging.info("Corpus sintético gerado em %s: %d arquivos, %d páginas.", output_dir, files, pages)
+    return manifest
+
+
+# Função para carregar o manifest de um corpus já gerado
+def load_manifest(corpus_dir):
+    with open(os.path.join(corpus_dir, MANIFEST_NAME), 'r', encoding='utf-8') as manifest_file:
+        return json.load(manifest_file)
@@ -0,0 +1,165 @@
+import logging
+
+from . import config, logs, metrics
+
+# Tipos de documento copiados de cada pasta de mês
+DOC_TYPES = ("sped", "relatorios", "guias")
+
+
+# Função para procurar e copiar arquivos (SPED e/ou relatórios, conforme `doc_types`)
+def search_and_copy_files(source, folder_url, target, target_folder_sped, target_folder_relatorios, month_year, dedup=None, journal=None,
+                          doc_types=("sped", "relatorios")):
+    logging.info("Procurando arquivos em: %s", folder_url)
+    entries = source.list(folder_url)
+
+    # Procurar arquivos txt na pasta Sped Contribuições
+    for file in entries:
+        if "sped" in doc_types and not file.is_folder and file.name.startswith("SPED_PISCOFINS") and file.name.endswith(".txt"):
+            logging.info("Encontrado arquivo SPED_PISCOFINS: %s", file.name)
+            copy_file(source, file.path, target, target_folder_sped, f"{month_year}_{file.name}", dedup, journal)
+
+    # Procurar arquivos pdf na subpasta Composição
+    for subfolder in entries:
+        if "relatorios" in doc_types and subfolder.is_folder and subfolder.name == "Composição":
+            for comp_file in source.list_files(subfolder.path):
+                if comp_file.name.endswith(".pdf"):
+                    logging.info("Encontrado arquivo PDF em Composição: %s", comp_file.name)
+                    copy_file(source, comp_file.path, target, target_folder_relatorios, comp_file.name, dedup, journal)
+
+
+# Função para procurar e copiar as guias da pasta Guias Impostos/Federal
+def search_and_copy_guias(source, fiscal_folder_url, target, target_folder_guias, dedup=None, journal=None):
+    logging.info("Procurando arquivos na pasta Guias Impostos: %s", fiscal_folder_url)
+    for subfolder in source.list_folders(fiscal_folder_url):
+        if subfolder.name != "Guias Impostos":
+            continue
+        for guias_subfolder in source.list_folders(subfolder.path):
+            if guias_subfolder.name != "Federal":
+                continue
+            for federal_file in source.list_files(guias_subfolder.path):
+                if federal_file.name.endswith(".pdf"):
+                    logging.info("Encontrado arquivo PDF em Guias Impostos: %s", federal_file.name)
+                    copy_file(source, federal_file.path, target, target_folder_guias, federal_file.name, dedup, journal)
+
+
+# Função para copiar um arquivo. Com o índice de duplicatas, conteúdos já copiados
+# (mesmo SHA-256, de outra pasta de mês ou com outro nome) não são enviados de novo.
+# Com o diário, arquivos já copiados numa execução anterior são pulados.
+def copy_file(source, path, target, target_folder_url, new_file_name, dedup=None, journal=None):
+    with logs.log_context(file=new_file_name):
+        if journal is not None:
+            from .sharepoint import AuthenticationError
+            # Falha esgotada sobe para a unidade da pasta, que fica pendente para a próxima execução
+            journal.run("copy", path, _copy_file, source, path, target, target_folder_url, new_file_name, dedup,
+                        fatal=(AuthenticationError,), raise_errors=True)
+            return
+        _copy_file(source, path, target, target_folder_url, new_file_name, dedup)
+
+
+def _copy_file(source, path, target, target_folder_url, new_file_name, dedup=None):
+    if dedup is None:
+        source.copy(path, target, target_folder_url, new_file_name)
+        return f"{target_folder_url}/{new_file_name}"
+
+    from .dedup import sha256_of
+
+    with source.open_stream(path) as stream:
+        digest = sha256_of(stream)
+        already_copied = dedup.has_file(digest)
+        dedup.add_file(digest, path)
+        if already_copied:
+            metrics.inc("duplicates_skipped")
+            logging.info("Arquivo %s já copiado com o mesmo conteúdo; cópia ignorada.", path)
+            return None
+        stream.seek(0)
+        logging.info("Copiando arquivo de %s para %s", path, f"{target_folder_url}/{new_file_name}")
+        with metrics.stage("copy"):
+            target.put(target_folder_url, new_file_name, stream)
+    metrics.inc("files_copied")
+    dedup.add_file(digest, f"{target_folder_url}/{new_file_name}")
+    logging.info("Arquivo %s copiado com sucesso para %s", new_file_name, target_folder_url)
+    return f"{target_folder_url}/{new_file_name}"
+
+
+# Função para listar subpastas que contêm a pasta "Fiscal". Com o plano, subpastas
+# dadas por nome exato não são buscadas e as demais são filtradas antes de abrir cada uma.
+def list_fiscal_subfolders(source, folder_url, plan=None, client=None):
+    if plan is not None:
+        names = plan.subfolder_names(client)
+        if names is not None:
+            return names
+
+    logging.info("Listando subpastas em: %s", folder_url)
+    fiscal_subfolders = []
+    for subfolder in source.list_folders(folder_url):
+        if plan is not None and not plan.includes_subfolder(client, subfolder.name):
+            continue
+        if any(sf.name == "Fiscal" for sf in source.list_folders(subfolder.path)):
+            fiscal_subfolders.append(subfolder.name)
+            logging.info("Encontrada subpasta Fiscal em: %s", subfolder.path)
+
+    return fiscal_subfolders
+
+
+# Função para percorrer as pastas Fiscal de cada cliente mês a mês: (mês, pasta, tipos de
+# documento). Com o plano, só os meses e tipos cobertos pelas regras de cada cliente.
+def iter_month_folders(source, client_folders, years, plan=None):
+    for folder in client_folders:
+        try:
+            subfolders = list_fiscal_subfolders(source, folder.path, plan, folder.name)
+        except FileNotFoundError as e:
+            # Pasta montada pelo plano a partir do nome, sem listar a carteira: pode não existir
+            if plan is None or not plan.direct:
+                raise
+            logging.warning("Pasta do cliente não encontrada: %s (%s)", folder.path, e)
+            metrics.inc("client_folders_missing")
+            continue
+        for subfolder in subfolders:
+            if plan is None:
+                months = [(year, month, DOC_TYPES) for year in years for month in range(1, 13)]
+            else:
+                months = plan.months(folder.name, subfolder, years)
+            for year, month, doc_types in months:
+                month_folder = f"{month:02d}-{year}"
+                yield month_folder, f"{folder.path}/{subfolder}/Fiscal/{year}/{month_folder}", doc_types
+
+
+# Função para copiar os arquivos SPED, relatórios e guias da carteira, conforme o plano
+# (por padrão, o de FOLDERS_ACCESS/FOLDERS_IGNORED)
+def copy_carteira(source, target, carteira_url=config.CARTEIRA_URL, config_file_path=config.CONFIG_FILE_PATH, years=range(2024, 2025), dedup=None, journal=None,
+                  plan=None):
+    if plan is None:
+        from .crawl_rules import compile_plan
+        plan = compile_plan(config_file_path)
+    logging.info("Configurações carregadas com sucesso.")
+
+    client_folders = plan.client_folders(source, carteira_url)
+    copy_client_folders(source, target, client_folders, years, dedup, journal, plan)
+
+
+# Função para copiar os arquivos das pastas de clientes informadas (a carteira
+# inteira ou só as pastas de um shard)
+def copy_client_folders(source, target, client_folders, years=range(2024, 2025), dedup=None, journal=None, plan=None):
+    for month_folder, fiscal_folder_url, doc_types in iter_month_folders(source, client_folders, years, plan):
+        if journal is None:
+            copy_month_folder(source, target, month_folder, fiscal_folder_url, dedup, doc_types=doc_types)
+            continue
+        # A pasta do mês só conta como concluída depois de todos os seus arquivos; numa
+        # cópia restrita a alguns tipos, a unidade leva os tipos e não cobre a pasta inteira
+        from .sharepoint import AuthenticationError
+        key = fiscal_folder_url if tuple(doc_types) == DOC_TYPES else f"{fiscal_folder_url}#{'+'.join(doc_types)}"
+        journal.run("crawl", key, copy_month_folder, source, target, month_folder, fiscal_folder_url, dedup, journal, doc_types,
+                    fatal=(AuthenticationError,), retries=0)
+
+
+# Função para copiar os arquivos de uma pasta Fiscal de um mês (só os tipos de `doc_types`)
+def copy_month_folder(source, target, month_folder, fiscal_folder_url, dedup=None, journal=None, doc_types=DOC_TYPES):
+    if "sped" in doc_types or "relatorios" in doc_types:
+        sped_folder_url = f"{fiscal_folder_url}/Sped Contribuições"
+        logging.info("Procurando arquivos na pasta: %s", sped_folder_url)
+        search_and_copy_files(source, sped_folder_url, target, config.SPED_FOLDER_URL, config.RELATORIOS_FOLDER_URL, month_folder, dedup, journal,
+                              doc_types)
+
+    if "guias" in doc_types:
+        logging.info("Procurando arquivos na pasta: %s", f"{fiscal_folder_url}/Guias Impostos")
+        search_and_copy_guias(source, fiscal_folder_url, target, config.GUIAS_FOLDER_URL, dedup, journal)
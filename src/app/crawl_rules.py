@@ -0,0 +1,268 @@
+import re
+import json
+import fnmatch
+import logging
+
+from . import config
+from .crawl import DOC_TYPES
+
+# Regras de acesso da varredura compiladas num plano que poda a árvore antes de
+# qualquer requisição ao SharePoint. Cada regra combina critérios opcionais (critério
+# ausente = tudo):
+#
+#   clients     nomes de pastas de clientes, exatos ou globs ("Grupo ABC*")
+#   cnpjs       CNPJs (14 dígitos) ou raízes (8 dígitos) presentes no nome da pasta
+#   months      meses "AAAA-MM" ou intervalos "AAAA-MM:AAAA-MM"
+#   doc_types   sped, relatorios, guias
+#   subfolders  nomes (ou globs) das subpastas do cliente que contêm a pasta Fiscal
+#
+# Uma camada tem regras de inclusão e de exclusão: um item (cliente, subpasta, mês,
+# tipo de documento) passa pela camada se alguma inclusão o cobre e nenhuma exclusão.
+# O plano é a interseção das camadas: a primeira vem de FOLDERS_ACCESS/FOLDERS_IGNORED
+# e as demais restringem a execução (arquivo --rules ou opções da linha de comando),
+# por exemplo "só Guias Impostos de 05/2024 destes 20 clientes".
+#
+# Onde as regras bastam, os caminhos são montados sem listar: clientes só com nomes
+# exatos numa restrição da execução dispensam a listagem da carteira, subpastas com nomes exatos dispensam a busca
+# da pasta Fiscal, e meses e tipos de documento fora do plano não geram requisição.
+
+RULE_FIELDS = ("clients", "cnpjs", "months", "doc_types", "subfolders")
+
+CNPJ_PATTERN = re.compile(r'\d{2}\.?\d{3}\.?\d{3}[/.-]?\d{4}-?\d{2}')
+MONTH_PATTERN = re.compile(r'^(\d{4})-(\d{2})$')
+
+
+def _digits(text):
+    return re.sub(r'\D', '', text)
+
+
+def parse_month(text):
+    match = MONTH_PATTERN.match(text.strip())
+    if not match or not 1 <= int(match.group(2)) <= 12:
+        raise ValueError(f"Mês inválido (esperado AAAA-MM): {text!r}")
+    return int(match.group(1)), int(match.group(2))
+
+
+# Intervalo de meses: "AAAA-MM" ou "AAAA-MM:AAAA-MM"
+def parse_window(text):
+    start, _, end = text.partition(':')
+    window = (parse_month(start), parse_month(end or start))
+    if window[0] > window[1]:
+        raise ValueError(f"Intervalo de meses invertido: {text!r}")
+    return window
+
+
+def months_in(window):
+    (year, month), end = window
+    while (year, month) <= end:
+        yield year, month
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+# Nomes exatos e globs (compilados numa única expressão regular)
+class NameMatcher:
+    def __init__(self, patterns, globs=True):
+        self.exact = set()
+        wildcards = []
+        for pattern in patterns:
+            if globs and any(char in pattern for char in "*?["):
+                wildcards.append(pattern)
+            else:
+                self.exact.add(pattern)
+        self.regex = re.compile('|'.join(fnmatch.translate(pattern) for pattern in wildcards), re.IGNORECASE) if wildcards else None
+
+    # Só nomes exatos: os caminhos podem ser montados sem listar a pasta
+    @property
+    def literal(self):
+        return self.regex is None
+
+    def match(self, name):
+        return name in self.exact or (self.regex is not None and self.regex.match(name) is not None)
+
+
+class Rule:
+    def __init__(self, clients=None, cnpjs=None, months=None, doc_types=None, subfolders=None):
+        self.clients = clients if clients is None or isinstance(clients, NameMatcher) else NameMatcher(clients)
+        self.cnpjs = None if cnpjs is None else {_digits(cnpj) for cnpj in cnpjs}
+        self.months = None if months is None else [parse_window(window) for window in months]
+        self.doc_types = None if doc_types is None else frozenset(doc_types)
+        self.subfolders = subfolders if subfolders is None or isinstance(subfolders, NameMatcher) else NameMatcher(subfolders)
+        if self.cnpjs and any(len(cnpj) not in (8, 14) for cnpj in self.cnpjs):
+            raise ValueError(f"CNPJ inválido nas regras (use 14 dígitos ou a raiz de 8): {sorted(self.cnpjs)}")
+        if self.doc_types and not self.doc_types <= set(DOC_TYPES):
+            raise ValueError(f"Tipo de documento desconhecido: {sorted(self.doc_types - set(DOC_TYPES))} (use {', '.join(DOC_TYPES)})")
+
+    # Regra que fala apenas de clientes: numa exclusão, descarta o cliente inteiro
+    @property
+    def client_only(self):
+        return self.months is None and self.doc_types is None and self.subfolders is None
+
+    # Clientes dados só por nomes exatos (sem globs nem CNPJs)
+    @property
+    def literal_clients(self):
+        return self.clients is not None and self.clients.literal and self.cnpjs is None
+
+    def matches_client(self, name):
+        if self.clients is None and self.cnpjs is None:
+            return True
+        if self.clients is not None and self.clients.match(name):
+            return True
+        if self.cnpjs:
+            for found in CNPJ_PATTERN.findall(name):
+                digits = _digits(found)
+                if digits in self.cnpjs or digits[:8] in self.cnpjs:
+                    return True
+        return False
+
+    def matches(self, subfolder, year_month, doc_type):
+        return ((self.subfolders is None or self.subfolders.match(subfolder))
+                and (self.months is None or any(start <= year_month <= end for start, end in self.months))
+                and (self.doc_types is None or doc_type in self.doc_types))
+
+
+# Função para montar uma regra a partir do JSON (campos de RULE_FIELDS, todos opcionais)
+def rule_from_dict(data):
+    unknown = set(data) - set(RULE_FIELDS)
+    if unknown:
+        raise ValueError(f"Campos desconhecidos na regra: {sorted(unknown)} (use {', '.join(RULE_FIELDS)})")
+    return Rule(**{field: _as_list(data[field]) for field in RULE_FIELDS if field in data})
+
+
+def _as_list(value):
+    return [value] if isinstance(value, str) else list(value)
+
+
+# `direct`: os nomes exatos de clientes da camada podem dispensar a listagem da carteira
+# (camadas de restrição da execução; a de FOLDERS_ACCESS só filtra a listagem)
+class Layer:
+    def __init__(self, include, exclude=(), direct=True):
+        self.include = list(include)
+        self.exclude = list(exclude)
+        self.direct = direct
+
+    # Regras que se aplicam ao cliente: (inclusões, exclusões); None se excluído por inteiro
+    def for_client(self, name):
+        excluded = [rule for rule in self.exclude if rule.matches_client(name)]
+        if any(rule.client_only for rule in excluded):
+            return None
+        included = [rule for rule in self.include if rule.matches_client(name)]
+        return (included, excluded) if included else None
+
+    # Nomes exatos dos clientes, se todas as inclusões forem desse tipo
+    def literal_clients(self):
+        if not self.direct or not all(rule.literal_clients for rule in self.include):
+            return None
+        return set().union(*(rule.clients.exact for rule in self.include))
+
+
+# Função para montar a camada de FOLDERS_ACCESS/FOLDERS_IGNORED (nomes sempre exatos)
+def folders_config_layer(config_file_path=config.CONFIG_FILE_PATH):
+    folders_access, folders_ignored = config.load_folders_config(config_file_path)
+    return Layer([Rule(clients=NameMatcher(folders_access, globs=False))], [Rule(clients=NameMatcher(folders_ignored, globs=False))],
+                 direct=False)
+
+
+# Função para ler um arquivo de regras: {"include": [...], "exclude": [...]} ou uma lista
+# de regras de inclusão
+def load_rules(path):
+    with open(path, 'r', encoding='utf-8') as rules_file:
+        data = json.load(rules_file)
+    if isinstance(data, list):
+        data = {"include": data}
+    unknown = set(data) - {"include", "exclude"}
+    if unknown:
+        raise ValueError(f"Chaves desconhecidas em {path}: {sorted(unknown)} (use include e exclude)")
+    return Layer([rule_from_dict(rule) for rule in data.get("include", [{}])],
+                 [rule_from_dict(rule) for rule in data.get("exclude", [])])
+
+
+class CrawlPlan:
+    def __init__(self, layers):
+        self.layers = list(layers)
+        self.direct = False
+        self._clients = {}
+
+    def _client_rules(self, name):
+        if name not in self._clients:
+            rules = [layer.for_client(name) for layer in self.layers]
+            self._clients[name] = None if any(entry is None for entry in rules) else rules
+        return self._clients[name]
+
+    def includes_client(self, name):
+        return self._client_rules(name) is not None
+
+    def _allowed(self, rules, subfolder, year_month, doc_type):
+        return all(any(rule.matches(subfolder, year_month, doc_type) for rule in included)
+                   and not any(rule.matches(subfolder, year_month, doc_type) for rule in excluded)
+                   for included, excluded in rules)
+
+    # Pastas de clientes do plano. Se alguma camada de restrição só tem nomes exatos, os
+    # caminhos são montados a partir deles e a carteira não é listada.
+    def client_folders(self, source, carteira_url):
+        from .storage import StorageEntry
+
+        literal = [names for names in (layer.literal_clients() for layer in self.layers) if names is not None]
+        if literal:
+            self.direct = True
+            names = sorted(set.intersection(*literal))
+            logging.info("Plano com %d pastas de clientes, sem listar a carteira.", len(names))
+            return [StorageEntry(name, f"{carteira_url}/{name}", True, None, None) for name in names if self.includes_client(name)]
+
+        logging.info("Listando pastas na pasta geral: %s", carteira_url)
+        return [folder for folder in source.list_folders(carteira_url) if self.includes_client(folder.name)]
+
+    # Subfolders com pasta Fiscal dadas por nomes exatos em todas as inclusões de uma
+    # camada (dispensam a busca); None se for preciso listar
+    def subfolder_names(self, client):
+        rules = self._client_rules(client)
+        if rules is None:
+            return []
+        known = []
+        for included, _ in rules:
+            if all(rule.subfolders is not None and rule.subfolders.literal for rule in included):
+                known.append(set().union(*(rule.subfolders.exact for rule in included)))
+        return sorted(set.intersection(*known)) if known else None
+
+    def includes_subfolder(self, client, subfolder):
+        rules = self._client_rules(client)
+        return rules is not None and all(
+            any(rule.subfolders is None or rule.subfolders.match(subfolder) for rule in included) for included, _ in rules)
+
+    # Meses de uma subpasta com algum documento no plano, com os tipos de cada um:
+    # [(ano, mês, tipos)]. Os meses vêm das camadas que os restringem (todas as inclusões
+    # com meses); só se nenhuma restringir vale a janela de `years`, que então não corta
+    # os meses dados explicitamente (--month substitui --year-from/--year-to).
+    def months(self, client, subfolder, years):
+        rules = self._client_rules(client)
+        if rules is None:
+            return []
+        candidates = None
+        for included, _ in rules:
+            if any(rule.months is None for rule in included):
+                continue
+            layer_months = set()
+            for rule in included:
+                for window in rule.months:
+                    layer_months.update(months_in(window))
+            candidates = layer_months if candidates is None else candidates & layer_months
+        if candidates is None:
+            candidates = {(year, month) for year in years for month in range(1, 13)}
+
+        planned = []
+        for year_month in sorted(candidates):
+            doc_types = tuple(doc_type for doc_type in DOC_TYPES if self._allowed(rules, subfolder, year_month, doc_type))
+            if doc_types:
+                planned.append((year_month[0], year_month[1], doc_types))
+        return planned
+
+
+# Função para compilar o plano da varredura: FOLDERS_ACCESS/FOLDERS_IGNORED do arquivo
+# de configuração e, se informadas, as restrições de um arquivo de regras e/ou de uma
+# regra avulsa (dict com os campos de RULE_FIELDS)
+def compile_plan(config_file_path=config.CONFIG_FILE_PATH, rules_path=None, restriction=None):
+    layers = [folders_config_layer(config_file_path)]
+    if rules_path:
+        layers.append(load_rules(rules_path))
+    if restriction:
+        layers.append(Layer([rule_from_dict(restriction)]))
+    return CrawlPlan(layers)
@@ -0,0 +1,321 @@
+import os
+import re
+import time
+import heapq
+import signal
+import logging
+import datetime
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from . import config, metrics
+
+# Serviço de ingestão contínua. Em vez do lote manual completo, o APScheduler
+# agenda varreduras periódicas:
+#  - carteira: copia para a landing zone só os arquivos novos das pastas dos meses
+#    recentes (o diário pula os já copiados);
+#  - landing zone: enfileira só as guias que ainda não foram processadas.
+# A fila é por prioridade, com as guias de vencimento mais próximo primeiro, e é
+# consumida por um pool de processos já aquecido (motor de OCR, sessão do
+# SharePoint e classificador carregados uma vez). Os registros extraídos são
+# acrescentados ao BigQuery em pequenos lotes; a guia só é marcada como feita no
+# diário depois que seus registros foram carregados, então o que estava na memória
+# quando o serviço morreu é extraído de novo na próxima execução. A carga apaga antes
+# as linhas já carregadas dos mesmos arquivos (load.load_records): reprocessar uma
+# guia, reenviada ou já carregada por um `load` do lote, não duplica linhas. O `load`
+# do lote, por sua vez, substitui a tabela inteira pelo JSON consolidado.
+
+# Vencimento no texto nativo da guia
+DUE_DATE_PATTERN = re.compile(r'(?:Data de Vencimento|Pagar este documento até)\s*\n?\s*(\d{2}/\d{2}/\d{4})')
+# Competência no nome do arquivo, ex.: "... Darf de PIS 03.2024.pdf"
+COMPETENCIA_PATTERN = re.compile(r'\b(\d{2})\.(\d{4})\b')
+# Dia de vencimento usado quando só a competência é conhecida (tributos federais: dia 25 do mês seguinte)
+DEFAULT_DUE_DAY = 25
+# Espera (segundos) antes de tentar de novo uma guia que falhou, dobrando a cada falha
+RETRY_BACKOFF = 60
+MAX_RETRY_BACKOFF = 6 * 3600
+
+
+class _Worker:
+    def __init__(self):
+        self.storage = None
+        self.engine = None
+        self.classifier = None
+
+
+_worker = _Worker()
+
+
+def _init_worker(mirror, engine_name, engine_options, classifier_path):
+    from .ocr_engines import get_engine
+    from .storage import get_landing_zone_storage
+
+    _worker.storage = get_landing_zone_storage(mirror)
+    _worker.engine = get_engine(engine_name, **engine_options)
+    if classifier_path:
+        from .classifier import PageClassifier
+        _worker.classifier = PageClassifier.load(classifier_path)
+    metrics.registry.drain()
+
+
+def _ingest_file(pdf_url):
+    from .ocr import process_file
+
+    records = process_file(_worker.storage, pdf_url, os.path.basename(pdf_url), _worker.engine, _worker.classifier)
+    return records, metrics.registry.drain()
+
+
+def _timestamp(modified):
+    if modified is None:
+        return None
+    if isinstance(modified, (int, float)):
+        return float(modified)
+    return datetime.datetime.fromisoformat(str(modified).replace('Z', '+00:00')).timestamp()
+
+
+# Função para estimar o vencimento de uma guia antes do OCR: pela camada de texto
+# quando houver; senão pela competência no nome do arquivo; senão fim da fila
+def estimate_due_date(storage, entry):
+    local_path = storage.local_path(entry.path)
+    if local_path:
+        import fitz  # PyMuPDF
+
+        try:
+            with fitz.open(local_path) as doc:
+                match = DUE_DATE_PATTERN.search(doc.load_page(0).get_text()) if len(doc) else None
+            if match:
+                return datetime.datetime.strptime(match.group(1), "%d/%m/%Y").date()
+        except (fitz.FileDataError, ValueError):
+            pass
+
+    match = COMPETENCIA_PATTERN.search(entry.name)
+    if match:
+        month, year = int(match.group(1)), int(match.group(2))
+        if 1 <= month <= 12:
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+            return datetime.date(year, month, DEFAULT_DUE_DAY)
+    return datetime.date.max
+
+
+class IngestionDaemon:
+    def __init__(self, landing_zone, source=None, journal=None, workers=2, engine_name=None, engine_options=None,
+                 classifier_path=config.CLASSIFIER_REFERENCE_PATH, mirror=None, folder_url=config.GUIAS_FOLDER_URL,
+                 poll_seconds=60, crawl_seconds=900, load_seconds=60, recent_months=2, carteira_url=config.CARTEIRA_URL,
+                 config_file_path=config.CONFIG_FILE_PATH, load=True, guia_db=None):
+        self.landing_zone = landing_zone
+        self.source = source
+        self.journal = journal
+        self.workers = workers
+        self.engine_name = engine_name
+        self.engine_options = engine_options or {}
+        self.classifier_path = classifier_path
+        self.mirror = mirror
+        self.folder_url = folder_url
+        self.poll_seconds = poll_seconds
+        self.crawl_seconds = crawl_seconds
+        self.load_seconds = load_seconds
+        self.recent_months = recent_months
+        self.carteira_url = carteira_url
+        self.config_file_path = config_file_path
+        self.load = load
+        self.guia_db = guia_db
+
+        # Fila de prioridade: (vencimento, ordem de chegada, chave, url, modificado)
+        self._queue = []
+        self._queued = set()
+        self._sequence = 0
+        self._condition = threading.Condition()
+        # Registros extraídos ainda não carregados: [(chave, nome do arquivo, registros)]
+        self._pending = []
+        self._records_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # Guias com falha: chave -> (falhas seguidas, quando pode tentar de novo)
+        self._failures = {}
+        self._stopping = threading.Event()
+
+    # Chave de uma versão de arquivo: o mesmo caminho modificado é processado de novo
+    @staticmethod
+    def file_key(entry):
+        return f"{entry.path}@{entry.modified}"
+
+    def enqueue(self, entry):
+        key = self.file_key(entry)
+        with self._condition:
+            if key in self._queued:
+                return False
+            failures = self._failures.get(key)
+            if failures is not None and failures[1] > time.time():
+                return False
+        if self.journal is not None and self.journal.is_done("ingest", key):
+            return False
+        due_date = estimate_due_date(self.landing_zone, entry)
+        with self._condition:
+            self._sequence += 1
+            heapq.heappush(self._queue, (due_date, self._sequence, key, entry.path, entry.modified))
+            self._queued.add(key)
+            metrics.inc("ingest_enqueued")
+            self._condition.notify()
+        logging.info("Guia %s enfileirada (vencimento %s).", entry.name, due_date)
+        return True
+
+    # Varredura da landing zone: enfileira só as guias novas ou modificadas
+    def poll_landing_zone(self):
+        added = 0
+        for entry in self.landing_zone.list_files(self.folder_url):
+            if entry.name.endswith(".pdf") and self.enqueue(entry):
+                added += 1
+        if added:
+            logging.info("%d guias novas na landing zone.", added)
+
+    # Varredura da carteira: só as pastas dos meses recentes (restrição do plano, sem
+    # requisições para os demais meses), arquivo a arquivo pelo diário
+    def poll_portfolio(self):
+        from .crawl import copy_month_folder, iter_month_folders
+        from .crawl_rules import compile_plan
+
+        today = datetime.date.today()
+        months = []
+        year, month = today.year, today.month
+        for _ in range(self.recent_months):
+            months.append(f"{year}-{month:02d}")
+            year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+
+        plan = compile_plan(self.config_file_path, restriction={"months": months})
+        client_folders = plan.client_folders(self.source, self.carteira_url)
+        years = sorted({int(name[:4]) for name in months})
+        for month_folder, fiscal_folder_url, doc_types in iter_month_folders(self.source, client_folders, years, plan):
+            try:
+                copy_month_folder(self.source, self.landing_zone, month_folder, fiscal_folder_url, journal=self.journal, doc_types=doc_types)
+            except Exception as e:
+                logging.error("Erro ao copiar %s: %s", fiscal_folder_url, e)
+
+    def _next(self):
+        with self._condition:
+            while not self._queue and not self._stopping.is_set():
+                self._condition.wait(timeout=1.0)
+            if not self._queue:
+                return None
+            return heapq.heappop(self._queue)
+
+    # A guia continua na fila (não é enfileirada de novo) até seus registros serem carregados
+    def _done(self, item, records):
+        _, _, key, _, modified = item
+        with self._records_lock:
+            self._pending.append((key, os.path.basename(item[3]), records))
+        if self.guia_db is not None:
+            self.guia_db.upsert(records)
+        with self._condition:
+            self._failures.pop(key, None)
+        uploaded_at = _timestamp(modified)
+        if uploaded_at is not None:
+            metrics.observe("ingest_latency_seconds", time.time() - uploaded_at)
+        metrics.inc("ingest_files")
+
+    # Distribui as guias da fila para o pool, respeitando a prioridade: só sai da
+    # fila o que já tem processo livre, para uma guia urgente não esperar atrás das outras
+    def dispatch(self, executor):
+        in_flight = {}
+        while not self._stopping.is_set() or in_flight:
+            while len(in_flight) < self.workers and not self._stopping.is_set():
+                item = self._next() if not in_flight else self._pop_nowait()
+                if item is None:
+                    break
+                in_flight[executor.submit(_ingest_file, item[3])] = item
+            if not in_flight:
+                continue
+            done, _ = wait(in_flight, timeout=1.0, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = in_flight.pop(future)
+                try:
+                    records, snapshot = future.result()
+                except Exception as e:
+                    logging.error("Erro ao processar %s: %s", item[3], e)
+                    metrics.inc("ingest_errors")
+                    if self.journal is not None:
+                        self.journal.fail("ingest", item[2], f"{type(e).__name__}: {e}")
+                    self._failed(item[2])
+                    continue
+                metrics.registry.merge(snapshot)
+                self._done(item, records)
+
+    # Falhas seguidas da mesma guia esperam cada vez mais antes da nova tentativa
+    def _failed(self, key):
+        with self._condition:
+            count = self._failures.get(key, (0, 0))[0] + 1
+            delay = min(RETRY_BACKOFF * 2 ** (count - 1), MAX_RETRY_BACKOFF)
+            self._failures[key] = (count, time.time() + delay)
+            self._queued.discard(key)
+        logging.info("Nova tentativa de %s em %d s (%d falhas seguidas).", key, delay, count)
+
+    def _pop_nowait(self):
+        with self._condition:
+            return heapq.heappop(self._queue) if self._queue else None
+
+    # Carga em pequenos lotes no BigQuery (modo append); as guias carregadas são
+    # marcadas como feitas no diário
+    def flush(self):
+        with self._flush_lock:
+            with self._records_lock:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return
+            records = [record for _, _, file_records in pending for record in file_records]
+            if not self.load:
+                logging.info("%d registros extraídos (carga desabilitada).", len(records))
+            else:
+                from .load import load_records
+                try:
+                    load_records(records, append=True, file_names=[file_name for _, file_name, _ in pending])
+                except Exception as e:
+                    logging.error("Erro na carga de %d registros; nova tentativa no próximo ciclo: %s", len(records), e)
+                    with self._records_lock:
+                        self._pending = pending + self._pending
+                    return
+            for key, _, file_records in pending:
+                if self.journal is not None:
+                    self.journal.finish("ingest", key, {"records": len(file_records)})
+                with self._condition:
+                    self._queued.discard(key)
+
+    def run(self):
+        from apscheduler.schedulers.background import BackgroundScheduler
+
+        scheduler = BackgroundScheduler()
+        now = datetime.datetime.now()
+        scheduler.add_job(self.poll_landing_zone, "interval", seconds=self.poll_seconds, next_run_time=now,
+                          max_instances=1, coalesce=True, id="landing_zone")
+        if self.source is not None:
+            scheduler.add_job(self.poll_portfolio, "interval", seconds=self.crawl_seconds, next_run_time=now,
+                              max_instances=1, coalesce=True, id="carteira")
+        scheduler.add_job(self.flush, "interval", seconds=self.load_seconds, max_instances=1, coalesce=True, id="load")
+
+        executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                       initargs=(self.mirror, self.engine_name, self.engine_options, self.classifier_path))
+        # SIGTERM (systemd, docker stop) encerra como o Ctrl+C: termina as guias em
+        # andamento e carrega os registros pendentes
+        previous_handler = None
+        if threading.current_thread() is threading.main_thread():
+            previous_handler = signal.signal(signal.SIGTERM, self._terminate)
+        scheduler.start()
+        logging.info("Serviço de ingestão iniciado com %d processos.", self.workers)
+        try:
+            self.dispatch(executor)
+        except KeyboardInterrupt:
+            # As guias em andamento não são marcadas no diário e voltam à fila na próxima execução
+            logging.info("Encerrando o serviço de ingestão...")
+            self.stop()
+        finally:
+            scheduler.shutdown(wait=False)
+            executor.shutdown(cancel_futures=True)
+            self.flush()
+            if previous_handler is not None:
+                signal.signal(signal.SIGTERM, previous_handler)
+
+    def _terminate(self, signum, frame):
+        logging.info("Sinal %d recebido; encerrando o serviço de ingestão...", signum)
+        self.stop()
+
+    def stop(self):
+        self._stopping.set()
+        with self._condition:
+            self._condition.notify_all()
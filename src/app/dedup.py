@@ -0,0 +1,138 @@
+import os
+import json
+import mmap
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import namedtuple
+
+from . import config, metrics
+
+# Índice de duplicatas entre arquivos. Cada PDF é identificado pelo SHA-256 dos
+# bytes e cada página com camada de texto pelo hash do texto nativo. Só conteúdo
+# idêntico reaproveita o texto de OCR gravado: a mesma página de um arquivo com os
+# mesmos bytes, ou uma página com exatamente o mesmo texto nativo. Páginas escaneadas
+# de arquivos diferentes não são comparadas por semelhança de imagem: DARFs diferentes
+# compartilham o leiaute do formulário e um hash da página inteira não os distingue.
+
+PageFingerprint = namedtuple('PageFingerprint', ['text_hash'])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    size INTEGER,
+    seen_at REAL
+);
+CREATE INDEX IF NOT EXISTS files_sha256 ON files (sha256);
+CREATE TABLE IF NOT EXISTS pages (
+    file_sha256 TEXT NOT NULL,
+    page_num INTEGER NOT NULL,
+    text_hash TEXT,
+    text TEXT NOT NULL,
+    PRIMARY KEY (file_sha256, page_num)
+);
+CREATE INDEX IF NOT EXISTS pages_text_hash ON pages (text_hash);
+"""
+
+
+# Função para calcular o SHA-256 de um conteúdo (bytes, mmap ou stream)
+def sha256_of(content):
+    digest = hashlib.sha256()
+    if isinstance(content, (bytes, bytearray, memoryview, mmap.mmap)):
+        # mmap entra direto pelo buffer protocol, sem cópia
+        digest.update(content)
+    else:
+        for chunk in iter(lambda: content.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Fingerprint da página: hash do texto nativo, ou None em página escaneada (sem texto)
+def page_fingerprint(page, min_text_chars=40):
+    text = ' '.join(page.get_text().split())
+    if len(text) >= min_text_chars:
+        return PageFingerprint(hashlib.sha1(text.encode('utf-8')).hexdigest())
+    return PageFingerprint(None)
+
+
+class DedupIndex:
+    def __init__(self, path=config.DEDUP_INDEX_PATH):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    # Registra um arquivo; retorna os outros caminhos já vistos com o mesmo conteúdo
+    def add_file(self, sha256, path, size=None):
+        with self._lock, self.conn:
+            duplicates = [row[0] for row in self.conn.execute("SELECT path FROM files WHERE sha256 = ? AND path != ?", (sha256, path))]
+            self.conn.execute("INSERT OR REPLACE INTO files (path, sha256, size, seen_at) VALUES (?, ?, ?, ?)", (path, sha256, size, time.time()))
+        if duplicates:
+            metrics.inc("duplicate_files")
+            logging.info("Arquivo %s é duplicata de: %s", path, ', '.join(duplicates))
+        return duplicates
+
+    def has_file(self, sha256):
+        with self._lock:
+            return self.conn.execute("SELECT 1 FROM files WHERE sha256 = ? LIMIT 1", (sha256,)).fetchone() is not None
+
+    # Busca o texto de OCR de uma página idêntica já processada: a mesma página de um
+    # arquivo com os mesmos bytes ou, com camada de texto, uma página com o mesmo texto.
+    # Texto vazio (gravado por versões antigas) não conta: é o que os motores devolvem
+    # quando o OCR falha.
+    def find_page(self, fingerprint, file_sha256, page_num):
+        with self._lock:
+            row = self.conn.execute("SELECT text FROM pages WHERE file_sha256 = ? AND page_num = ? AND TRIM(text) != ''",
+                                    (file_sha256, page_num)).fetchone()
+            if row is None and fingerprint.text_hash:
+                row = self.conn.execute("SELECT text FROM pages WHERE text_hash = ? AND TRIM(text) != '' LIMIT 1",
+                                        (fingerprint.text_hash,)).fetchone()
+            return row[0] if row else None
+
+    # Só textos reconhecidos entram: um OCR que falhou (texto vazio) é refeito da próxima vez
+    def add_page(self, file_sha256, page_num, fingerprint, text):
+        if not text or not text.strip():
+            return
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO pages (file_sha256, page_num, text_hash, text) VALUES (?, ?, ?, ?)",
+                (file_sha256, page_num, fingerprint.text_hash, text))
+
+    # Relatório dos grupos de duplicatas: arquivos com os mesmos bytes e páginas com o
+    # mesmo texto nativo em arquivos diferentes
+    def report(self):
+        with self._lock:
+            files = {}
+            for sha256, path, size in self.conn.execute("SELECT sha256, path, size FROM files ORDER BY sha256, path"):
+                files.setdefault(sha256, {"sha256": sha256, "size": size, "paths": []})["paths"].append(path)
+            file_groups = [group for group in files.values() if len(group["paths"]) > 1]
+
+            paths_by_sha = {}
+            for sha256, path in self.conn.execute("SELECT sha256, MIN(path) FROM files GROUP BY sha256"):
+                paths_by_sha[sha256] = path
+            pages = {}
+            for key, file_sha256, page_num in self.conn.execute(
+                    "SELECT text_hash, file_sha256, page_num FROM pages WHERE text_hash IS NOT NULL ORDER BY 1, 2, 3"):
+                pages.setdefault(key, []).append({"file": paths_by_sha.get(file_sha256, file_sha256), "page": page_num})
+            page_groups = [entries for entries in pages.values() if len({entry["file"] for entry in entries}) > 1]
+
+        return {
+            "duplicate_files": file_groups,
+            "duplicate_pages": page_groups,
+            "wasted_bytes": sum(group["size"] * (len(group["paths"]) - 1) for group in file_groups if group["size"]),
+        }
+
+    def write_report(self, output_path):
+        report = self.report()
+        with open(output_path, 'w', encoding='utf-8') as report_file:
+            json.dump(report, report_file, ensure_ascii=False, indent=4)
+        logging.info("Relatório de duplicatas salvo em %s: %d grupos de arquivos, %d grupos de páginas.",
+                     output_path, len(report["duplicate_files"]), len(report["duplicate_pages"]))
+        return report
@@ -0,0 +1,234 @@
+import os
+import re
+import time
+import json
+import sqlite3
+import logging
+import datetime
+import threading
+
+from . import config, metrics
+
+# Base local (SQLite) das guias extraídas, para as consultas do dia a dia sem abrir o
+# consolidated_data.json inteiro nem ir ao BigQuery: guias de um CNPJ que vencem na
+# semana, total pago por tributo e cliente no ano, etc. Os registros do ocr e do
+# parse são normalizados (datas ISO, valor numérico, período AAAA-MM, tributo) e
+# gravados por upsert à medida que cada execução termina, com índices nas colunas
+# de consulta.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS guias (
+    origem TEXT NOT NULL,
+    arquivo TEXT NOT NULL,
+    pagina INTEGER NOT NULL DEFAULT 0,
+    cnpj TEXT,
+    cnpj_raiz TEXT,
+    razao_social TEXT,
+    periodo TEXT,
+    periodo_apuracao TEXT,
+    vencimento TEXT,
+    numero_documento TEXT,
+    codigo_receita TEXT,
+    descricao TEXT,
+    tributo TEXT,
+    valor REAL,
+    texto_ref TEXT,
+    atualizado_em REAL,
+    PRIMARY KEY (origem, arquivo, pagina)
+);
+CREATE INDEX IF NOT EXISTS guias_cnpj_vencimento ON guias (cnpj, vencimento);
+CREATE INDEX IF NOT EXISTS guias_cnpj_raiz ON guias (cnpj_raiz);
+CREATE INDEX IF NOT EXISTS guias_vencimento ON guias (vencimento);
+CREATE INDEX IF NOT EXISTS guias_periodo ON guias (periodo, tributo);
+CREATE INDEX IF NOT EXISTS guias_codigo_receita ON guias (codigo_receita);
+CREATE INDEX IF NOT EXISTS guias_numero_documento ON guias (numero_documento, origem, arquivo, pagina);
+-- Cobre o total por cliente e tributo sem ler a tabela
+CREATE INDEX IF NOT EXISTS guias_tributo_periodo ON guias (tributo, periodo, cnpj_raiz, valor, razao_social);
+"""
+
+COLUMNS = ["origem", "arquivo", "pagina", "cnpj", "cnpj_raiz", "razao_social", "periodo", "periodo_apuracao", "vencimento",
+           "numero_documento", "codigo_receita", "descricao", "tributo", "valor", "texto_ref", "atualizado_em"]
+
+# Campos dos registros do ocr (OCR das guias) e do parse (camada de texto)
+OCR_FIELDS = {
+    "arquivo": "Nome do Arquivo", "pagina": "Página", "cnpj": "CNPJ", "periodo_apuracao": "Periodo de Apuração",
+    "vencimento": "Data de Vencimento", "numero_documento": "Número do Documento", "valor": "Valor Total do Documento",
+    "codigo_receita": "Código Denominação", "descricao": "Descrição Cod Denominação", "texto_ref": "Texto",
+}
+PARSE_FIELDS = {
+    "arquivo": "File Name", "cnpj": "CNPJ", "razao_social": "Company Name", "periodo_apuracao": "Apuration Date",
+    "vencimento": "Due Date", "numero_documento": "Document Number", "valor": "Total Value",
+    "codigo_receita": "Tax Code", "descricao": "Tax Description", "texto_ref": "Content Ref",
+}
+
+# A mesma guia pode entrar pelo ocr e pelo parse (a chave inclui a origem) ou vir em dois
+# arquivos: nas somas e listas, vale uma linha por número do documento, a do parse
+# (camada de texto, sem erro de OCR) e, na mesma origem, a do primeiro arquivo/página.
+# Linhas sem número do documento não têm como ser comparadas e entram todas.
+UNIQUE_GUIA = (
+    "NOT EXISTS (SELECT 1 FROM guias AS outra WHERE outra.numero_documento = guias.numero_documento "
+    "AND ((outra.origem = 'parse' AND guias.origem = 'ocr') "
+    "OR (outra.origem = guias.origem AND (outra.arquivo, outra.pagina) < (guias.arquivo, guias.pagina))))"
+)
+
+# Tributo pela descrição do código de receita (a primeira sigla encontrada)
+TRIBUTOS = ["COFINS", "PIS", "IRPJ", "CSLL", "IRRF"]
+
+MESES = {nome.lower(): numero for numero, nome in enumerate(
+    ["Janeiro", "Fevereiro", "Março", "Abril", "Maio", "Junho", "Julho", "Agosto", "Setembro", "Outubro", "Novembro", "Dezembro"], 1)}
+
+DATE_PATTERN = re.compile(r'^(\d{2})/(\d{2})/(\d{4})$')
+MONTH_YEAR_PATTERN = re.compile(r'^([^\W\d]+)/(\d{4})$')
+
+
+def to_iso_date(text):
+    match = DATE_PATTERN.match((text or '').strip())
+    return f"{match.group(3)}-{match.group(2)}-{match.group(1)}" if match else None
+
+
+# Período "AAAA-MM" a partir de "dd/mm/aaaa" ou "Março/2024"
+def to_periodo(text):
+    text = (text or '').strip()
+    match = DATE_PATTERN.match(text)
+    if match:
+        return f"{match.group(3)}-{match.group(2)}"
+    match = MONTH_YEAR_PATTERN.match(text)
+    if match and match.group(1).lower() in MESES:
+        return f"{match.group(2)}-{MESES[match.group(1).lower()]:02d}"
+    return None
+
+
+def to_amount(text):
+    if isinstance(text, (int, float)):
+        return float(text)
+    cleaned = re.sub(r'[^\d,.-]', '', text or '').replace('.', '').replace(',', '.')
+    try:
+        return float(cleaned)
+    except ValueError:
+        return None
+
+
+def tributo_of(codigo_receita, descricao):
+    description = (descricao or '').upper()
+    tributo = next((sigla for sigla in TRIBUTOS if sigla in description), None)
+    if tributo is None:
+        from .reconcile import RECEITA_TRIBUTO
+        tributo = RECEITA_TRIBUTO.get((codigo_receita or '').strip())
+    return tributo
+
+
+# Função para converter um registro do ocr ou do parse em linha da tabela
+def normalize(record):
+    origem, fields = ("ocr", OCR_FIELDS) if "Nome do Arquivo" in record else ("parse", PARSE_FIELDS)
+    row = {column: record.get(field) for column, field in fields.items()}
+    cnpj = (row.get("cnpj") or '').strip() or None
+    return {
+        "origem": origem,
+        "arquivo": row["arquivo"],
+        "pagina": int(row.get("pagina") or 0),
+        "cnpj": cnpj,
+        "cnpj_raiz": re.sub(r'\D', '', cnpj)[:8] if cnpj else None,
+        "razao_social": row.get("razao_social"),
+        "periodo": to_periodo(row.get("periodo_apuracao")),
+        "periodo_apuracao": row.get("periodo_apuracao"),
+        "vencimento": to_iso_date(row.get("vencimento")),
+        "numero_documento": (row.get("numero_documento") or '').strip() or None,
+        "codigo_receita": (row.get("codigo_receita") or '').strip() or None,
+        "descricao": row.get("descricao"),
+        "tributo": tributo_of(row.get("codigo_receita"), row.get("descricao")),
+        "valor": to_amount(row.get("valor")),
+        "texto_ref": row.get("texto_ref"),
+        "atualizado_em": time.time(),
+    }
+
+
+class GuiaDB:
+    def __init__(self, path=config.GUIAS_DB_PATH):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    # Grava (ou atualiza) os registros de uma execução; retorna quantos entraram
+    def upsert(self, records):
+        rows = [normalize(record) for record in records]
+        rows = [row for row in rows if row["arquivo"]]
+        if not rows:
+            return 0
+        placeholders = ', '.join('?' for _ in COLUMNS)
+        updates = ', '.join(f"{column} = excluded.{column}" for column in COLUMNS if column not in ("origem", "arquivo", "pagina"))
+        with self._lock, self.conn, metrics.stage("guias_db"):
+            self.conn.executemany(
+                f"INSERT INTO guias ({', '.join(COLUMNS)}) VALUES ({placeholders}) "
+                f"ON CONFLICT (origem, arquivo, pagina) DO UPDATE SET {updates}",
+                [tuple(row[column] for column in COLUMNS) for row in rows])
+        metrics.inc("guias_db_rows", len(rows))
+        return len(rows)
+
+    # Função para carregar JSONs de saída já gerados (ocr ou parse)
+    def ingest(self, json_paths):
+        total = 0
+        for path in json_paths:
+            with open(path, 'r', encoding='utf-8') as json_file:
+                total += self.upsert(json.load(json_file))
+        logging.info("%d registros gravados em %s", total, self.path)
+        return total
+
+    def query(self, sql, params=()):
+        start = time.perf_counter()
+        with self._lock:
+            rows = [dict(row) for row in self.conn.execute(sql, params)]
+        elapsed = time.perf_counter() - start
+        metrics.observe("guias_db_query_seconds", elapsed)
+        logging.debug("Consulta em %.2f ms: %d linhas", elapsed * 1000, len(rows))
+        return rows
+
+    # Guias que vencem no intervalo (padrão: a semana corrente, de segunda a domingo)
+    def due(self, cnpj=None, start=None, end=None):
+        if start is None:
+            today = datetime.date.today()
+            start = today - datetime.timedelta(days=today.weekday())
+        if end is None:
+            end = start + datetime.timedelta(days=6)
+        sql = ("SELECT cnpj, razao_social, vencimento, tributo, codigo_receita, valor, numero_documento, arquivo, pagina "
+               f"FROM guias WHERE vencimento BETWEEN ? AND ? AND {UNIQUE_GUIA}")
+        params = [str(start), str(end)]
+        if cnpj:
+            sql += " AND cnpj = ?"
+            params.append(cnpj)
+        return self.query(sql + " ORDER BY vencimento, cnpj", params)
+
+    # Total pago por cliente (raiz do CNPJ) e tributo, no ano ou em um período AAAA-MM
+    def totals(self, tributo=None, year=None, periodo=None, cnpj=None):
+        sql = ("SELECT cnpj_raiz, MAX(razao_social) AS razao_social, tributo, COUNT(*) AS guias, ROUND(SUM(valor), 2) AS total "
+               f"FROM guias WHERE {UNIQUE_GUIA}")
+        params = []
+        if tributo:
+            sql += " AND tributo = ?"
+            params.append(tributo.upper())
+        if periodo:
+            sql += " AND periodo = ?"
+            params.append(periodo)
+        elif year:
+            sql += " AND periodo BETWEEN ? AND ?"
+            params.extend([f"{year}-01", f"{year}-12"])
+        if cnpj:
+            sql += " AND cnpj_raiz = ?"
+            params.append(re.sub(r'\D', '', cnpj)[:8])
+        return self.query(sql + " GROUP BY cnpj_raiz, tributo ORDER BY cnpj_raiz, tributo", params)
+
+    # Busca por qualquer combinação de CNPJ, período, código de receita e número do documento
+    def find(self, cnpj=None, periodo=None, codigo_receita=None, numero_documento=None):
+        filters = {"cnpj": cnpj, "periodo": periodo, "codigo_receita": codigo_receita, "numero_documento": numero_documento}
+        conditions = [(f"{column} = ?", value) for column, value in filters.items() if value]
+        sql = "SELECT * FROM guias"
+        if conditions:
+            sql += " WHERE " + " AND ".join(condition for condition, _ in conditions)
+        return self.query(sql + " ORDER BY vencimento, cnpj", [value for _, value in conditions])
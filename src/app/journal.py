@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import logging
+import threading
+from collections import namedtuple
+
+from . import config, metrics
+
+# Diário de trabalho em SQLite: cada unidade (pasta varrida, arquivo copiado, página
+# com OCR, guia lida pela camada de texto, carga no BigQuery) é gravada com o estado
+# e o resultado assim que termina. Uma execução interrompida (sessão expirada, PDF
+# inválido, falta de memória) é retomada pulando as unidades concluídas; as que
+# falharam são tentadas de novo, com espera exponencial entre as tentativas.
+#
+# O mesmo arquivo pode ser usado por vários processos ao mesmo tempo (workers de
+# shard, daemon e uma execução manual). Unidades em andamento levam o dono
+# (host:pid) e um heartbeat renovado em segundo plano; ao abrir o diário só voltam
+# para falha as unidades em andamento de processos mortos ou sem heartbeat recente.
+
+Unit = namedtuple('Unit', ['kind', 'key', 'state', 'attempts', 'result', 'error', 'updated_at'])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS units (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    updated_at REAL,
+    owner TEXT,
+    heartbeat_at REAL,
+    PRIMARY KEY (kind, key)
+);
+CREATE INDEX IF NOT EXISTS units_state ON units (kind, state);
+"""
+
+RUNNING, DONE, FAILED = "running", "done", "failed"
+
+# Unidade em andamento sem heartbeat há mais que isso (segundos) é de processo morto
+HEARTBEAT_TTL = 120
+
+
+# Processo dono de unidade em andamento já encerrado (só dá para saber na mesma máquina)
+def _owner_dead(owner):
+    host, _, pid = (owner or '').rpartition(':')
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        return False
+    return False
+
+
+class Journal:
+    def __init__(self, path=config.JOURNAL_PATH, retries=2, backoff=1.0, ttl=HEARTBEAT_TTL):
+        from .leases import default_owner
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.retries = retries
+        self.backoff = backoff
+        self.ttl = ttl
+        self.owner = default_owner()
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        # WAL: cada unidade é gravada na hora sem o custo de um fsync do arquivo inteiro
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        # Diários criados antes das colunas de dono e heartbeat
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(units)")}
+        with self.conn:
+            for column, column_type in (("owner", "TEXT"), ("heartbeat_at", "REAL")):
+                if column not in columns:
+                    self.conn.execute(f"ALTER TABLE units ADD COLUMN {column} {column_type}")
+        self._recover()
+        self._stop_event = threading.Event()
+        self._heartbeat = threading.Thread(target=self._beat, daemon=True)
+        self._heartbeat.start()
+
+    # Unidades que estavam rodando quando a execução anterior morreu: as deste processo,
+    # as de processos mortos nesta máquina e as sem heartbeat recente
+    def _recover(self):
+        limit = time.time() - self.ttl
+        with self._lock, self.conn:
+            running = self.conn.execute("SELECT kind, key, owner, heartbeat_at FROM units WHERE state = ?", (RUNNING,)).fetchall()
+            stale = [(kind, key) for kind, key, owner, heartbeat_at in running
+                     if owner is None or owner == self.owner or heartbeat_at is None or heartbeat_at < limit or _owner_dead(owner)]
+            self.conn.executemany("UPDATE units SET state = ? WHERE kind = ? AND key = ? AND state = ?",
+                                  [(FAILED, kind, key, RUNNING) for kind, key in stale])
+        if stale:
+            logging.info("%d unidades interrompidas na execução anterior serão refeitas.", len(stale))
+        if len(running) > len(stale):
+            logging.info("%d unidades em andamento em outros processos.", len(running) - len(stale))
+
+    # Renova o heartbeat das unidades em andamento deste processo
+    def _beat(self):
+        while not self._stop_event.wait(self.ttl / 3):
+            try:
+                with self._lock, self.conn:
+                    self.conn.execute("UPDATE units SET heartbeat_at = ? WHERE state = ? AND owner = ?", (time.time(), RUNNING, self.owner))
+            except sqlite3.Error as e:
+                logging.warning("Erro ao renovar o heartbeat do diário: %s", e)
+
+    def close(self):
+        self._stop_event.set()
+        self._heartbeat.join()
+        self.conn.close()
+
+    def get(self, kind, key):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT kind, key, state, attempts, result, error, updated_at FROM units WHERE kind = ? AND key = ?",
+                (kind, key)).fetchone()
+        if row is None:
+            return None
+        unit = Unit(*row)
+        return unit._replace(result=json.loads(unit.result) if unit.result is not None else None)
+
+    def is_done(self, kind, key):
+        unit = self.get(kind, key)
+        return unit is not None and unit.state == DONE
+
+    def _set(self, kind, key, state, result=None, error=None, attempt=False):
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO units (kind, key, state, attempts, result, error, updated_at, owner, heartbeat_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (kind, key) DO UPDATE SET state = excluded.state, attempts = attempts + ?, "
+                "result = excluded.result, error = excluded.error, updated_at = excluded.updated_at, "
+                "owner = excluded.owner, heartbeat_at = excluded.heartbeat_at",
+                (kind, key, state, int(attempt), None if result is None else json.dumps(result, ensure_ascii=False),
+                 error, now, self.owner, now, int(attempt)))
+
+    def start(self, kind, key):
+        self._set(kind, key, RUNNING, attempt=True)
+
+    def finish(self, kind, key, result=None):
+        self._set(kind, key, DONE, result=result)
+        metrics.inc("journal_units", kind=kind, state=DONE)
+
+    def fail(self, kind, key, error):
+        self._set(kind, key, FAILED, error=error)
+        metrics.inc("journal_units", kind=kind, state=FAILED)
+
+    # Executa uma unidade de trabalho pelo diário: concluída antes, devolve o resultado
+    # gravado; senão roda func com até `retries` novas tentativas. Esgotadas as
+    # tentativas a unidade fica como falha (para a próxima execução) e retorna None,
+    # ou repassa o erro com raise_errors (unidades dentro de outra unidade).
+    # Erros em `fatal` (ex.: autenticação) interrompem a execução inteira.
+    def run(self, kind, key, func, *args, fatal=(), retries=None, raise_errors=False, **kwargs):
+        retries = self.retries if retries is None else retries
+        unit = self.get(kind, key)
+        if unit is not None and unit.state == DONE:
+            metrics.inc("journal_skipped", kind=kind)
+            return unit.result
+
+        for attempt in range(retries + 1):
+            self.start(kind, key)
+            try:
+                result = func(*args, **kwargs)
+            except fatal as e:
+                self.fail(kind, key, f"{type(e).__name__}: {e}")
+                raise
+            except Exception as e:
+                self.fail(kind, key, f"{type(e).__name__}: {e}")
+                if attempt == retries:
+                    logging.error("Unidade %s %s falhou após %d tentativas: %s", kind, key, attempt + 1, e)
+                    if raise_errors:
+                        raise
+                    return None
+                delay = self.backoff * 2 ** attempt
+                logging.warning("Unidade %s %s falhou (%s); nova tentativa em %.1fs.", kind, key, e, delay)
+                time.sleep(delay)
+            else:
+                self.finish(kind, key, result)
+                return result
+
+    # Resumo por tipo de unidade e estado
+    def status(self):
+        with self._lock:
+            rows = self.conn.execute("SELECT kind, state, COUNT(*), SUM(attempts) FROM units GROUP BY kind, state ORDER BY kind, state").fetchall()
+            failures = self.conn.execute("SELECT kind, key, error FROM units WHERE state = ? ORDER BY updated_at", (FAILED,)).fetchall()
+        summary = {}
+        for kind, state, count, attempts in rows:
+            summary.setdefault(kind, {})[state] = {"units": count, "attempts": attempts}
+        return {"units": summary, "failed": [{"kind": kind, "key": key, "error": error} for kind, key, error in failures]}
+
+    # Apaga unidades (todas, de um tipo ou só as de um estado) para refazê-las do zero
+    def reset(self, kind=None, state=None):
+        query, params = "DELETE FROM units WHERE 1 = 1", []
+        if kind:
+            query, params = query + " AND kind = ?", params + [kind]
+        if state:
+            query, params = query + " AND state = ?", params + [state]
+        with self._lock, self.conn:
+            return self.conn.execute(query, params).rowcount
@@ -0,0 +1,315 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import zlib
+import logging
+import threading
+from collections import namedtuple
+
+from . import config, metrics
+
+# Divisão de uma execução entre vários processos (ou máquinas) sem sobreposição.
+# Cada fatia do trabalho (uma pasta de cliente da carteira ou um grupo de arquivos
+# pelo hash do nome) é um "shard" em um banco SQLite compartilhado. Um processo
+# reivindica um shard livre com um arrendamento (lease) por tempo limitado e o
+# renova enquanto trabalha; se o processo morrer, o lease expira e outro processo
+# assume o shard. Em várias máquinas o banco fica em uma pasta de rede: por isso
+# o modo de journal padrão (rollback) do SQLite, e não o WAL, que exige memória
+# compartilhada entre os processos.
+
+Shard = namedtuple('Shard', ['name', 'kind', 'payload', 'state', 'owner', 'expires_at', 'attempts', 'error'])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS shards (
+    name TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT,
+    state TEXT NOT NULL,
+    owner TEXT,
+    expires_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS shards_state ON shards (kind, state);
+"""
+
+PENDING, LEASED, DONE, FAILED = "pending", "leased", "done", "failed"
+
+# Duração padrão do lease (segundos); renovado a cada terço desse tempo
+DEFAULT_TTL = 120
+# Tentativas de um shard antes de ficar como falha
+MAX_ATTEMPTS = 3
+
+
+# Identificação do processo dono dos leases
+def default_owner():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+# Função para distribuir um nome entre n grupos de forma estável em todas as máquinas
+def bucket_of(name, buckets):
+    return zlib.crc32(name.encode('utf-8')) % buckets
+
+
+class LeaseStore:
+    def __init__(self, path=config.LEASES_PATH, owner=None, ttl=DEFAULT_TTL):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.owner = owner or default_owner()
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # isolation_level=None: as transações são abertas à mão com BEGIN IMMEDIATE
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    # Executa func(conn) em uma transação de escrita (BEGIN IMMEDIATE trava o banco
+    # para os outros processos até o COMMIT)
+    def _transaction(self, func):
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(self.conn)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return result
+
+    def _update(self, query, params):
+        return self._transaction(lambda conn: conn.execute(query, params).rowcount)
+
+    # Cadastra os shards da execução; os já cadastrados (por outro processo) ficam como estão
+    def seed(self, kind, shards):
+        self._transaction(lambda conn: conn.executemany(
+            "INSERT OR IGNORE INTO shards (name, kind, payload, state) VALUES (?, ?, ?, ?)",
+            [(name, kind, payload, PENDING) for name, payload in shards]))
+
+    # Lease expirado na última tentativa: o dono morreu e ninguém mais pode assumir o
+    # shard, que vira falha (aparece no status em vez de ficar preso como reservado)
+    def _expire(self, conn, now):
+        expired = conn.execute(
+            "UPDATE shards SET state = ?, expires_at = NULL, error = 'lease expirado na última tentativa (' || COALESCE(owner, '?') || ')' "
+            "WHERE state = ? AND expires_at < ? AND attempts >= ?",
+            (FAILED, LEASED, now, MAX_ATTEMPTS)).rowcount
+        if expired:
+            logging.warning("%d shards com lease expirado na última tentativa marcados como falha.", expired)
+            metrics.inc("shards_failed", expired)
+        return expired
+
+    # Reivindica um shard livre: pendente, com falha ainda com tentativas ou com lease expirado
+    def claim(self, kind):
+        def _claim(conn):
+            now = time.time()
+            self._expire(conn, now)
+            row = conn.execute(
+                "SELECT name FROM shards WHERE kind = ? AND attempts < ? AND (state IN (?, ?) OR (state = ? AND expires_at < ?)) "
+                "ORDER BY attempts, name LIMIT 1",
+                (kind, MAX_ATTEMPTS, PENDING, FAILED, LEASED, now)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE shards SET state = ?, owner = ?, expires_at = ?, attempts = attempts + 1 WHERE name = ?",
+                         (LEASED, self.owner, now + self.ttl, row[0]))
+            return conn.execute("SELECT name, kind, payload, state, owner, expires_at, attempts, error FROM shards WHERE name = ?",
+                                (row[0],)).fetchone()
+
+        row = self._transaction(_claim)
+        if row is None:
+            return None
+        shard = Shard(*row)
+        if shard.attempts > 1:
+            metrics.inc("shards_reclaimed", kind=kind)
+        metrics.inc("shards_claimed", kind=kind)
+        return shard
+
+    # Renova o lease; False se o shard foi assumido por outro processo
+    def renew(self, name):
+        return self._update("UPDATE shards SET expires_at = ? WHERE name = ? AND owner = ? AND state = ?",
+                            (time.time() + self.ttl, name, self.owner, LEASED)) == 1
+
+    def complete(self, name):
+        self._update("UPDATE shards SET state = ?, expires_at = NULL, error = NULL WHERE name = ? AND owner = ?",
+                     (DONE, name, self.owner))
+        metrics.inc("shards_done")
+
+    def fail(self, name, error):
+        self._update("UPDATE shards SET state = ?, expires_at = NULL, error = ? WHERE name = ? AND owner = ?",
+                     (FAILED, error, name, self.owner))
+        metrics.inc("shards_failed")
+
+    # Há shards de outros processos ainda em andamento (ou que podem expirar e voltar)?
+    def has_live(self, kind):
+        with self._lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM shards WHERE kind = ? AND state = ? AND (expires_at >= ? OR attempts < ?)",
+                (kind, LEASED, time.time(), MAX_ATTEMPTS)).fetchone()[0] > 0
+
+    def status(self, kind=None):
+        self._transaction(lambda conn: self._expire(conn, time.time()))
+        query = "SELECT kind, state, COUNT(*) FROM shards" + (" WHERE kind = ?" if kind else "") + " GROUP BY kind, state"
+        with self._lock:
+            rows = self.conn.execute(query, (kind,) if kind else ()).fetchall()
+            leases = self.conn.execute("SELECT name, owner, expires_at FROM shards WHERE state = ? ORDER BY name", (LEASED,)).fetchall()
+            failures = self.conn.execute("SELECT name, attempts, error FROM shards WHERE state = ? ORDER BY name", (FAILED,)).fetchall()
+        summary = {}
+        for shard_kind, state, count in rows:
+            summary.setdefault(shard_kind, {})[state] = count
+        now = time.time()
+        return {
+            "shards": summary,
+            "leased": [{"name": name, "owner": owner, "expires_in": round(expires_at - now, 1)} for name, owner, expires_at in leases],
+            "failed": [{"name": name, "attempts": attempts, "error": error} for name, attempts, error in failures],
+        }
+
+    # Estado de cada shard cadastrado de um tipo: {nome: estado}
+    def states(self, kind):
+        with self._lock:
+            return dict(self.conn.execute("SELECT name, state FROM shards WHERE kind = ?", (kind,)).fetchall())
+
+    def reset(self, kind=None):
+        return self._update("DELETE FROM shards" + (" WHERE kind = ?" if kind else ""), (kind,) if kind else ())
+
+
+# Renovação do lease em segundo plano enquanto o shard é processado
+class _Heartbeat(threading.Thread):
+    def __init__(self, store, name):
+        super().__init__(daemon=True)
+        self.store = store
+        self.shard_name = name
+        self.lost = False
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.store.ttl / 3):
+            try:
+                if not self.store.renew(self.shard_name):
+                    self.lost = True
+                    logging.warning("Lease do shard %s perdido para outro processo.", self.shard_name)
+                    return
+            except sqlite3.Error as e:
+                logging.warning("Erro ao renovar o lease do shard %s: %s", self.shard_name, e)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+# Função para consumir os shards de um tipo até acabarem: processa cada shard
+# reivindicado com func(shard) e, sem shards livres, espera os leases dos outros
+# processos terminarem ou expirarem (shards de processos mortos são assumidos)
+def work(store, kind, func, poll_seconds=5):
+    processed = 0
+    while True:
+        shard = store.claim(kind)
+        if shard is None:
+            if not store.has_live(kind):
+                break
+            time.sleep(poll_seconds)
+            continue
+
+        logging.info("Shard %s reivindicado por %s (tentativa %d).", shard.name, store.owner, shard.attempts)
+        heartbeat = _Heartbeat(store, shard.name)
+        heartbeat.start()
+        try:
+            with metrics.stage("shard"):
+                func(shard)
+        except Exception as e:
+            heartbeat.stop()
+            logging.error("Shard %s falhou: %s", shard.name, e)
+            store.fail(shard.name, f"{type(e).__name__}: {e}")
+            continue
+        heartbeat.stop()
+        if heartbeat.lost:
+            logging.warning("Shard %s concluído depois de perder o lease; o resultado do outro processo prevalece.", shard.name)
+            continue
+        store.complete(shard.name)
+        processed += 1
+    logging.info("%s: %d shards processados por %s.", kind, processed, store.owner)
+    return processed
+
+
+# Função para cadastrar os shards de cópia: uma pasta de cliente do plano (por padrão,
+# as liberadas em FOLDERS_ACCESS) de cada carteira
+def seed_copy_shards(store, source, carteira_urls, config_file_path=config.CONFIG_FILE_PATH, plan=None):
+    if plan is None:
+        from .crawl_rules import compile_plan
+        plan = compile_plan(config_file_path)
+
+    shards = []
+    for carteira_url in carteira_urls:
+        for folder in plan.client_folders(source, carteira_url):
+            shards.append((f"copy:{folder.path}", json.dumps({"name": folder.name, "path": folder.path}, ensure_ascii=False)))
+    store.seed("copy", shards)
+    return len(shards)
+
+
+# Função para copiar as pastas de clientes da carteira, dividindo-as entre os processos
+def copy_sharded(store, source, target, carteira_urls, config_file_path=config.CONFIG_FILE_PATH, years=range(2024, 2025),
+                 dedup=None, journal=None, plan=None):
+    from .crawl import copy_client_folders
+    from .crawl_rules import compile_plan
+    from .storage import StorageEntry
+
+    plan = plan or compile_plan(config_file_path)
+    logging.info("%d pastas de clientes cadastradas como shards.", seed_copy_shards(store, source, carteira_urls, config_file_path, plan))
+
+    def copy_shard(shard):
+        folder = json.loads(shard.payload)
+        copy_client_folders(source, target, [StorageEntry(folder["name"], folder["path"], True, None, None)], years, dedup, journal, plan)
+
+    return work(store, "copy", copy_shard)
+
+
+def _shard_output_dir(shard_name):
+    return os.path.join(config.OUTPUT_DIR, "shards", shard_name.replace(':', '-').replace('/', '-'))
+
+
+# Função para extrair as guias da landing zone dividindo os arquivos em `buckets`
+# grupos pelo hash do nome. Cada shard grava o próprio JSON; ao fim, o processo
+# que encontra todos os shards concluídos junta as saídas em consolidated_data.json.
+def ocr_sharded(store, storage, folder_url=config.GUIAS_FOLDER_URL, buckets=8, output_json_path=None, **ocr_options):
+    from . import ocr
+
+    shards = [(f"ocr:{bucket:03d}-of-{buckets:03d}", json.dumps({"bucket": bucket, "buckets": buckets})) for bucket in range(buckets)]
+    store.seed("ocr", shards)
+
+    def ocr_shard(shard):
+        payload = json.loads(shard.payload)
+        file_names = [name for name in storage.list_pdfs(folder_url) if bucket_of(name, payload["buckets"]) == payload["bucket"]]
+        output_path = os.path.join(_shard_output_dir(shard.name), "consolidated_data.json")
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        if not file_names:
+            ocr.save_texts_to_json([], output_path)
+            return
+        logging.info("Shard %s: %d arquivos.", shard.name, len(file_names))
+        ocr.run(storage, folder_url, file_names=file_names, output_json_path=output_path, **ocr_options)
+
+    processed = work(store, "ocr", ocr_shard)
+    # Só os shards desta divisão: saídas de execuções com outro --buckets ficam de fora
+    shard_names = [name for name, _ in shards]
+    states = store.states("ocr")
+    if all(states.get(name) == DONE for name in shard_names):
+        merge_shard_outputs(shard_names, output_json_path)
+    return processed
+
+
+# Função para juntar os JSONs dos shards informados, na ordem dos shards
+def merge_shard_outputs(shard_names, output_json_path=None):
+    output_json_path = output_json_path or os.path.join(config.OUTPUT_DIR, "consolidated_data.json")
+    records = []
+    for shard_name in sorted(shard_names):
+        path = os.path.join(_shard_output_dir(shard_name), "consolidated_data.json")
+        if not os.path.exists(path):
+            logging.warning("Shard %s concluído sem saída em %s.", shard_name, path)
+            continue
+        with open(path, 'r', encoding='utf-8') as json_file:
+            records.extend(json.load(json_file))
+    with open(output_json_path + ".tmp", 'w', encoding='utf-8') as json_file:
+        json.dump(records, json_file, ensure_ascii=False, indent=4)
+    os.replace(output_json_path + ".tmp", output_json_path)
+    logging.info("%d registros dos shards salvos em %s", len(records), output_json_path)
+    return records
@@ -0,0 +1,100 @@
+import re
+import logging
+
+from . import config
+
+# Campos com o nome do arquivo de origem nos registros do ocr e do parse
+FILE_NAME_FIELDS = ("Nome do Arquivo", "File Name")
+
+
+# Função para limpar os nomes dos campos
+def clean_field_name(field_name):
+    # Remover caracteres não permitidos
+    return re.sub(r'[^\w]', '_', field_name)
+
+
+# Função para limpar os nomes dos campos de todos os registros
+def clean_records(json_data):
+    return [{clean_field_name(key): value for key, value in record.items()} for record in json_data]
+
+
+# Função para carregar o JSON consolidado na tabela do BigQuery. O JSON é lido direto
+# para um lote em colunas (batch.GuiaBatch), sem a lista de dicts nem a cópia limpa.
+# A tabela é substituída pelo conteúdo do JSON, inclusive as linhas acrescentadas pelo
+# daemon: o JSON precisa ser o consolidado de toda a landing zone.
+def load_to_bigquery(json_file_path, project_id=config.BIGQUERY_PROJECT_ID, dataset_id=config.BIGQUERY_DATASET_ID,
+                     table_id=config.BIGQUERY_TABLE_ID, credentials_path=config.BIGQUERY_CREDENTIALS_PATH):
+    from .batch import GuiaBatch
+
+    load_records(GuiaBatch.from_json(json_file_path), project_id, dataset_id, table_id, credentials_path, append=False)
+
+
+# Função para carregar registros (lista de dicts ou GuiaBatch) no BigQuery: substituindo
+# a tabela (carga do lote inteiro) ou acrescentando (ingestão contínua do daemon). Ao
+# acrescentar, as linhas já carregadas dos mesmos arquivos são apagadas antes, então
+# carregar de novo uma guia (reenviada, modificada ou já presente da carga do lote)
+# não duplica as linhas. `file_names` acrescenta arquivos que talvez não tenham
+# registros agora (ex.: guia reenviada em que o OCR não achou nada).
+def load_records(records, project_id=config.BIGQUERY_PROJECT_ID, dataset_id=config.BIGQUERY_DATASET_ID,
+                 table_id=config.BIGQUERY_TABLE_ID, credentials_path=config.BIGQUERY_CREDENTIALS_PATH, append=False, file_names=()):
+    from google.cloud import bigquery
+    from google.oauth2 import service_account
+
+    from .batch import GuiaBatch
+
+    credentials = service_account.Credentials.from_service_account_file(credentials_path)
+    client = bigquery.Client(credentials=credentials, project=project_id)
+    table_ref = client.dataset(dataset_id).table(table_id)
+
+    job_config = bigquery.LoadJobConfig(
+        source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+        autodetect=True,
+        write_disposition=bigquery.WriteDisposition.WRITE_APPEND if append else bigquery.WriteDisposition.WRITE_TRUNCATE,
+    )
+
+    if append:
+        _delete_files(client, bigquery, table_ref, records, file_names)
+        if not len(records):
+            return
+
+    # Carregar dados para o BigQuery e esperar até o job completar. O lote vai como
+    # NDJSON com os nomes limpos, gerado coluna a coluna.
+    if isinstance(records, GuiaBatch):
+        with records.to_ndjson_stream(clean_field_name) as ndjson_stream:
+            load_job = client.load_table_from_file(ndjson_stream, table_ref, job_config=job_config)
+            load_job.result()
+    else:
+        load_job = client.load_table_from_json(clean_records(records), table_ref, job_config=job_config)
+        load_job.result()
+
+    logging.info("%d registros carregados para %s.%s", len(records), dataset_id, table_id)
+
+
+# Função para apagar da tabela as linhas dos arquivos presentes em `records` (nomes da
+# landing zone, únicos por guia copiada)
+def _delete_files(client, bigquery, table_ref, records, file_names=()):
+    from google.api_core.exceptions import NotFound
+
+    from .batch import GuiaBatch
+
+    names = {clean_field_name(field): set(file_names) for field in FILE_NAME_FIELDS}
+    for record in (records.iter_records() if isinstance(records, GuiaBatch) else records):
+        for field in FILE_NAME_FIELDS:
+            if record.get(field):
+                names[clean_field_name(field)].add(record[field])
+    if not any(names.values()):
+        return
+    try:
+        table = client.get_table(table_ref)
+    except NotFound:
+        return
+    columns = {field.name for field in table.schema}
+    for column, column_names in names.items():
+        if column not in columns or not column_names:
+            continue
+        job_config = bigquery.QueryJobConfig(query_parameters=[bigquery.ArrayQueryParameter("names", "STRING", sorted(column_names))])
+        query_job = client.query(f"DELETE FROM `{table.project}.{table.dataset_id}.{table.table_id}` WHERE {column} IN UNNEST(@names)",
+                                 job_config=job_config)
+        query_job.result()
+        logging.info("%d linhas anteriores de %d arquivos apagadas de %s.", query_job.num_dml_affected_rows or 0, len(column_names),
+                     table.table_id)
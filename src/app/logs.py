@@ -0,0 +1,207 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+import contextlib
+import contextvars
+import logging.handlers
+
+# Logging fora do caminho crítico. O processo só enfileira o registro (sem formatar
+# a mensagem nem escrever no terminal); uma thread de fundo formata e grava. Cada
+# registro leva o identificador da execução e, quando houver, o arquivo e a página
+# em processamento. Mensagens repetitivas por item (uma por página, por arquivo
+# copiado, por imagem apagada) passam por amostragem: até `burst` por intervalo
+# para cada modelo de mensagem; as demais são só contadas e o total suprimido vai
+# na próxima que passar. Avisos e erros nunca são amostrados.
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Amostragem padrão: até 20 mensagens iguais (mesmo modelo) a cada 10 segundos
+SAMPLE_BURST = 20
+SAMPLE_INTERVAL = 10.0
+
+# Atributos do módulo logging desligados durante o setup (e restaurados no shutdown)
+LOG_FLAGS = ("logThreads", "logProcesses", "logMultiprocessing")
+
+# Arquivo e página em processamento, por thread/tarefa
+_file = contextvars.ContextVar("file", default=None)
+_page = contextvars.ContextVar("page", default=None)
+
+# Identificador da execução (vale para todas as threads) e handlers de escrita
+_state = {"run_id": None, "handlers": None, "flags": None}
+_listener = None
+
+
+def new_run_id():
+    return f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+
+
+# Define o arquivo e/ou a página dos registros emitidos dentro do bloco
+@contextlib.contextmanager
+def log_context(file=None, page=None):
+    tokens = []
+    if file is not None:
+        tokens.append((_file, _file.set(file)))
+    if page is not None:
+        tokens.append((_page, _page.set(page)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+# Anexa ao registro o contexto de quem emitiu (roda na thread do emissor)
+class ContextFilter(logging.Filter):
+    def filter(self, record):
+        record.run_id = _state["run_id"]
+        record.file = _file.get()
+        record.page = _page.get()
+        return True
+
+
+# Amostragem por modelo de mensagem (record.msg, antes da formatação): por isso as
+# chamadas nos laços usam argumentos ("%s") e não f-strings
+class SampleFilter(logging.Filter):
+    def __init__(self, burst=SAMPLE_BURST, interval=SAMPLE_INTERVAL):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.burst:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window is not None else 0
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if window[1] < self.burst:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for field in ("run_id", "file", "page", "suppressed"):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        line = super().format(record)
+        suppressed = getattr(record, "suppressed", None)
+        if suppressed:
+            line += f" (+{suppressed} mensagens iguais suprimidas)"
+        return line
+
+
+# O QueueHandler padrão formata a mensagem na thread de quem emitiu; aqui o registro
+# vai para a fila como está e a formatação fica para a thread de fundo. Os argumentos
+# são referências: objetos mutáveis alterados logo depois podem sair com o valor novo.
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        return record
+
+
+# Função para configurar o logging do processo: fila + thread de escrita no stderr
+# (e em `log_file`, se informado), em texto ou JSON lines
+def setup(level=logging.INFO, json_format=False, log_file=None, sample_burst=SAMPLE_BURST, sample_interval=SAMPLE_INTERVAL,
+          run_id=None):
+    global _listener
+    shutdown()
+    _state["run_id"] = run_id or new_run_id()
+
+    # Nenhum formato usa thread ou processo de origem: sem eles, criar o registro não
+    # consulta threading/multiprocessing. Os valores anteriores voltam no shutdown.
+    _state["flags"] = {flag: getattr(logging, flag) for flag in LOG_FLAGS}
+    for flag in LOG_FLAGS:
+        setattr(logging, flag, False)
+
+    formatter = JsonFormatter() if json_format else TextFormatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if log_file:
+        os.makedirs(os.path.dirname(log_file) or '.', exist_ok=True)
+        handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    queue_handler.addFilter(SampleFilter(sample_burst, sample_interval))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    _state["handlers"] = handlers
+    return _state["run_id"]
+
+
+def run_id():
+    return _state["run_id"]
+
+
+# Esvazia a fila e para a thread de escrita (chamado também na saída do processo)
+def shutdown():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    if _state["flags"] is not None:
+        for flag, value in _state["flags"].items():
+            setattr(logging, flag, value)
+        _state["flags"] = None
+
+
+atexit.register(shutdown)
+
+
+# Processos filhos criados por fork (pools de OCR, relatórios, SPED) herdam o
+# QueueHandler mas não a thread de escrita: neles os registros vão direto aos handlers
+def _after_fork_in_child():
+    global _listener
+    handlers = _state["handlers"]
+    if handlers is None or _listener is None:
+        return
+    _listener = None
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, _DeferredQueueHandler):
+            root.removeHandler(handler)
+            for fork_handler in handlers:
+                fork_handler.filters = list(handler.filters)
+                root.addHandler(fork_handler)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
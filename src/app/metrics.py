@@ -0,0 +1,283 @@
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+# Métricas do pipeline (contadores, timers e histogramas) gravadas ao fim de cada
+# execução como resumo JSON e textfile do Prometheus, e perfis opcionais por etapa.
+
+PREFIX = "rpa_contabil"
+
+# Limites (em segundos) dos buckets dos histogramas de duração
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Buckets para tamanhos de arquivo (bytes) e páginas por arquivo
+SIZE_BUCKETS = (16e3, 64e3, 256e3, 1e6, 4e6, 16e6, 64e6)
+PAGE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+# Etapas instrumentadas
+STAGES = ["crawl", "copy", "download", "render", "enhance", "ocr", "parse"]
+
+_lock = threading.Lock()
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+    # Contagens acumuladas por bucket, como o Prometheus espera
+    def cumulative(self):
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "buckets": {str(bound): count for bound, count in self.cumulative()},
+        }
+
+
+class Registry:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.counters = {}
+        self.histograms = {}
+        self.started_at = time.time()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with _lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=DEFAULT_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with _lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    # Retorna os valores acumulados e zera o registro (usado pelos processos de trabalho)
+    def drain(self):
+        with _lock:
+            snapshot = (self.counters, self.histograms)
+            self.counters = {}
+            self.histograms = {}
+        return snapshot
+
+    # Soma ao registro os valores drenados de outro processo
+    def merge(self, snapshot):
+        counters, histograms = snapshot
+        with _lock:
+            for key, value in counters.items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            for key, other in histograms.items():
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    self.histograms[key] = other
+                    continue
+                histogram.counts = [a + b for a, b in zip(histogram.counts, other.counts)]
+                histogram.count += other.count
+                histogram.sum += other.sum
+                histogram.min = other.min if histogram.min is None else min(histogram.min, other.min if other.min is not None else histogram.min)
+                histogram.max = other.max if histogram.max is None else max(histogram.max, other.max if other.max is not None else histogram.max)
+
+    def summary(self):
+        counters = {}
+        for (name, labels), value in sorted(self.counters.items()):
+            counters.setdefault(name, {})[_label_str(labels) or "total"] = value
+        histograms = {}
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            histograms.setdefault(name, {})[_label_str(labels) or "total"] = histogram.to_dict()
+        return {
+            "started_at": self.started_at,
+            "duration_seconds": round(time.time() - self.started_at, 6),
+            "counters": counters,
+            "histograms": histograms,
+        }
+
+    def prometheus(self):
+        lines = []
+        for name in sorted({name for name, _ in self.counters}):
+            metric = f"{PREFIX}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for (counter_name, labels), value in sorted(self.counters.items()):
+                if counter_name == name:
+                    lines.append(f"{metric}{_prom_labels(labels)} {value}")
+        for name in sorted({name for name, _ in self.histograms}):
+            metric = f"{PREFIX}_{name}"
+            lines.append(f"# TYPE {metric} histogram")
+            for (histogram_name, labels), histogram in sorted(self.histograms.items()):
+                if histogram_name != name:
+                    continue
+                for bound, count in histogram.cumulative():
+                    lines.append(f"{metric}_bucket{_prom_labels(labels + (('le', str(bound)),))} {count}")
+                lines.append(f"{metric}_bucket{_prom_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+                lines.append(f"{metric}_sum{_prom_labels(labels)} {histogram.sum}")
+                lines.append(f"{metric}_count{_prom_labels(labels)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+
+def _label_str(labels):
+    return ','.join(f"{key}={value}" for key, value in labels)
+
+
+def _prom_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return "{" + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+
+registry = Registry()
+
+
+def inc(name, value=1, **labels):
+    registry.inc(name, value, **labels)
+
+
+def observe(name, value, buckets=DEFAULT_BUCKETS, **labels):
+    registry.observe(name, value, buckets, **labels)
+
+
+class _Profiles:
+    def __init__(self):
+        self.stages = set()
+        self.profiler = "pyinstrument"
+        self.output_dir = None
+        self.active = {}
+        self.running = None
+
+
+_profiles = _Profiles()
+
+
+# Função para habilitar o profiling das etapas informadas (pyinstrument ou cProfile)
+def enable_profiling(stages, profiler="pyinstrument", output_dir="data/output/profiles"):
+    _profiles.stages = set(stages)
+    _profiles.profiler = profiler
+    _profiles.output_dir = output_dir
+
+
+def _start_profile(name):
+    profiler = _profiles.active.get(name)
+    if profiler is None:
+        if _profiles.profiler == "pyinstrument":
+            try:
+                from pyinstrument import Profiler
+                profiler = Profiler()
+            except ImportError:
+                logging.warning("pyinstrument não instalado; usando cProfile para a etapa %s.", name)
+                _profiles.profiler = "cprofile"
+        if profiler is None:
+            import cProfile
+            profiler = cProfile.Profile()
+        _profiles.active[name] = profiler
+    if isinstance(profiler, _cprofile_type()):
+        profiler.enable()
+    else:
+        profiler.start()
+
+
+def _stop_profile(name):
+    profiler = _profiles.active[name]
+    if isinstance(profiler, _cprofile_type()):
+        profiler.disable()
+    else:
+        profiler.stop()
+
+
+def _cprofile_type():
+    import cProfile
+    return cProfile.Profile
+
+
+# Função para gravar os perfis acumulados de cada etapa
+def save_profiles():
+    if not _profiles.active:
+        return []
+    os.makedirs(_profiles.output_dir, exist_ok=True)
+    timestamp = time.strftime("%Y%m%d-%H%M%S")
+    paths = []
+    for name, profiler in _profiles.active.items():
+        if isinstance(profiler, _cprofile_type()):
+            path = os.path.join(_profiles.output_dir, f"{name}-{timestamp}.prof")
+            profiler.dump_stats(path)
+        else:
+            path = os.path.join(_profiles.output_dir, f"{name}-{timestamp}.html")
+            with open(path, 'w', encoding='utf-8') as profile_file:
+                profile_file.write(profiler.output_html())
+        logging.info("Perfil da etapa %s salvo em %s", name, path)
+        paths.append(path)
+    _profiles.active.clear()
+    return paths
+
+
+# Context manager que mede a duração de uma etapa e, se habilitado, a perfila
+@contextmanager
+def stage(name):
+    # Só um perfilador roda por vez: etapas aninhadas (download dentro de copy)
+    # entram no perfil da etapa externa
+    profiled = False
+    if name in _profiles.stages:
+        with _lock:
+            if _profiles.running is None:
+                _profiles.running = name
+                profiled = True
+        if profiled:
+            _start_profile(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe("stage_seconds", time.perf_counter() - start, stage=name)
+        if profiled:
+            _stop_profile(name)
+            with _lock:
+                _profiles.running = None
+
+
+# Função para gravar o resumo JSON e o textfile do Prometheus ao fim da execução
+def write_reports(output_dir, command=None):
+    os.makedirs(output_dir, exist_ok=True)
+    summary = registry.summary()
+    summary["command"] = command
+    json_path = os.path.join(output_dir, "metrics.json")
+    with open(json_path, 'w', encoding='utf-8') as json_file:
+        json.dump(summary, json_file, ensure_ascii=False, indent=4)
+
+    # Grava em arquivo temporário e renomeia, para o node_exporter nunca ler um arquivo pela metade
+    prom_path = os.path.join(output_dir, "metrics.prom")
+    with open(prom_path + ".tmp", 'w', encoding='utf-8') as prom_file:
+        prom_file.write(registry.prometheus())
+    os.replace(prom_path + ".tmp", prom_path)
+
+    logging.info("Métricas salvas em %s e %s", json_path, prom_path)
+    save_profiles()
+    return json_path, prom_path
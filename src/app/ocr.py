@@ -0,0 +1,444 @@
+import os
+import re
+import json
+import logging
+
+import cv2
+import fitz  # PyMuPDF
+
+from . import config, logs, metrics
+from .parser import process_text_and_generate_json
+
+# Marcação de guia com vários lotes no nome do arquivo
+MULTI_GUIA_PATTERN = re.compile(r'\(\d+ lotes?\)', re.IGNORECASE)
+# Marcação explícita de guia única no nome do arquivo (padrão extra: SINGLE_GUIA_PATTERN no .env)
+SINGLE_GUIA_PATTERN = re.compile(r'\(1 lote\)', re.IGNORECASE)
+
+
+# Função para abrir o PDF do storage: direto do disco no espelho local, em memória no SharePoint.
+# Retorna o documento, o SHA-256 e o tamanho em bytes do arquivo.
+def open_pdf(storage, server_relative_url):
+    from .dedup import sha256_of
+
+    local_path = storage.local_path(server_relative_url)
+    if local_path:
+        check_pdf_exists(local_path)
+        with storage.open_stream(server_relative_url) as stream:
+            digest = sha256_of(stream)
+        try:
+            return fitz.open(local_path), digest, os.path.getsize(local_path)
+        except fitz.FileDataError as e:
+            logging.error("Erro ao abrir o arquivo PDF: %s", e)
+            raise ValueError(f"Arquivo {local_path} não é um PDF válido.")
+
+    content = storage.read_bytes(server_relative_url)
+    logging.info("Arquivo %s baixado com sucesso.", server_relative_url)
+    try:
+        return fitz.open(stream=content, filetype="pdf"), sha256_of(content), len(content)
+    except fitz.FileDataError as e:
+        logging.error("Erro ao abrir o arquivo PDF: %s", e)
+        # Log do conteúdo da resposta se não for um PDF válido
+        logging.error("Conteúdo da resposta: %s", content.decode('utf-8', errors='replace'))
+        raise ValueError(f"Arquivo {server_relative_url} não é um PDF válido.")
+
+
+# Função para obter um caminho local do PDF (para abrir em outros processos).
+# Na landing zone remota o arquivo é baixado para PDF_DIR e deve ser apagado depois.
+# Retorna (caminho, sha256, temporário).
+def fetch_pdf(storage, server_relative_url):
+    from .dedup import sha256_of
+
+    local_path = storage.local_path(server_relative_url)
+    if local_path:
+        check_pdf_exists(local_path)
+        with storage.open_stream(server_relative_url) as stream:
+            return local_path, sha256_of(stream), False
+
+    content = storage.read_bytes(server_relative_url)
+    logging.info("Arquivo %s baixado com sucesso.", server_relative_url)
+    digest = sha256_of(content)
+    os.makedirs(config.PDF_DIR, exist_ok=True)
+    local_path = os.path.join(config.PDF_DIR, f"{digest}.pdf")
+    with open(local_path, 'wb') as pdf_file:
+        pdf_file.write(content)
+    return local_path, digest, True
+
+
+# Função para verificar se o PDF existe
+def check_pdf_exists(file_path):
+    if not os.path.exists(file_path):
+        logging.error("Arquivo PDF não encontrado: %s", file_path)
+        raise FileNotFoundError(f"Arquivo PDF não encontrado: {file_path}")
+    else:
+        logging.info("Arquivo PDF encontrado: %s", file_path)
+
+
+# Função para renderizar uma página do PDF em imagem
+def render_page(doc, page_num, image_path, zoom=2):
+    with metrics.stage("render"):
+        page = doc.load_page(page_num)
+        # Aumenta a resolução da imagem
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+        pix.save(image_path)
+    metrics.inc("pages_rendered")
+    return image_path
+
+
+# Função para renderizar as páginas sob demanda: cada imagem só é gerada quando
+# o consumidor pede a próxima página
+def iter_page_images(doc, images_dir, zoom=2, pages=None):
+    for page_num in (range(len(doc)) if pages is None else pages):
+        image_path = os.path.join(images_dir, f"page_{page_num}.png")
+        yield page_num, render_page(doc, page_num, image_path, zoom)
+
+
+# Função para converter PDF em imagens (todas as páginas ou só as informadas)
+def convert_pdf_to_images(doc, images_dir, zoom=2, pages=None):
+    images = [image_path for _, image_path in iter_page_images(doc, images_dir, zoom, pages)]
+    logging.info("PDF convertido em %d imagens.", len(images))
+    return images
+
+
+# Função para saber se o arquivo sabidamente traz uma única guia (só então o OCR para
+# no primeiro registro completo). Guias com vários lotes vêm com a quantidade no nome,
+# ex.: "... 03.2024 (4 lotes).pdf"; nome sem marcação não basta. Sinais positivos:
+# "(1 lote)" ou SINGLE_GUIA_PATTERN no nome, PDF de uma página, ou camada de texto em
+# todas as páginas com uma única página de DARF.
+def is_single_guia(pdf_file_name, doc=None):
+    if MULTI_GUIA_PATTERN.search(pdf_file_name):
+        return False
+    if SINGLE_GUIA_PATTERN.search(pdf_file_name):
+        return True
+    extra_pattern = config.get_env('SINGLE_GUIA_PATTERN')
+    if extra_pattern and re.search(extra_pattern, pdf_file_name):
+        return True
+    if doc is None:
+        return False
+    if len(doc) == 1:
+        return True
+
+    from .classifier import MIN_KEYWORDS, MIN_TEXT_CHARS, count_keywords
+    darf_pages = 0
+    for page in doc:
+        text = page.get_text()
+        if len(text.strip()) < MIN_TEXT_CHARS:
+            # Página escaneada: não dá para contar as guias sem OCR
+            return False
+        if count_keywords(text) >= MIN_KEYWORDS:
+            darf_pages += 1
+    return darf_pages == 1
+
+
+# Função para melhorar a qualidade da imagem
+def enhance_image(image_path):
+    with metrics.stage("enhance"):
+        return _enhance_image(image_path)
+
+
+def _enhance_image(image_path):
+    image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+
+    # Redimensionar a imagem para uma maior resolução
+    image = cv2.resize(image, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
+
+    # Aplicar filtro de desfoque para reduzir ruído
+    image = cv2.medianBlur(image, 3)
+
+    # Aplicar filtro de limiarização adaptativa
+    image = cv2.adaptiveThreshold(image, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
+
+    enhanced_image_path = image_path.replace('.png', '_enhanced.png')
+    cv2.imwrite(enhanced_image_path, image)
+
+    return enhanced_image_path
+
+
+# Função para extrair texto das imagens com o motor de OCR informado (padrão: Google Vision)
+def extract_text_from_images(images, engine=None):
+    if engine is None:
+        from .ocr_engines import get_engine
+        engine = get_engine()
+    return engine.recognize(images)
+
+
+# Função para salvar textos extraídos em um arquivo JSON
+def save_texts_to_json(texts, output_path):
+    with open(output_path, 'w', encoding='utf-8') as json_file:
+        json.dump(texts, json_file, ensure_ascii=False, indent=4)
+    logging.info("Textos extraídos salvos em %s", output_path)
+
+
+# Função para apagar as imagens temporárias
+def delete_temp_files(images):
+    for image in images:
+        for path in (image, image.replace('.png', '_enhanced.png')):
+            if os.path.exists(path):
+                os.remove(path)
+                logging.debug("Imagem %s apagada.", path)
+
+
+# Função para escolher as páginas que valem o OCR segundo o pré-classificador
+def select_pages(pdf_file_name, doc, classifier):
+    selected = []
+    for page_num in range(len(doc)):
+        with metrics.stage("classify"):
+            decision = classifier.classify(doc.load_page(page_num))
+        if decision.ocr:
+            selected.append(page_num)
+        else:
+            metrics.inc("pages_skipped", reason=decision.reason)
+            logging.info("Página %d de %s ignorada pelo pré-classificador (%s).", page_num, pdf_file_name, decision.reason)
+    return selected
+
+
+# Chave de uma página no diário de trabalho: o conteúdo do arquivo e o número da página
+def page_key(file_sha256, page_num):
+    return f"{file_sha256}:{page_num}"
+
+
+# Função para separar as páginas de um PDF: as descartadas pelo pré-classificador
+# somem, as já vistas no índice de duplicatas trazem o texto gravado e o restante
+# fica pendente de OCR. Retorna (textos reaproveitados, páginas pendentes, fingerprints).
+def prepare_pages(pdf_file_name, doc, classifier=None, dedup=None, file_sha256=None, journal=None):
+    metrics.observe("pages_per_file", len(doc), metrics.PAGE_BUCKETS)
+    pages = select_pages(pdf_file_name, doc, classifier) if classifier is not None else list(range(len(doc)))
+
+    texts = {}
+    fingerprints = {}
+    if journal is not None:
+        # Páginas com OCR concluído numa execução anterior que não terminou
+        for page_num in pages:
+            unit = journal.get("ocr_page", page_key(file_sha256, page_num))
+            if unit is not None and unit.state == "done" and (unit.result or '').strip():
+                texts[page_num] = unit.result
+                metrics.inc("cache_hits", cache="journal_page")
+        pages = [page_num for page_num in pages if page_num not in texts]
+    if dedup is None:
+        return texts, pages, fingerprints
+
+    from .dedup import page_fingerprint
+    pending = []
+    for page_num in pages:
+        fingerprint = fingerprints[page_num] = page_fingerprint(doc.load_page(page_num))
+        cached = dedup.find_page(fingerprint, file_sha256, page_num)
+        if cached is None:
+            pending.append(page_num)
+        else:
+            texts[page_num] = cached
+            dedup.add_page(file_sha256, page_num, fingerprint, cached)
+            metrics.inc("cache_hits", cache="dedup_page")
+            logging.info("Página %d de %s idêntica a uma já processada; texto reaproveitado.", page_num, pdf_file_name)
+    return texts, pending, fingerprints
+
+
+# Função para gerar um registro por página (com o número da página) a partir dos textos.
+# Com o armazém de textos, todo texto reconhecido é guardado: o registro leva a
+# referência do texto bruto da página ("Texto") e as páginas que não viraram registro
+# ficam na lista de não lidas do armazém, para o reparse.
+def parse_pages(pdf_file_name, texts, text_store=None):
+    records = []
+    for page_num in sorted(texts):
+        ref = text_store.put(texts[page_num]) if text_store is not None and texts[page_num] else None
+        with metrics.stage("parse"):
+            processed_data = process_text_and_generate_json(texts[page_num], pdf_file_name, page_num)
+        if processed_data:
+            if ref is not None:
+                processed_data["Texto"] = ref
+            records.append(processed_data)
+            metrics.inc("records_extracted")
+        else:
+            if ref is not None:
+                text_store.add_unparsed(ref, pdf_file_name, page_num + 1)
+            metrics.inc("pages_skipped", reason="parse")
+    return records
+
+
+# Níveis da cascata de OCR, do mais barato ao mais caro: (nome, zoom, realce).
+# zoom None = camada de texto nativa do PDF, sem renderizar nem chamar o OCR.
+CASCADE_TIERS = [("native", None, False), ("fast", 1, False), ("full", 2, True)]
+
+
+# Função para obter o texto de uma página pela cascata: sobe de nível só enquanto o
+# texto não vira um registro válido (datas, número do documento, vencimento
+# posterior à apuração). Páginas que nenhum nível resolve ficam com o texto do último.
+def ocr_page_cascade(pdf_file_name, doc, page_num, images_dir, engine, tiers=CASCADE_TIERS):
+    if engine is None:
+        from .ocr_engines import get_engine
+        engine = get_engine()
+    from .ocr_engines import normalize_text
+
+    text = ""
+    with logs.log_context(page=page_num):
+        for tier, zoom, enhance in tiers:
+            if zoom is None:
+                text = normalize_text(doc.load_page(page_num).get_text())
+            else:
+                image_path = render_page(doc, page_num, os.path.join(images_dir, f"page_{page_num}_{tier}.png"), zoom)
+                try:
+                    text = engine.recognize_page(image_path, enhance=enhance)
+                finally:
+                    delete_temp_files([image_path])
+            if process_text_and_generate_json(text, pdf_file_name, page_num, quiet=True) is not None:
+                metrics.inc("cascade_pages", tier=tier)
+                return text
+    metrics.inc("cascade_pages", tier="unresolved")
+    return text
+
+
+# Função para reconhecer as páginas uma a uma, sob demanda (com ou sem cascata)
+def iter_page_texts(pdf_file_name, doc, pages, images_dir, engine, cascade=False):
+    if cascade:
+        for page_num in pages:
+            yield page_num, ocr_page_cascade(pdf_file_name, doc, page_num, images_dir, engine)
+        return
+    for page_num, image_path in iter_page_images(doc, images_dir, pages=pages):
+        try:
+            with logs.log_context(page=page_num):
+                text = extract_text_from_images([image_path], engine)[0]
+        finally:
+            delete_temp_files([image_path])
+        yield page_num, text
+
+
+# Função para resumir a fração de páginas resolvida em cada nível da cascata
+def cascade_summary():
+    counts = {dict(labels)["tier"]: value for (name, labels), value in metrics.registry.counters.items() if name == "cascade_pages"}
+    total = sum(counts.values())
+    if not total:
+        return {}
+    tiers = [tier for tier, _, _ in CASCADE_TIERS] + ["unresolved"]
+    return {tier: {"pages": counts.get(tier, 0), "share": round(counts.get(tier, 0) / total, 4)} for tier in tiers}
+
+
+# Função para processar um PDF de uma guia só: renderiza e reconhece uma página
+# por vez e para assim que sair um registro completo (o parser só devolve registros
+# com todos os campos validados). As páginas restantes nem são renderizadas.
+def process_single_guia(pdf_file_name, doc, images_dir, engine, texts, pending, on_text=None, cascade=False, text_store=None):
+    records = parse_pages(pdf_file_name, texts, text_store)
+    pages = iter(pending)
+    if not records:
+        for page_num, text in iter_page_texts(pdf_file_name, doc, pages, images_dir, engine, cascade):
+            if on_text is not None:
+                on_text(page_num, text)
+            records = parse_pages(pdf_file_name, {page_num: text}, text_store)
+            if records:
+                break
+    skip_remaining(pdf_file_name, list(pages))
+    return records
+
+
+def skip_remaining(pdf_file_name, pages):
+    if pages:
+        metrics.inc("pages_skipped", len(pages), reason="early_stop")
+        logging.info("Guia de %s completa; %d páginas restantes ignoradas.", pdf_file_name, len(pages))
+
+
+# Função para processar um PDF aberto e retornar os registros extraídos
+def process_pdf(pdf_file_name, doc, images_dir=config.IMAGES_DIR, engine=None, classifier=None, dedup=None, file_sha256=None,
+                early_stop=True, cascade=True, journal=None, text_store=None):
+    with logs.log_context(file=pdf_file_name):
+        texts, pending, fingerprints = prepare_pages(pdf_file_name, doc, classifier, dedup, file_sha256, journal)
+
+        def record_text(page_num, text):
+            if dedup is not None:
+                dedup.add_page(file_sha256, page_num, fingerprints[page_num], text)
+            # Texto vazio é falha do motor de OCR: a página não é marcada como concluída
+            if journal is not None and text and text.strip():
+                journal.finish("ocr_page", page_key(file_sha256, page_num), text)
+
+        if early_stop and is_single_guia(pdf_file_name, doc):
+            return process_single_guia(pdf_file_name, doc, images_dir, engine, texts, pending, record_text, cascade, text_store)
+
+        if cascade:
+            for page_num, text in iter_page_texts(pdf_file_name, doc, pending, images_dir, engine, cascade):
+                texts[page_num] = text
+                record_text(page_num, text)
+            return parse_pages(pdf_file_name, texts, text_store)
+
+        images = convert_pdf_to_images(doc, images_dir, pages=pending)
+        try:
+            for page_num, text in zip(pending, extract_text_from_images(images, engine)):
+                texts[page_num] = text
+                record_text(page_num, text)
+            return parse_pages(pdf_file_name, texts, text_store)
+        finally:
+            delete_temp_files(images)
+
+
+# Função para listar os PDFs a processar (todos da pasta ou só os informados)
+def list_target_pdfs(storage, folder_url, file_names=None):
+    pdf_files = storage.list_pdfs(folder_url)
+    if file_names:
+        missing = [name for name in file_names if name not in pdf_files]
+        if missing:
+            raise FileNotFoundError(f"Arquivos não encontrados na pasta {folder_url}: {missing}")
+        pdf_files = list(file_names)
+
+    # Verificar se foram encontrados arquivos PDF
+    if not pdf_files:
+        raise FileNotFoundError(f"Nenhum arquivo PDF encontrado na pasta {folder_url}")
+    return pdf_files
+
+
+# Função principal: OCR de todas as guias (ou de uma só) da landing zone
+def run(storage, folder_url=config.GUIAS_FOLDER_URL, file_names=None, output_json_path=None, engine=None, classifier=None, dedup=None, workers=1,
+        early_stop=True, cascade=True, journal=None, text_store=None, guia_db=None):
+    for directory in (config.IMAGES_DIR, config.OUTPUT_DIR):
+        os.makedirs(directory, exist_ok=True)
+
+    pdf_files = list_target_pdfs(storage, folder_url, file_names)
+
+    if engine is None:
+        from .ocr_engines import get_engine
+        engine = get_engine()
+
+    if workers > 1:
+        from .parallel import run_pages
+        all_data = run_pages(storage, folder_url, pdf_files, engine, workers, classifier, dedup, early_stop, cascade, journal,
+                             text_store)
+    else:
+        all_data = _run_serial(storage, folder_url, pdf_files, engine, classifier, dedup, early_stop, cascade, journal, text_store)
+
+    for tier, share in cascade_summary().items():
+        logging.info("Cascata de OCR - nível %s: %d páginas (%.1f%%).", tier, share['pages'], share['share'] * 100)
+
+    if output_json_path is None:
+        output_json_path = os.path.join(config.OUTPUT_DIR, "consolidated_data.json")
+    save_texts_to_json(all_data, output_json_path)
+    if guia_db is not None:
+        guia_db.upsert(all_data)
+    if dedup is not None:
+        dedup.write_report(os.path.join(os.path.dirname(output_json_path) or '.', "duplicates.json"))
+    return all_data
+
+
+def _run_serial(storage, folder_url, pdf_files, engine, classifier, dedup, early_stop, cascade, journal=None, text_store=None):
+    all_data = []
+    for pdf_file_name in pdf_files:
+        pdf_url = f"{folder_url}/{pdf_file_name}"
+        if journal is None:
+            all_data.extend(process_file(storage, pdf_url, pdf_file_name, engine, classifier, dedup, early_stop, cascade,
+                                         text_store=text_store))
+            continue
+        # Com o diário, um arquivo que falha não derruba a execução: fica como falha
+        # (com as páginas já reconhecidas gravadas) para a próxima
+        from .sharepoint import AuthenticationError
+        records = journal.run("ocr_file", pdf_url, process_file, storage, pdf_url, pdf_file_name, engine, classifier, dedup,
+                              early_stop, cascade, journal, text_store, fatal=(AuthenticationError,))
+        all_data.extend(records or [])
+    return all_data
+
+
+# Função para processar um arquivo da landing zone e retornar os registros extraídos
+def process_file(storage, pdf_url, pdf_file_name, engine=None, classifier=None, dedup=None, early_stop=True, cascade=True,
+                 journal=None, text_store=None):
+    try:
+        doc, file_sha256, size = open_pdf(storage, pdf_url)
+    except ValueError as e:
+        logging.error(e)
+        return []
+    if dedup is not None:
+        dedup.add_file(file_sha256, pdf_url, size)
+    with doc:
+        return process_pdf(pdf_file_name, doc, engine=engine, classifier=classifier, dedup=dedup, file_sha256=file_sha256,
+                           early_stop=early_stop, cascade=cascade, journal=journal, text_store=text_store)
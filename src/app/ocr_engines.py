@@ -0,0 +1,183 @@
+import os
+import json
+import base64
+import shutil
+import logging
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from . import config, metrics
+
+# Motores de OCR intercambiáveis. Todos recebem a lista de imagens das páginas e
+# devolvem um texto por página, já normalizado para o formato que o parser espera
+# (uma informação por linha, sem linhas vazias).
+
+VISION_URL = "https://vision.googleapis.com/v1/images:annotate"
+
+
+# Função para normalizar o texto de qualquer motor: remove espaços sobrando,
+# quebras de página e linhas vazias
+def normalize_text(text):
+    lines = (' '.join(line.split()) for line in text.replace('\f', '\n').split('\n'))
+    return '\n'.join(line for line in lines if line)
+
+
+class OCREngine:
+    name = None
+
+    def __init__(self, enhance=True):
+        self.enhance = enhance
+
+    # Reconhece o texto de uma única imagem (já pré-processada)
+    def recognize_image(self, image_path):
+        raise NotImplementedError
+
+    def _prepare(self, image_path, enhance=None):
+        if not (self.enhance if enhance is None else enhance):
+            return image_path
+        from .ocr import enhance_image
+        return enhance_image(image_path)
+
+    # enhance sobrepõe a configuração do motor só para esta página (cascata de OCR)
+    def recognize_page(self, image_path, enhance=None):
+        return normalize_text(self.recognize_image(self._prepare(image_path, enhance)))
+
+    def recognize(self, images):
+        return [self.recognize_page(image_path) for image_path in images]
+
+    # Prepara o motor antes da primeira página (serviço residente)
+    def warm(self):
+        pass
+
+    def close(self):
+        pass
+
+    # Nome e opções para recriar o motor em outro processo
+    def spec(self):
+        return self.name, {"enhance": self.enhance}
+
+
+class VisionEngine(OCREngine):
+    name = "vision"
+
+    def __init__(self, api_key=None, enhance=True):
+        super().__init__(enhance)
+        self.api_key = api_key
+        self._session = None
+
+    # Sessão HTTP reaproveitada entre as chamadas (mantém a conexão aberta)
+    @property
+    def session(self):
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+            self._session.headers.update({'Content-Type': 'application/json'})
+        return self._session
+
+    def _url(self):
+        if self.api_key is None:
+            self.api_key = config.get_env('API_KEY')
+            if not self.api_key:
+                raise RuntimeError("API_KEY não encontrada. Certifique-se de que a variável está definida no arquivo .env")
+        return f"{VISION_URL}?key={self.api_key}"
+
+    def recognize_image(self, image_path):
+        with open(image_path, "rb") as image_file:
+            my_base64 = base64.b64encode(image_file.read()).decode('utf-8')
+
+        data = {
+            'requests': [
+                {
+                    'image': {
+                        'content': my_base64
+                    },
+                    'features': [
+                        {
+                            'type': 'TEXT_DETECTION'
+                        }
+                    ]
+                }
+            ]
+        }
+
+        with metrics.stage("ocr"):
+            response = self.session.post(self._url(), data=json.dumps(data))
+        metrics.inc("vision_calls")
+        response.raise_for_status()  # Lança um erro se a requisição falhar
+        r = response.json()
+
+        if 'error' in r:
+            logging.error("Erro na resposta do Vision API: %s", r['error']['message'])
+            return ""
+
+        if 'textAnnotations' in r['responses'][0]:
+            return r['responses'][0]['textAnnotations'][0]['description']
+        return ""
+
+    # Resolve a chave e abre a conexão TLS com a API antes da primeira página
+    def warm(self):
+        import requests
+
+        self._url()
+        try:
+            self.session.head(VISION_URL, timeout=5)
+        except requests.RequestException as e:
+            logging.warning("Não foi possível abrir a conexão com o Vision API: %s", e)
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def spec(self):
+        return self.name, {"api_key": self.api_key, "enhance": self.enhance}
+
+
+class TesseractEngine(OCREngine):
+    # OCR local via executável do Tesseract. Cada página roda em um processo
+    # tesseract próprio, com até `workers` páginas em paralelo.
+    name = "tesseract"
+
+    def __init__(self, lang="por", psm=4, workers=None, enhance=True, tesseract_cmd=None):
+        super().__init__(enhance)
+        self.lang = lang
+        self.psm = psm
+        self.workers = workers or os.cpu_count() or 1
+        self.tesseract_cmd = tesseract_cmd or config.get_env('TESSERACT_CMD', 'tesseract')
+        if shutil.which(self.tesseract_cmd) is None:
+            raise RuntimeError(f"Tesseract não encontrado: {self.tesseract_cmd}. Instale-o ou defina TESSERACT_CMD no arquivo .env")
+
+    def recognize_image(self, image_path):
+        command = [self.tesseract_cmd, image_path, "stdout", "-l", self.lang, "--psm", str(self.psm)]
+        with metrics.stage("ocr"):
+            result = subprocess.run(command, capture_output=True)
+        metrics.inc("tesseract_calls")
+        if result.returncode != 0:
+            logging.error("Erro no Tesseract (%s): %s", image_path, result.stderr.decode('utf-8', errors='replace').strip())
+            return ""
+        return result.stdout.decode('utf-8', errors='replace')
+
+    def recognize(self, images):
+        if len(images) <= 1 or self.workers == 1:
+            return super().recognize(images)
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(images))) as executor:
+            return list(executor.map(self.recognize_page, images))
+
+    # Nos processos de trabalho o paralelismo já vem dos processos: uma página por vez
+    def spec(self):
+        return self.name, {"lang": self.lang, "psm": self.psm, "workers": 1, "enhance": self.enhance,
+                           "tesseract_cmd": self.tesseract_cmd}
+
+
+ENGINES = {
+    VisionEngine.name: VisionEngine,
+    TesseractEngine.name: TesseractEngine,
+}
+
+
+# Função para criar o motor de OCR pelo nome (padrão: variável OCR_ENGINE ou vision)
+def get_engine(name=None, **kwargs):
+    name = name or config.get_env('OCR_ENGINE', VisionEngine.name)
+    if name not in ENGINES:
+        raise ValueError(f"Motor de OCR desconhecido: {name}. Opções: {', '.join(ENGINES)}")
+    return ENGINES[name](**kwargs)
@@ -0,0 +1,228 @@
+import os
+import time
+import heapq
+import logging
+import itertools
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import fitz  # PyMuPDF
+
+from . import config, metrics
+
+# OCR em paralelo por página. Guias com vários lotes têm dezenas de páginas e a
+# fila por arquivo deixava os núcleos parados; aqui cada página pendente vira uma
+# tarefa em um pool de processos. O PyMuPDF não é thread-safe, então cada processo
+# abre os PDFs por conta própria (a partir de um caminho local). O processo
+# principal classifica, consulta o índice de duplicatas, junta as métricas dos
+# processos e monta os registros na ordem original de arquivo e página. Arquivos
+# de uma guia só mandam uma página por vez e param no primeiro registro completo.
+# Com o diário, a página que falha no processo de trabalho é tentada de novo com a
+# mesma política do modo sequencial (retries e espera exponencial do diário); se
+# ainda falhar, o arquivo fica como falha no diário e é refeito na próxima execução.
+
+# PDFs mantidos abertos em cada processo de trabalho
+MAX_OPEN_DOCS = 4
+# Tarefas em andamento por processo (limita a memória com pastas grandes)
+TASKS_PER_WORKER = 2
+
+
+class _Worker:
+    def __init__(self):
+        self.engine = None
+        self.images_dir = None
+        self.cascade = False
+        self.docs = OrderedDict()
+
+
+_worker = _Worker()
+
+
+def _init_worker(engine_name, engine_options, images_dir, cascade=False):
+    from .ocr_engines import get_engine
+
+    _worker.engine = get_engine(engine_name, **engine_options)
+    # Pasta de imagens própria do processo: os nomes das páginas não colidem entre processos
+    _worker.images_dir = os.path.join(images_dir, f"worker_{os.getpid()}")
+    os.makedirs(_worker.images_dir, exist_ok=True)
+    _worker.cascade = cascade
+    # Métricas herdadas do processo pai (fork) não podem voltar somadas em dobro
+    metrics.registry.drain()
+
+
+def _open_doc(path):
+    doc = _worker.docs.pop(path, None)
+    if doc is None:
+        doc = fitz.open(path)
+    _worker.docs[path] = doc
+    while len(_worker.docs) > MAX_OPEN_DOCS:
+        _, oldest = _worker.docs.popitem(last=False)
+        oldest.close()
+    return doc
+
+
+# Tarefa de um processo de trabalho: renderiza e reconhece uma página.
+# Retorna o texto e as métricas acumuladas no processo desde a última tarefa.
+def _process_page(task):
+    from .ocr import delete_temp_files, ocr_page_cascade, render_page
+
+    path, pdf_file_name, page_num = task
+    if _worker.cascade:
+        text = ocr_page_cascade(pdf_file_name, _open_doc(path), page_num, _worker.images_dir, _worker.engine)
+        return text, metrics.registry.drain()
+
+    image_path = os.path.join(_worker.images_dir, f"page_{page_num}.png")
+    try:
+        render_page(_open_doc(path), page_num, image_path)
+        text = _worker.engine.recognize_page(image_path)
+    finally:
+        delete_temp_files([image_path])
+    return text, metrics.registry.drain()
+
+
+class _FileJob:
+    def __init__(self, name, url, sha256, local_path, is_temp, single=False):
+        self.name = name
+        self.url = url
+        self.sha256 = sha256
+        self.local_path = local_path
+        self.is_temp = is_temp
+        self.texts = {}
+        self.fingerprints = {}
+        self.remaining = 0
+        self.single = single
+        self.queue = deque()
+        self.records = None
+        self.journaled = False
+        # Falhas por página: {página: tentativas} e {página: erro} das que esgotaram
+        self.attempts = {}
+        self.errors = {}
+
+    def finish(self):
+        if self.is_temp and os.path.exists(self.local_path):
+            os.remove(self.local_path)
+
+
+# Função para processar as páginas de vários PDFs em `workers` processos
+def run_pages(storage, folder_url, pdf_files, engine, workers, classifier=None, dedup=None, early_stop=True,
+              cascade=True, journal=None, text_store=None):
+    from .ocr import fetch_pdf, is_single_guia, page_key, parse_pages, prepare_pages, skip_remaining
+
+    engine_name, engine_options = engine.spec()
+    retries = journal.retries if journal is not None else 0
+    jobs = []
+    in_flight = {}
+    # Páginas que falharam esperando a nova tentativa: (quando, ordem, job, página)
+    retry_queue = []
+    sequence = itertools.count()
+
+    def submit(job, page_num):
+        in_flight[executor.submit(_process_page, (job.local_path, job.name, page_num))] = (job, page_num)
+
+    def collect():
+        timeout = max(0.0, retry_queue[0][0] - time.time()) if retry_queue else None
+        if in_flight:
+            done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+        else:
+            time.sleep(timeout)
+            done = ()
+        while retry_queue and retry_queue[0][0] <= time.time():
+            _, _, job, page_num = heapq.heappop(retry_queue)
+            submit(job, page_num)
+        for future in done:
+            job, page_num = in_flight.pop(future)
+            try:
+                text, snapshot = future.result()
+            except Exception as e:
+                attempt = job.attempts[page_num] = job.attempts.get(page_num, 0) + 1
+                if attempt <= retries:
+                    delay = journal.backoff * 2 ** (attempt - 1)
+                    logging.warning("Erro no OCR da página %d de %s (%s); nova tentativa em %.1fs.", page_num, job.name, e, delay)
+                    heapq.heappush(retry_queue, (time.time() + delay, next(sequence), job, page_num))
+                    continue
+                logging.error("Erro no OCR da página %d de %s: %s", page_num, job.name, e)
+                metrics.inc("pages_skipped", reason="ocr_error")
+                job.errors[page_num] = f"{type(e).__name__}: {e}"
+            else:
+                metrics.registry.merge(snapshot)
+                job.texts[page_num] = text
+                if dedup is not None:
+                    dedup.add_page(job.sha256, page_num, job.fingerprints[page_num], text)
+                if journal is not None and text and text.strip():
+                    journal.finish("ocr_page", page_key(job.sha256, page_num), text)
+                if job.single:
+                    job.records = parse_pages(job.name, {page_num: text}, text_store)
+                    if job.records:
+                        skip_remaining(job.name, list(job.queue))
+                        job.queue.clear()
+            if job.single and job.queue:
+                submit(job, job.queue.popleft())
+                continue
+            job.remaining -= 1
+            if job.remaining == 0:
+                job.finish()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(engine_name, engine_options, config.IMAGES_DIR, cascade)) as executor:
+        for pdf_file_name in pdf_files:
+            pdf_url = f"{folder_url}/{pdf_file_name}"
+            unit = journal.get("ocr_file", pdf_url) if journal is not None else None
+            if unit is not None and unit.state == "done":
+                job = _FileJob(pdf_file_name, pdf_url, None, None, False)
+                job.records = unit.result
+                job.journaled = True
+                jobs.append(job)
+                metrics.inc("journal_skipped", kind="ocr_file")
+                continue
+            try:
+                local_path, file_sha256, is_temp = fetch_pdf(storage, pdf_url)
+            except FileNotFoundError as e:
+                logging.error(e)
+                continue
+            job = _FileJob(pdf_file_name, pdf_url, file_sha256, local_path, is_temp)
+            try:
+                with fitz.open(local_path) as doc:
+                    job.single = early_stop and is_single_guia(pdf_file_name, doc)
+                    if dedup is not None:
+                        dedup.add_file(file_sha256, pdf_url, os.path.getsize(local_path))
+                    job.texts, pending, job.fingerprints = prepare_pages(pdf_file_name, doc, classifier, dedup, file_sha256, journal)
+            except fitz.FileDataError as e:
+                logging.error("Erro ao abrir o arquivo PDF: %s", e)
+                job.finish()
+                continue
+            jobs.append(job)
+
+            if job.single:
+                job.records = parse_pages(pdf_file_name, job.texts, text_store)
+                if job.records:
+                    skip_remaining(pdf_file_name, pending)
+                    pending = []
+                job.queue.extend(pending[1:])
+                pending = pending[:1]
+
+            job.remaining = len(pending)
+            if not pending:
+                job.finish()
+            for page_num in pending:
+                while len(in_flight) + len(retry_queue) >= workers * TASKS_PER_WORKER:
+                    collect()
+                submit(job, page_num)
+
+        while in_flight or retry_queue:
+            collect()
+
+    all_data = []
+    for job in jobs:
+        records = job.records if job.records is not None else parse_pages(job.name, job.texts, text_store)
+        if journal is not None and not job.journaled:
+            # Arquivo com página perdida fica como falha (as páginas reconhecidas já estão
+            # no diário) e sai do resultado, como no modo sequencial
+            if job.errors:
+                page_num = min(job.errors)
+                journal.fail("ocr_file", job.url, f"página {page_num + 1}: {job.errors[page_num]}")
+                logging.error("Arquivo %s com %d páginas sem OCR; fica para a próxima execução.", job.name, len(job.errors))
+                continue
+            journal.finish("ocr_file", job.url, records)
+        all_data.extend(records)
+    logging.info("%d PDFs processados em %d processos.", len(jobs), workers)
+    return all_data
@@ -0,0 +1,157 @@
+import re
+import difflib
+import logging
+from datetime import datetime
+
+# Códigos de receita reconhecidos e suas descrições
+CODIGOS_DENOMINACAO = {
+    "8189": "PIS FATURAMENTO 02 PIS FATURAMENTO PJ EM GERAL",
+    "2889": "IRPJ LUCRO PRESUMIDO Principal",
+    "2372": "CSLL - DEMAIS Principal",
+    "2172": "COFINS CONTRIB P/ FIN. SEG. SOCIAL",
+    "2009": "IRPJ LUCRO PRESUMIDO",
+    "8109": "PIS - FATURAMENTO Principal",
+    "2089": "IRPJ LUCRO PRESUMIDO",
+    "1708": "IRRF - REMUNER SERV PRESTADOS POR PJ"
+}
+
+MESES = ["Janeiro", "Fevereiro", "Março", "Abril", "Maio", "Junho", "Julho", "Agosto", "Setembro", "Outubro", "Novembro", "Dezembro"]
+
+NUMERO_DOCUMENTO_PATTERN = re.compile(r'\d{2}.\d{2}.\d{5}.\d{7}-\d{1}')
+
+
+# Função para encontrar termos semelhantes
+def find_similar_term(term, lines):
+    match = difflib.get_close_matches(term, lines, n=1, cutoff=0.8)
+    return match[0] if match else None
+
+
+# Função para validar datas no formato dd/mm/yyyy
+def is_valid_date(date_str):
+    if len(date_str) != 10:
+        return False
+    try:
+        day, month, year = map(int, date_str.split('/'))
+        return 1 <= day <= 31 and 1 <= month <= 12 and len(str(year)) == 4
+    except ValueError:
+        return False
+
+
+# Função para validar formato de mês/ano
+def is_valid_month_year(month_year_str):
+    try:
+        month, year = month_year_str.split('/')
+        return month in MESES and len(year) == 4 and year.isdigit()
+    except ValueError:
+        return False
+
+
+# Função para validar formato do Número do Documento
+def is_valid_numero_documento(numero):
+    if len(numero) != 21:
+        return False
+    return bool(NUMERO_DOCUMENTO_PATTERN.match(numero))
+
+
+def get_codigo_denominacao_info(line):
+    for codigo, descricao in CODIGOS_DENOMINACAO.items():
+        if codigo in line:
+            return codigo, descricao
+    return None, None
+
+
+# Função para processar o texto extraído e gerar o JSON formatado
+def process_text_and_generate_json(text, pdf_file_name, page_num=None, quiet=False):
+    # quiet: falhas esperadas (ex.: níveis baratos da cascata de OCR) vão só para o debug
+    warning = logging.debug if quiet else logging.warning
+    error = logging.debug if quiet else logging.error
+
+    if not text.startswith("Receita Federal\n"):
+        warning("PDF fora do formato de Guia Federal.")
+        return None
+
+    try:
+        lines = text.split('\n')
+        data = {}
+
+        # Extrair o nome do arquivo e a página (1 = primeira) de onde a guia saiu
+        data["Nome do Arquivo"] = pdf_file_name
+        if page_num is not None:
+            data["Página"] = page_num + 1
+
+        # Extrair o CNPJ
+        try:
+            cnpj_index = text.index("\nCNPJ\n") + len("\nCNPJ\n")
+            data["CNPJ"] = text[cnpj_index:cnpj_index + 18]
+        except ValueError:
+            error("Erro ao encontrar 'CNPJ'.")
+            return None
+
+        # Extrair o Período de Apuração
+        periodo_apuracao = next((line for line in lines if is_valid_date(line) or is_valid_month_year(line)), None)
+        if periodo_apuracao:
+            data["Periodo de Apuração"] = periodo_apuracao
+        else:
+            error("Período de Apuração não encontrado.")
+            return None
+
+        # Extrair a Data de Vencimento
+        data_vencimento = next((line for line in lines if is_valid_date(line) and line != data["Periodo de Apuração"]), None)
+        if data_vencimento:
+            data["Data de Vencimento"] = data_vencimento
+        else:
+            error("Data de Vencimento não encontrada.")
+            return None
+
+        # Verificar se Período de Apuração é menor que Data de Vencimento
+        try:
+            if is_valid_date(data["Periodo de Apuração"]) and is_valid_date(data["Data de Vencimento"]):
+                periodo_apuracao_date = datetime.strptime(data["Periodo de Apuração"], "%d/%m/%Y")
+                data_vencimento_date = datetime.strptime(data["Data de Vencimento"], "%d/%m/%Y")
+                if periodo_apuracao_date >= data_vencimento_date:
+                    error(f"Período de Apuração {data['Periodo de Apuração']} não pode ser maior ou igual à Data de Vencimento {data['Data de Vencimento']}.")
+                    return None
+        except ValueError as e:
+            error(f"Erro ao comparar datas: {str(e)}")
+            return None
+
+        # Extrair Observações
+        observacoes = next((line for line in lines if "Darf emitido pelo Sicalc Web" in line or line.startswith("N° Recibo Declaração")), None)
+        if observacoes:
+            data["Observações"] = observacoes
+        else:
+            error("Erro ao encontrar 'Observações'.")
+            return None
+
+        # Extrair Número do Documento
+        numero_documento = next((line for line in lines if is_valid_numero_documento(line)), None)
+        if numero_documento:
+            data["Número do Documento"] = numero_documento
+        else:
+            error(f"Número do Documento inválido: {numero_documento}")
+            return None
+
+        # Extrair Valor Total do Documento
+        valor_total_documento_term = find_similar_term("Valor Total do Documento", lines) or find_similar_term("Valor Total de Documento", lines)
+        if valor_total_documento_term:
+            valor_total_documento_index = lines.index(valor_total_documento_term) + 1
+            data["Valor Total do Documento"] = lines[valor_total_documento_index]
+        else:
+            error("Erro ao encontrar 'Valor Total do Documento'.")
+            return None
+
+        # Extrair Código Denominação e Descrição Cod Denominação
+        codigo_denom_line = next((line for line in lines if any(codigo in line for codigo in CODIGOS_DENOMINACAO)), None)
+        if codigo_denom_line:
+            codigo_denom, descricao_denom = get_codigo_denominacao_info(codigo_denom_line)
+            data["Código Denominação"] = codigo_denom
+            data["Descrição Cod Denominação"] = descricao_denom
+        else:
+            error("Erro ao encontrar 'Código Denominação'.")
+            return None
+
+        return data
+
+    except Exception as e:
+        error(f"Erro ao processar texto: {str(e)}")
+        return None
@@ -0,0 +1,159 @@
+import os
+import json
+import logging
+
+from . import config, metrics
+
+# Conciliação DARF x SPED: o que foi pago (guias extraídas por OCR ou pela camada de
+# texto) contra o que foi declarado na EFD-Contribuições (totais a recolher do M200
+# para o PIS e do M600 para a COFINS). As duas fontes viram DataFrames e são unidas
+# por hash join em (raiz do CNPJ, período de apuração, tributo), com as diferenças
+# marcadas de uma vez, sem laço por arquivo.
+
+# Código de receita do DARF -> tributo da EFD-Contribuições
+RECEITA_TRIBUTO = {
+    "8109": "PIS",
+    "8189": "PIS",
+    "6912": "PIS",
+    "2172": "COFINS",
+    "5856": "COFINS",
+}
+
+# Registro da EFD-Contribuições com o total a recolher de cada tributo
+SPED_TOTALS = {"M200": "PIS", "M600": "COFINS"}
+
+# Nomes dos campos nas duas saídas de extração de guias (ocr e parse)
+DARF_COLUMNS = {
+    "CNPJ": "cnpj",
+    "Periodo de Apuração": "periodo",
+    "Apuration Date": "periodo",
+    "Código Denominação": "codigo_receita",
+    "Tax Code": "codigo_receita",
+    "Valor Total do Documento": "valor",
+    "Total Value": "valor",
+    "Nome do Arquivo": "arquivo",
+    "File Name": "arquivo",
+}
+
+MESES = {nome.lower(): f"{numero:02d}" for numero, nome in enumerate(
+    ["Janeiro", "Fevereiro", "Março", "Abril", "Maio", "Junho", "Julho", "Agosto", "Setembro", "Outubro", "Novembro", "Dezembro"], 1)}
+
+
+def _cnpj_root(series):
+    return series.astype("string").str.replace(r"\D", "", regex=True).str[:8]
+
+
+def _money(series):
+    return series.astype("string").str.replace(r"[^\d,.-]", "", regex=True).str.replace(".", "", regex=False) \
+        .str.replace(",", ".", regex=False).astype("float64")
+
+
+# Período "AAAA-MM" a partir de "dd/mm/aaaa" ou "Março/2024"
+def _periodo(series):
+    import pandas as pd
+
+    text = series.astype("string").str.strip()
+    by_date = text.str.extract(r"^\d{2}/(\d{2})/(\d{4})$")
+    by_month = text.str.extract(r"^([^\W\d]+)/(\d{4})$")
+    month = by_date[0].fillna(by_month[0].str.lower().map(MESES))
+    year = by_date[1].fillna(by_month[1])
+    return (year + "-" + month).astype(pd.StringDtype())
+
+
+# Função para carregar os registros de DARF (JSON do ocr ou do parse) em um DataFrame
+def load_darfs(json_paths):
+    import pandas as pd
+
+    frames = []
+    for path in json_paths:
+        with open(path, 'r', encoding='utf-8') as json_file:
+            records = json.load(json_file)
+        frame = pd.DataFrame.from_records(records)
+        # Colunas fixas: um JSON vazio ou sem algum dos campos vira colunas vazias
+        frame = frame[[column for column in frame.columns if column in DARF_COLUMNS]].rename(columns=DARF_COLUMNS)
+        frames.append(frame.reindex(columns=list(dict.fromkeys(DARF_COLUMNS.values()))))
+    if not frames:
+        return pd.DataFrame(columns=["cnpj_raiz", "periodo", "tributo", "codigo_receita", "valor", "arquivo"])
+
+    darfs = pd.concat(frames, ignore_index=True)
+    darfs = pd.DataFrame({
+        "cnpj_raiz": _cnpj_root(darfs["cnpj"]),
+        "periodo": _periodo(darfs["periodo"]),
+        "codigo_receita": darfs["codigo_receita"].astype("string").str.strip(),
+        "valor": _money(darfs["valor"]),
+        "arquivo": darfs["arquivo"],
+    })
+    darfs["tributo"] = darfs["codigo_receita"].map(RECEITA_TRIBUTO)
+    skipped = int(darfs["tributo"].isna().sum())
+    if skipped:
+        logging.info("%d DARFs de tributos fora da EFD-Contribuições ignorados (IRPJ, CSLL, ...).", skipped)
+    return darfs.dropna(subset=["tributo", "cnpj_raiz", "periodo"])
+
+
+# Função para ler os totais a recolher de cada SPED (0000 + M200/M600 pelo índice)
+def load_sped_totals(sped_paths):
+    import pandas as pd
+    from .sped_index import query
+
+    rows = []
+    for path in sped_paths:
+        header = None
+        for register in query(path, ["0000"] + list(SPED_TOTALS)):
+            if register.reg == "0000":
+                header = register.fields
+            elif header is not None:
+                rows.append((header["CNPJ"], header["DT_INI"], SPED_TOTALS[register.reg],
+                             register.fields.get("VL_TOT_CONT_REC"), os.path.basename(path)))
+    metrics.inc("sped_files_reconciled", len(sped_paths))
+
+    sped = pd.DataFrame.from_records(rows, columns=["cnpj", "dt_ini", "tributo", "declarado", "sped"])
+    return pd.DataFrame({
+        "cnpj_raiz": _cnpj_root(sped["cnpj"]),
+        "periodo": pd.to_datetime(sped["dt_ini"]).dt.strftime("%Y-%m").astype("string"),
+        "tributo": sped["tributo"],
+        "declarado": sped["declarado"].astype("float64").fillna(0.0),
+        "sped": sped["sped"],
+    })
+
+
+# Função para conciliar os dois lados. status: ok, divergente (diferença acima da
+# tolerância), sem_darf (declarado sem guia) ou sem_sped (guia sem declaração)
+def reconcile(darfs, sped, tolerance=0.01):
+    import numpy as np
+
+    keys = ["cnpj_raiz", "periodo", "tributo"]
+    with metrics.stage("reconcile"):
+        paid = darfs.groupby(keys, as_index=False).agg(
+            pago=("valor", "sum"),
+            guias=("valor", "size"),
+            codigos_receita=("codigo_receita", lambda codes: ','.join(sorted(set(codes)))))
+        declared = sped.groupby(keys, as_index=False).agg(declarado=("declarado", "sum"), sped=("sped", "first"))
+
+        result = paid.merge(declared, on=keys, how="outer")
+        result["diferenca"] = (result["pago"].fillna(0.0) - result["declarado"].fillna(0.0)).round(2)
+        result["status"] = np.select(
+            [result["pago"].isna(), result["declarado"].isna(), result["diferenca"].abs() <= tolerance],
+            ["sem_darf", "sem_sped", "ok"],
+            default="divergente")
+        # Declaração zerada sem guia não é divergência
+        result.loc[(result["status"] == "sem_darf") & (result["declarado"].abs() <= tolerance), "status"] = "ok"
+    for status, count in result["status"].value_counts().items():
+        metrics.inc("reconciliation_rows", int(count), status=status)
+    return result.sort_values(keys, ignore_index=True)
+
+
+# Função principal: concilia os JSONs de guias com os SPEDs da landing zone
+def run(storage, darf_json_paths, sped_folder_url=config.SPED_FOLDER_URL, tolerance=0.01, output_path=None):
+    from .sped import fetch_sped
+
+    sped_paths = [fetch_sped(storage, entry.path) for entry in storage.list_files(sped_folder_url)
+                  if "SPED_PISCOFINS" in entry.name and entry.name.endswith(".txt")]
+    result = reconcile(load_darfs(darf_json_paths), load_sped_totals(sped_paths), tolerance)
+
+    if output_path is None:
+        output_path = os.path.join(config.OUTPUT_DIR, "reconciliation.json")
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    result.to_json(output_path, orient="records", force_ascii=False, indent=4)
+    summary = result["status"].value_counts().to_dict()
+    logging.info("Conciliação salva em %s: %s", output_path, summary)
+    return result
@@ -0,0 +1,215 @@
+import io
+import json
+import gzip
+import time
+import base64
+import random
+import hashlib
+import logging
+import datetime
+import threading
+from collections import defaultdict, deque
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Gravação e reprodução determinística das chamadas HTTP (SharePoint e Vision).
+#
+# O interceptador fica no HTTPAdapter do requests, abaixo do office365
+# (File.open_binary, ctx.execute_query, upload_file, autenticação) e da sessão
+# do VisionEngine. No modo "record" cada resposta real é gravada em um cassete
+# (JSON lines com gzip); no modo "replay" as respostas vêm do cassete, com
+# latência e taxa de erro configuráveis. Os cassetes guardam os tokens de sessão
+# devolvidos pelo SharePoint: não devem ser versionados nem compartilhados.
+
+# Parâmetros de URL que não são gravados nem usados na comparação
+REDACTED_PARAMS = {"key"}
+
+# Cabeçalhos de resposta guardados no cassete
+KEPT_HEADERS = {"content-type", "content-length", "retry-after", "x-requestdigest", "location"}
+
+
+def normalize_url(url):
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k not in REDACTED_PARAMS]
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(sorted(query)), ''))
+
+
+def body_hash(body):
+    if body is None:
+        return None
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    if not isinstance(body, (bytes, bytearray)):
+        # Corpo em stream (upload de arquivo): compara só método e URL
+        return None
+    return hashlib.sha1(body).hexdigest()
+
+
+class Cassette:
+    def __init__(self, path):
+        self.path = path
+        self.interactions = []
+        self._by_key = defaultdict(deque)
+        self._by_url = defaultdict(deque)
+        self._last = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        with gzip.open(self.path, 'rt', encoding='utf-8') as cassette_file:
+            for line in cassette_file:
+                self._index(json.loads(line))
+        logging.info("Cassete carregado de %s: %d interações.", self.path, len(self.interactions))
+        return self
+
+    def save(self):
+        with gzip.open(self.path, 'wt', encoding='utf-8') as cassette_file:
+            for interaction in self.interactions:
+                cassette_file.write(json.dumps(interaction, ensure_ascii=False) + '\n')
+        logging.info("Cassete gravado em %s: %d interações.", self.path, len(self.interactions))
+
+    def _index(self, interaction):
+        self.interactions.append(interaction)
+        self._by_key[(interaction["method"], interaction["url"], interaction["body_hash"])].append(interaction)
+        self._by_url[(interaction["method"], interaction["url"])].append(interaction)
+
+    def add(self, prepared_request, response, elapsed):
+        interaction = {
+            "method": prepared_request.method,
+            "url": normalize_url(prepared_request.url),
+            "body_hash": body_hash(prepared_request.body),
+            "status": response.status_code,
+            "reason": response.reason,
+            "headers": {k: v for k, v in response.headers.items() if k.lower() in KEPT_HEADERS},
+            "cookies": response.cookies.get_dict(),
+            "elapsed": round(elapsed, 6),
+            "body": base64.b64encode(response.content or b'').decode('ascii'),
+        }
+        with self._lock:
+            self._index(interaction)
+
+    # Busca a resposta gravada: primeiro pelo corpo exato, depois por método e URL
+    # na ordem de gravação; esgotada a fila, repete a última resposta da chave
+    def match(self, prepared_request):
+        url = normalize_url(prepared_request.url)
+        keys = [(prepared_request.method, url, body_hash(prepared_request.body)), (prepared_request.method, url)]
+        with self._lock:
+            for index, key in enumerate(keys):
+                queue = self._by_key.get(key) if index == 0 else self._by_url.get(key)
+                if queue:
+                    interaction = queue.popleft()
+                    self._last[key] = interaction
+                    return interaction
+            for key in keys:
+                if key in self._last:
+                    return self._last[key]
+        return None
+
+
+class CassetteMissError(Exception):
+    pass
+
+
+def build_response(prepared_request, interaction):
+    import requests
+    from requests.cookies import cookiejar_from_dict
+    from requests.structures import CaseInsensitiveDict
+    from requests.utils import get_encoding_from_headers
+
+    body = base64.b64decode(interaction["body"])
+    response = requests.Response()
+    response.status_code = interaction["status"]
+    response.reason = interaction.get("reason")
+    response.headers = CaseInsensitiveDict(interaction["headers"])
+    response.encoding = get_encoding_from_headers(response.headers)
+    response.cookies = cookiejar_from_dict(interaction.get("cookies", {}))
+    response.url = prepared_request.url
+    response.request = prepared_request
+    response.raw = io.BytesIO(body)
+    response._content = body
+    response._content_consumed = True
+    response.elapsed = datetime.timedelta(seconds=interaction.get("elapsed", 0))
+    return response
+
+
+class _Transport:
+    def __init__(self):
+        self.mode = None
+        self.cassette = None
+        self.latency = 0.0
+        self.latency_scale = 0.0
+        self.error_rate = 0.0
+        self.timeout_rate = 0.0
+        self.rng = random.Random(0)
+        self.original_send = None
+
+
+_transport = _Transport()
+
+
+def _send(adapter, request, **kwargs):
+    if _transport.mode == "record":
+        start = time.perf_counter()
+        response = _transport.original_send(adapter, request, **kwargs)
+        _transport.cassette.add(request, response, time.perf_counter() - start)
+        return response
+
+    import requests
+    from . import metrics
+
+    interaction = _transport.cassette.match(request)
+    if interaction is None:
+        raise CassetteMissError(f"Nenhuma resposta gravada para {request.method} {normalize_url(request.url)}")
+
+    delay = _transport.latency + _transport.latency_scale * interaction.get("elapsed", 0)
+    if delay:
+        time.sleep(delay)
+
+    draw = _transport.rng.random()
+    if draw < _transport.timeout_rate:
+        metrics.inc("replay_errors", kind="timeout")
+        raise requests.exceptions.ConnectTimeout(f"Timeout simulado: {request.method} {normalize_url(request.url)}", request=request)
+    if draw < _transport.timeout_rate + _transport.error_rate:
+        metrics.inc("replay_errors", kind="http_503")
+        interaction = {"status": 503, "reason": "Service Unavailable", "headers": {"Retry-After": "1"}, "body": "", "elapsed": 0}
+
+    metrics.inc("replay_responses")
+    return build_response(request, interaction)
+
+
+# Função para ativar a gravação de todas as chamadas HTTP em um cassete
+def start_recording(path):
+    _install("record", Cassette(path))
+
+
+# Função para ativar a reprodução a partir de um cassete. latency é somada a cada
+# resposta; latency_scale multiplica a latência gravada (1.0 = tempos reais).
+def start_replay(path, latency=0.0, latency_scale=0.0, error_rate=0.0, timeout_rate=0.0, seed=0):
+    _transport.latency = latency
+    _transport.latency_scale = latency_scale
+    _transport.error_rate = error_rate
+    _transport.timeout_rate = timeout_rate
+    _transport.rng = random.Random(seed)
+    _install("replay", Cassette(path).load())
+
+
+def _install(mode, cassette):
+    from requests.adapters import HTTPAdapter
+
+    if _transport.original_send is None:
+        _transport.original_send = HTTPAdapter.send
+        HTTPAdapter.send = _send
+    _transport.mode = mode
+    _transport.cassette = cassette
+
+
+# Função para desativar o interceptador (grava o cassete no modo record)
+def stop():
+    if _transport.original_send is None:
+        return
+    from requests.adapters import HTTPAdapter
+
+    HTTPAdapter.send = _transport.original_send
+    _transport.original_send = None
+    if _transport.mode == "record":
+        _transport.cassette.save()
+    _transport.mode = None
+    _transport.cassette = None
@@ -0,0 +1,152 @@
+import os
+import re
+import json
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF
+
+from . import config, metrics
+
+# Extração das tabelas dos relatórios de Composição ("contas recebidas") copiados
+# para a landing zone. Os relatórios têm camada de texto: as palavras de cada página
+# são agrupadas em linhas pela posição vertical e cada linha com data e valor vira
+# um registro (documento, data, valor). As páginas são distribuídas entre processos
+# (o PyMuPDF não é thread-safe) e os registros saem em stream, na ordem das páginas,
+# para um JSON no mesmo formato da saída das guias.
+
+DATE_PATTERN = re.compile(r'^\d{2}/\d{2}/\d{4}$')
+AMOUNT_PATTERN = re.compile(r'^-?\d{1,3}(?:\.\d{3})*,\d{2}$')
+
+# Distância vertical máxima (em pontos) entre palavras da mesma linha da tabela
+ROW_TOLERANCE = 3.0
+# Páginas por tarefa enviada a um processo
+PAGES_PER_TASK = 4
+
+
+def parse_amount(text):
+    return float(text.replace('.', '').replace(',', '.'))
+
+
+def parse_date(text):
+    day, month, year = text.split('/')
+    return f"{year}-{month}-{day}"
+
+
+# Função para agrupar as palavras da página em linhas, da esquerda para a direita
+def group_rows(words, tolerance=ROW_TOLERANCE):
+    rows = []
+    for x0, y0, x1, y1, word, *_ in sorted(words, key=lambda w: ((w[1] + w[3]) / 2, w[0])):
+        middle = (y0 + y1) / 2
+        if rows and abs(rows[-1][0] - middle) <= tolerance:
+            rows[-1][1].append((x0, word))
+        else:
+            rows.append([middle, [(x0, word)]])
+    return [[word for _, word in sorted(row)] for _, row in rows]
+
+
+# Função para converter uma linha da tabela em registro: a primeira data, o último
+# valor e o documento (primeiro campo com dígitos que não é data nem valor)
+def parse_row(tokens):
+    dates = [token for token in tokens if DATE_PATTERN.match(token)]
+    amounts = [token for token in tokens if AMOUNT_PATTERN.match(token)]
+    if not dates or not amounts:
+        return None
+    rest = [token for token in tokens if token not in dates and token not in amounts]
+    documento = next((token for token in rest if any(c.isdigit() for c in token)), None)
+    if documento is None:
+        return None
+    return {
+        "Documento": documento,
+        "Data": parse_date(dates[0]),
+        "Valor": parse_amount(amounts[-1]),
+        "Descrição": ' '.join(token for token in rest if token != documento),
+    }
+
+
+def extract_page_rows(page):
+    return [row for row in (parse_row(tokens) for tokens in group_rows(page.get_text("words"))) if row]
+
+
+def _extract_pages(task):
+    path, file_name, pages = task
+    records = []
+    with fitz.open(path) as doc:
+        for page_num in pages:
+            for row in extract_page_rows(doc.load_page(page_num)):
+                records.append({"Nome do Arquivo": file_name, "Página": page_num + 1, **row})
+    return records, len(pages)
+
+
+# Função para extrair os registros de um relatório, com as páginas em `workers` processos
+def iter_report_rows(path, file_name, executor=None):
+    with fitz.open(path) as doc:
+        page_count = len(doc)
+    metrics.observe("pages_per_file", page_count, metrics.PAGE_BUCKETS)
+    tasks = [(path, file_name, list(range(start, min(start + PAGES_PER_TASK, page_count))))
+             for start in range(0, page_count, PAGES_PER_TASK)]
+    results = executor.map(_extract_pages, tasks) if executor is not None else map(_extract_pages, tasks)
+    for records, pages in results:
+        metrics.inc("report_pages", pages)
+        metrics.inc("report_rows", len(records))
+        yield from records
+
+
+# Gravador de lista JSON em stream: os registros vão para o disco à medida que saem
+class JsonArrayWriter:
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, 'w', encoding='utf-8')
+        self._file.write('[')
+        return self
+
+    def write(self, record):
+        self._file.write((',\n    ' if self.count else '\n    ') + json.dumps(record, ensure_ascii=False))
+        self.count += 1
+
+    def __exit__(self, *exc):
+        self._file.write('\n]\n' if self.count else ']\n')
+        self._file.close()
+
+
+def _local_pdf(storage, server_relative_url):
+    local_path = storage.local_path(server_relative_url)
+    if local_path:
+        return local_path, False
+    os.makedirs(config.PDF_DIR, exist_ok=True)
+    local_path = os.path.join(config.PDF_DIR, os.path.basename(server_relative_url))
+    with open(local_path, 'wb') as pdf_file:
+        pdf_file.write(storage.read_bytes(server_relative_url))
+    return local_path, True
+
+
+# Função principal: extrai as tabelas de todos os relatórios da landing zone
+def run(storage, folder_url=config.RELATORIOS_FOLDER_URL, output_path=None, workers=None):
+    if output_path is None:
+        output_path = os.path.join(config.OUTPUT_DIR, "relatorios_data.json")
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+
+    pdf_files = storage.list_pdfs(folder_url)
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        with JsonArrayWriter(output_path) as writer:
+            for pdf_file_name in pdf_files:
+                local_path, is_temp = _local_pdf(storage, f"{folder_url}/{pdf_file_name}")
+                try:
+                    for record in iter_report_rows(local_path, pdf_file_name, executor):
+                        writer.write(record)
+                except fitz.FileDataError as e:
+                    logging.error("Erro ao abrir o relatório %s: %s", pdf_file_name, e)
+                finally:
+                    if is_temp:
+                        os.remove(local_path)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    logging.info("%d linhas de %d relatórios salvas em %s", writer.count, len(pdf_files), output_path)
+    return writer.count
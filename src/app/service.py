@@ -0,0 +1,170 @@
+import os
+import json
+import time
+import logging
+import threading
+from urllib.parse import parse_qs, urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import fitz  # PyMuPDF
+
+from . import config, metrics
+from .dedup import sha256_of
+from .ocr import open_pdf, process_pdf
+
+# Serviço residente de extração de guias. O processo sobe uma vez com PyMuPDF e cv2
+# importados, o contexto do SharePoint autenticado, o classificador carregado e a
+# conexão com o motor de OCR aberta; cada requisição paga só o processamento do
+# arquivo. Endpoints (JSON):
+#   GET  /health                         -> estado do serviço
+#   GET  /metrics                        -> métricas no formato do Prometheus
+#   POST /guias?name=<arquivo>.pdf       -> corpo com o PDF
+#   POST /guias  {"path": "<caminho>"}   -> arquivo da landing zone
+# A resposta traz os registros extraídos no mesmo formato do consolidated_data.json.
+
+# Tamanho máximo do PDF enviado no corpo da requisição
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+
+
+class ExtractionService:
+    def __init__(self, storage, engine, classifier=None, dedup=None, images_dir=None, early_stop=True, cascade=True):
+        self.storage = storage
+        self.engine = engine
+        self.classifier = classifier
+        self.dedup = dedup
+        self.early_stop = early_stop
+        self.cascade = cascade
+        self.images_dir = images_dir or os.path.join(config.IMAGES_DIR, "service")
+        os.makedirs(self.images_dir, exist_ok=True)
+        # O PyMuPDF não é thread-safe: as extrações são feitas uma de cada vez
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.requests = 0
+
+    # Autentica no SharePoint e abre a conexão do OCR antes da primeira requisição
+    def warm(self):
+        ctx = getattr(self.storage, "ctx", None)
+        if ctx is not None:
+            logging.info("Contexto do SharePoint pronto: %s", self.storage.site_url)
+        self.engine.warm()
+
+    def _process(self, pdf_file_name, doc, file_sha256, source, size):
+        self.requests += 1
+        if self.dedup is not None:
+            self.dedup.add_file(file_sha256, source, size)
+        with doc:
+            return process_pdf(pdf_file_name, doc, self.images_dir, self.engine, self.classifier, self.dedup, file_sha256,
+                               self.early_stop, self.cascade)
+
+    # Função para extrair as guias de um PDF recebido em bytes
+    def extract_bytes(self, content, pdf_file_name):
+        try:
+            doc = fitz.open(stream=content, filetype="pdf")
+        except fitz.FileDataError:
+            raise ValueError(f"Arquivo {pdf_file_name} não é um PDF válido.")
+        with self._lock, metrics.stage("service_request"):
+            return self._process(pdf_file_name, doc, sha256_of(content), f"upload:{pdf_file_name}", len(content))
+
+    # Função para extrair as guias de um arquivo da landing zone. O caminho vem do
+    # cliente: ".." e caminhos (ou links) que saem do espelho são recusados
+    def extract_path(self, pdf_url):
+        if '..' in pdf_url.replace('\\', '/').split('/'):
+            raise PermissionError(f"Caminho fora da landing zone: {pdf_url}")
+        local_path = self.storage.local_path(pdf_url)
+        if local_path is not None:
+            root = os.path.realpath(self.storage.root)
+            if os.path.commonpath([root, os.path.realpath(local_path)]) != root:
+                raise PermissionError(f"Caminho fora da landing zone: {pdf_url}")
+        with self._lock, metrics.stage("service_request"):
+            doc, file_sha256, size = open_pdf(self.storage, pdf_url)
+            return self._process(os.path.basename(pdf_url), doc, file_sha256, pdf_url, size)
+
+    def health(self):
+        return {
+            "status": "ok",
+            "engine": self.engine.name,
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "requests": self.requests,
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    service = None
+
+    def _reply(self, status, payload, content_type="application/json; charset=utf-8"):
+        body = (payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if urlparse(self.path).path == "/health":
+            self._reply(200, self.service.health())
+        elif urlparse(self.path).path == "/metrics":
+            self._reply(200, metrics.registry.prometheus(), "text/plain; version=0.0.4")
+        else:
+            self._reply(404, {"error": "endpoint não encontrado"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/guias":
+            self._reply(404, {"error": "endpoint não encontrado"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length or length > MAX_UPLOAD_BYTES:
+            self._reply(413 if length else 400, {"error": f"corpo vazio ou maior que {MAX_UPLOAD_BYTES} bytes"})
+            return
+        content = self.rfile.read(length)
+
+        start = time.perf_counter()
+        try:
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                try:
+                    body = json.loads(content)
+                except ValueError:
+                    body = None
+                pdf_url = body.get("path") if isinstance(body, dict) else None
+                if not pdf_url or not isinstance(pdf_url, str):
+                    self._reply(400, {"error": "informe \"path\" com o caminho do arquivo na landing zone"})
+                    return
+                pdf_file_name = os.path.basename(pdf_url)
+                records = self.service.extract_path(pdf_url)
+            else:
+                pdf_file_name = parse_qs(url.query).get("name", ["upload.pdf"])[0]
+                records = self.service.extract_bytes(content, pdf_file_name)
+        except FileNotFoundError as e:
+            self._reply(404, {"error": str(e)})
+            return
+        except PermissionError as e:
+            self._reply(403, {"error": str(e)})
+            return
+        except ValueError as e:
+            self._reply(422, {"error": str(e)})
+            return
+        except Exception as e:
+            logging.exception("Erro ao processar a requisição")
+            metrics.inc("service_errors")
+            self._reply(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        elapsed = time.perf_counter() - start
+        metrics.inc("service_requests")
+        self._reply(200, {"file": pdf_file_name, "records": records, "seconds": round(elapsed, 3)})
+
+    def log_message(self, format, *args):
+        logging.debug("%s - %s", self.address_string(), format % args)
+
+
+# Função principal: sobe o serviço e atende até ser interrompido (Ctrl+C)
+def serve(service, host="127.0.0.1", port=8765):
+    service.warm()
+    handler = type("Handler", (_Handler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    logging.info("Serviço de extração ouvindo em http://%s:%d", host, port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("Encerrando o serviço de extração...")
+    finally:
+        server.server_close()
@@ -0,0 +1,35 @@
+import logging
+
+from . import config
+
+# Contextos autenticados, criados somente no primeiro uso de cada site
+_contexts = {}
+
+
+class AuthenticationError(Exception):
+    pass
+
+
+# Função para obter o contexto autenticado de um site do SharePoint
+def get_context(site_url):
+    if site_url in _contexts:
+        return _contexts[site_url]
+
+    from office365.sharepoint.client_context import ClientContext
+    from office365.runtime.auth.authentication_context import AuthenticationContext
+
+    logging.info("Autenticando no SharePoint: %s", site_url)
+    ctx_auth = AuthenticationContext(site_url)
+    if not ctx_auth.acquire_token_for_user(config.get_env('usuario'), config.get_env('senha')):
+        raise AuthenticationError(f"Erro na autenticação do SharePoint: {ctx_auth.get_last_error()}")
+    logging.info("Autenticação bem-sucedida: %s", site_url)
+
+    ctx = ClientContext(site_url, ctx_auth)
+    _contexts[site_url] = ctx
+    return ctx
+
+
+# Função para baixar o conteúdo binário de um arquivo
+def read_file(ctx, server_relative_url):
+    from office365.sharepoint.files.file import File
+    return File.open_binary(ctx, server_relative_url).content
@@ -0,0 +1,209 @@
+import os
+import mmap
+import logging
+import datetime
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from . import config, metrics
+
+# Leitura dos arquivos SPED EFD-Contribuições (SPED_PISCOFINS*.txt copiados para a
+# landing zone). Cada linha é um registro "|REG|campo|campo|...|" em Latin-1. O
+# arquivo é mapeado em memória e só as linhas dos registros pedidos são decodificadas
+# e convertidas; arquivos grandes são divididos em blocos (sempre em fim de linha)
+# processados em paralelo, com memória constante independente do tamanho do arquivo.
+
+ENCODING = "latin-1"
+
+# Tamanho dos blocos distribuídos entre os processos
+CHUNK_SIZE = 8 << 20
+
+# Campos dos registros mais usados (Guia Prático da EFD-Contribuições). Registros
+# fora da lista saem com os campos numerados (CAMPO_02, CAMPO_03, ...).
+LAYOUTS = {
+    "0000": ["REG", "COD_VER", "TIPO_ESCRIT", "IND_SIT_ESP", "NUM_REC_ANTERIOR", "DT_INI", "DT_FIN", "NOME", "CNPJ",
+             "UF", "COD_MUN", "SUFRAMA", "IND_NAT_PJ", "IND_ATIV"],
+    "0140": ["REG", "COD_EST", "NOME", "CNPJ", "UF", "IE", "COD_MUN", "IM", "SUFRAMA"],
+    "A010": ["REG", "CNPJ"],
+    "A100": ["REG", "IND_OPER", "IND_EMIT", "COD_PART", "COD_SIT", "SER", "SUB", "NUM_DOC", "CHV_NFSE", "DT_DOC",
+             "DT_EXE_SERV", "VL_DOC", "IND_PGTO", "VL_DESC", "VL_BC_PIS", "VL_PIS", "VL_BC_COFINS", "VL_COFINS",
+             "VL_PIS_RET", "VL_COFINS_RET", "VL_ISS"],
+    "C010": ["REG", "CNPJ", "IND_ESCRI"],
+    "C100": ["REG", "IND_OPER", "IND_EMIT", "COD_PART", "COD_MOD", "COD_SIT", "SER", "NUM_DOC", "CHV_NFE", "DT_DOC",
+             "DT_E_S", "VL_DOC", "IND_PGTO", "VL_DESC", "VL_ABAT_NT", "VL_MERC", "IND_FRT", "VL_FRT", "VL_SEG",
+             "VL_OUT_DA", "VL_BC_ICMS", "VL_ICMS", "VL_BC_ICMS_ST", "VL_ICMS_ST", "VL_IPI", "VL_PIS", "VL_COFINS",
+             "VL_PIS_ST", "VL_COFINS_ST"],
+    "C170": ["REG", "NUM_ITEM", "COD_ITEM", "DESCR_COMPL", "QTD", "UNID", "VL_ITEM", "VL_DESC", "IND_MOV", "CST_ICMS",
+             "CFOP", "COD_NAT", "VL_BC_ICMS", "ALIQ_ICMS", "VL_ICMS", "VL_BC_ICMS_ST", "ALIQ_ST", "VL_ICMS_ST",
+             "IND_APUR", "CST_IPI", "COD_ENQ", "VL_BC_IPI", "ALIQ_IPI", "VL_IPI", "CST_PIS", "VL_BC_PIS", "ALIQ_PIS",
+             "QUANT_BC_PIS", "ALIQ_PIS_QUANT", "VL_PIS", "CST_COFINS", "VL_BC_COFINS", "ALIQ_COFINS",
+             "QUANT_BC_COFINS", "ALIQ_COFINS_QUANT", "VL_COFINS", "COD_CTA"],
+    "M200": ["REG", "VL_TOT_CONT_NC_PER", "VL_TOT_CRED_DESC", "VL_TOT_CRED_DESC_ANT", "VL_TOT_CONT_NC_DEV",
+             "VL_RET_NC", "VL_OUT_DED_NC", "VL_CONT_NC_REC", "VL_TOT_CONT_CUM_PER", "VL_RET_CUM", "VL_OUT_DED_CUM",
+             "VL_CONT_CUM_REC", "VL_TOT_CONT_REC"],
+    "M210": ["REG", "COD_CONT", "VL_REC_BRT", "VL_BC_CONT", "VL_AJUS_ACRES_BC_PIS", "VL_AJUS_REDUC_BC_PIS",
+             "VL_BC_CONT_AJUS", "ALIQ_PIS", "QUANT_BC_PIS", "ALIQ_PIS_QUANT", "VL_CONT_APUR", "VL_AJUS_ACRES",
+             "VL_AJUS_REDUC", "VL_CONT_DIFER", "VL_CONT_DIFER_ANT", "VL_CONT_PER"],
+    "M600": ["REG", "VL_TOT_CONT_NC_PER", "VL_TOT_CRED_DESC", "VL_TOT_CRED_DESC_ANT", "VL_TOT_CONT_NC_DEV",
+             "VL_RET_NC", "VL_OUT_DED_NC", "VL_CONT_NC_REC", "VL_TOT_CONT_CUM_PER", "VL_RET_CUM", "VL_OUT_DED_CUM",
+             "VL_CONT_CUM_REC", "VL_TOT_CONT_REC"],
+    "M610": ["REG", "COD_CONT", "VL_REC_BRT", "VL_BC_CONT", "VL_AJUS_ACRES_BC_COFINS", "VL_AJUS_REDUC_BC_COFINS",
+             "VL_BC_CONT_AJUS", "ALIQ_COFINS", "QUANT_BC_COFINS", "ALIQ_COFINS_QUANT", "VL_CONT_APUR",
+             "VL_AJUS_ACRES", "VL_AJUS_REDUC", "VL_CONT_DIFER", "VL_CONT_DIFER_ANT", "VL_CONT_PER"],
+    "9999": ["REG", "QTD_LIN"],
+}
+
+# Prefixos dos campos numéricos (vírgula decimal) e de data (ddmmaaaa)
+DECIMAL_PREFIXES = ("VL_", "ALIQ_", "QTD", "QUANT_")
+DATE_PREFIXES = ("DT_",)
+
+# Registro lido: tipo, posição em bytes da linha no arquivo e campos convertidos
+Register = namedtuple('Register', ['reg', 'offset', 'fields'])
+
+
+def convert_field(name, value):
+    if value == '':
+        return None
+    if name.startswith(DECIMAL_PREFIXES):
+        try:
+            return Decimal(value.replace('.', '').replace(',', '.'))
+        except InvalidOperation:
+            return value
+    if name.startswith(DATE_PREFIXES) and len(value) == 8 and value.isdigit():
+        try:
+            return datetime.date(int(value[4:]), int(value[2:4]), int(value[:2]))
+        except ValueError:
+            return value
+    return value
+
+
+# Função para converter uma linha (bytes, ainda sem decodificar) em registro
+def parse_line(line, offset=None):
+    values = line.rstrip(b'\r\n').decode(ENCODING).split('|')[1:-1]
+    if not values:
+        return None
+    reg = values[0]
+    names = LAYOUTS.get(reg)
+    if names is None:
+        names = ["REG"] + [f"CAMPO_{index:02d}" for index in range(2, len(values) + 1)]
+    elif len(values) > len(names):
+        # Versões novas do leiaute acrescentam campos no fim
+        names = names + [f"CAMPO_{index:02d}" for index in range(len(names) + 1, len(values) + 1)]
+    return Register(reg, offset, {name: convert_field(name, value) for name, value in zip(names, values)})
+
+
+# Context manager que mapeia o arquivo em memória (somente leitura)
+class open_sped:
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._mm = None
+
+    def __enter__(self):
+        self._file = open(self.path, 'rb')
+        if os.fstat(self._file.fileno()).st_size == 0:
+            self._mm = b''
+        else:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mm
+
+    def __exit__(self, *exc):
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._file.close()
+
+
+def _wanted(registers):
+    if not registers:
+        return None
+    return {reg.encode('ascii') for reg in registers}
+
+
+# Gera os registros de um trecho [start, end) do arquivo mapeado. O filtro é
+# aplicado nos bytes do tipo de registro, antes de qualquer decodificação.
+def iter_slice(mm, start=0, end=None, registers=None):
+    wanted = _wanted(registers)
+    end = len(mm) if end is None else end
+    position = start
+    while position < end:
+        line_end = mm.find(b'\n', position, end)
+        if line_end == -1:
+            line_end = end
+        if mm[position:position + 1] == b'|':
+            reg_end = mm.find(b'|', position + 1, line_end)
+            if reg_end == -1:
+                reg_end = line_end
+            if wanted is None or mm[position + 1:reg_end] in wanted:
+                register = parse_line(mm[position:line_end], position)
+                if register is not None:
+                    yield register
+        position = line_end + 1
+
+
+# Função para dividir o arquivo em blocos que terminam sempre em fim de linha
+def chunk_bounds(mm, chunk_size=CHUNK_SIZE):
+    bounds = []
+    start = 0
+    size = len(mm)
+    while start < size:
+        end = min(start + chunk_size, size)
+        if end < size:
+            newline = mm.find(b'\n', end - 1)
+            end = size if newline == -1 else newline + 1
+        bounds.append((start, end))
+        start = end
+    return bounds
+
+
+def _parse_chunk(task):
+    path, start, end, registers = task
+    with open_sped(path) as mm:
+        return list(iter_slice(mm, start, end, registers))
+
+
+# Função para ler os registros de um arquivo SPED como stream, na ordem do arquivo.
+# Com workers > 1 os blocos são lidos em processos; no máximo 2 blocos por processo
+# ficam em memória ao mesmo tempo.
+def iter_registers(path, registers=None, workers=1, chunk_size=CHUNK_SIZE):
+    with open_sped(path) as mm:
+        size = len(mm)
+        if workers <= 1 or size <= chunk_size:
+            count = 0
+            for register in iter_slice(mm, registers=registers):
+                count += 1
+                yield register
+            metrics.inc("sped_registers", count)
+            metrics.inc("sped_bytes", size)
+            return
+        bounds = chunk_bounds(mm, chunk_size)
+
+    count = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        tasks = iter([(path, start, end, registers) for start, end in bounds])
+        pending = deque(executor.submit(_parse_chunk, task) for task in islice(tasks, workers * 2))
+        while pending:
+            chunk = pending.popleft().result()
+            task = next(tasks, None)
+            if task is not None:
+                pending.append(executor.submit(_parse_chunk, task))
+            count += len(chunk)
+            yield from chunk
+    metrics.inc("sped_registers", count)
+    metrics.inc("sped_bytes", size)
+    logging.info("SPED %s lido em %d blocos: %d registros.", path, len(bounds), count)
+
+
+# Função para obter um caminho local do SPED: direto no espelho local, ou baixado
+# (em stream) para SPED_DIR quando a landing zone é o SharePoint
+def fetch_sped(storage, server_relative_url):
+    local_path = storage.local_path(server_relative_url)
+    if local_path:
+        return local_path
+    os.makedirs(config.SPED_DIR, exist_ok=True)
+    local_path = os.path.join(config.SPED_DIR, os.path.basename(server_relative_url))
+    with storage.open_stream(server_relative_url) as stream, open(local_path, 'wb') as sped_file:
+        for chunk in iter(lambda: stream.read(1 << 20), b''):
+            sped_file.write(chunk)
+    return local_path
@@ -0,0 +1,176 @@
+import os
+import json
+import zlib
+import bisect
+import logging
+
+from . import metrics
+from .sped import iter_slice, open_sped, parse_line
+
+# Índice de posições (em bytes) dos registros de um arquivo SPED, gravado ao lado do
+# arquivo em "<arquivo>.idx" (JSON com as posições em delta, comprimido com zlib).
+# Guarda as linhas de cada tipo de registro e, por estabelecimento (CNPJ do 0140),
+# os trechos do arquivo abertos pelos registros X010 de cada bloco (A010, C010, ...),
+# para que as consultas leiam só as fatias necessárias do arquivo mapeado.
+
+INDEX_VERSION = 1
+INDEX_SUFFIX = ".idx"
+
+# Registros que abrem o trecho de um estabelecimento em cada bloco
+ESTABLISHMENT_REGS = {b"A010", b"C010", b"D010", b"F010", b"I010", b"P010"}
+
+
+def _deltas(values):
+    previous = 0
+    result = []
+    for value in values:
+        result.append(value - previous)
+        previous = value
+    return result
+
+
+def _undeltas(deltas):
+    total = 0
+    result = []
+    for delta in deltas:
+        total += delta
+        result.append(total)
+    return result
+
+
+class SpedIndex:
+    def __init__(self, sha256, size, mtime, registers, establishments):
+        self.sha256 = sha256
+        self.size = size
+        self.mtime = mtime
+        # tipo de registro -> posições das linhas, em ordem
+        self.registers = registers
+        # CNPJ -> {"0140": posição do 0140, "ranges": [[início, fim], ...]}
+        self.establishments = establishments
+
+    # Função para percorrer o arquivo uma vez e montar o índice
+    @classmethod
+    def build(cls, path, sha256):
+        registers = {}
+        establishments = {}
+        current = None
+        with metrics.stage("sped_index"), open_sped(path) as mm:
+            size = len(mm)
+            position = 0
+            while position < size:
+                line_end = mm.find(b'\n', position)
+                if line_end == -1:
+                    line_end = size
+                reg_end = mm.find(b'|', position + 1, line_end)
+                if mm[position:position + 1] == b'|' and reg_end != -1:
+                    reg = mm[position + 1:reg_end]
+                    registers.setdefault(reg.decode('ascii', errors='replace'), []).append(position)
+                    if reg in ESTABLISHMENT_REGS or reg.endswith(b"990"):
+                        if current is not None:
+                            current[1] = position
+                            current = None
+                        if reg in ESTABLISHMENT_REGS:
+                            cnpj = parse_line(mm[position:line_end]).fields["CNPJ"]
+                            current = [position, size]
+                            establishments.setdefault(cnpj, {"0140": None, "ranges": []})["ranges"].append(current)
+                    elif reg == b"0140":
+                        cnpj = parse_line(mm[position:line_end]).fields["CNPJ"]
+                        establishments.setdefault(cnpj, {"0140": None, "ranges": []})["0140"] = position
+                position = line_end + 1
+        metrics.inc("sped_index_builds")
+        return cls(sha256, size, os.path.getmtime(path), registers, establishments)
+
+    def save(self, index_path):
+        payload = {
+            "version": INDEX_VERSION,
+            "sha256": self.sha256,
+            "size": self.size,
+            "mtime": self.mtime,
+            "registers": {reg: _deltas(offsets) for reg, offsets in self.registers.items()},
+            "establishments": self.establishments,
+        }
+        with open(index_path + ".tmp", 'wb') as index_file:
+            index_file.write(zlib.compress(json.dumps(payload, separators=(',', ':')).encode('utf-8'), 6))
+        os.replace(index_path + ".tmp", index_path)
+
+    @classmethod
+    def load(cls, index_path):
+        with open(index_path, 'rb') as index_file:
+            payload = json.loads(zlib.decompress(index_file.read()))
+        if payload.get("version") != INDEX_VERSION:
+            return None
+        registers = {reg: _undeltas(deltas) for reg, deltas in payload["registers"].items()}
+        return cls(payload["sha256"], payload["size"], payload["mtime"], registers, payload["establishments"])
+
+    # Posições das linhas pedidas (por tipo de registro e/ou estabelecimento), em ordem
+    def offsets(self, registers=None, cnpj=None):
+        if registers:
+            offsets = sorted(offset for reg in registers for offset in self.registers.get(reg, []))
+        else:
+            offsets = sorted(offset for values in self.registers.values() for offset in values)
+        if cnpj is None:
+            return offsets
+
+        establishment = self.establishments.get(cnpj)
+        if establishment is None:
+            return []
+        selected = []
+        if establishment["0140"] is not None and (not registers or "0140" in registers):
+            selected.append(establishment["0140"])
+        for start, end in establishment["ranges"]:
+            selected.extend(offsets[bisect.bisect_left(offsets, start):bisect.bisect_left(offsets, end)])
+        return sorted(selected)
+
+
+# Função para obter o índice do arquivo, reconstruindo-o só se o conteúdo mudou.
+# Tamanho e data de modificação iguais dispensam o hash; se mudaram, o SHA-256
+# decide se o índice ainda vale.
+def get_index(path, index_path=None):
+    from .dedup import sha256_of
+
+    index_path = index_path or path + INDEX_SUFFIX
+    stat = os.stat(path)
+    index = None
+    if os.path.exists(index_path):
+        try:
+            index = SpedIndex.load(index_path)
+        except (OSError, ValueError, zlib.error) as e:
+            logging.warning("Índice %s ilegível (%s); será reconstruído.", index_path, e)
+    if index is not None and index.size == stat.st_size and index.mtime == stat.st_mtime:
+        metrics.inc("cache_hits", cache="sped_index")
+        return index
+
+    with open_sped(path) as mm:
+        sha256 = sha256_of(mm)
+    if index is not None and index.sha256 == sha256:
+        metrics.inc("cache_hits", cache="sped_index")
+        index.mtime = stat.st_mtime
+        index.save(index_path)
+        return index
+
+    logging.info("Montando o índice de %s.", path)
+    index = SpedIndex.build(path, sha256)
+    index.save(index_path)
+    logging.info("Índice salvo em %s: %d tipos de registro, %d estabelecimentos.",
+                 index_path, len(index.registers), len(index.establishments))
+    return index
+
+
+# Função para consultar os registros pelo índice: lê só as linhas indicadas,
+# direto nas posições do arquivo mapeado
+def query(path, registers=None, cnpj=None, index_path=None):
+    index = get_index(path, index_path)
+    if not registers and cnpj is None:
+        with open_sped(path) as mm:
+            yield from iter_slice(mm)
+        return
+
+    count = 0
+    with open_sped(path) as mm:
+        for offset in index.offsets(registers, cnpj):
+            line_end = mm.find(b'\n', offset)
+            register = parse_line(mm[offset:len(mm) if line_end == -1 else line_end], offset)
+            if register is not None:
+                count += 1
+                yield register
+    metrics.inc("sped_registers", count)
@@ -0,0 +1,194 @@
+import io
+import os
+import mmap
+import shutil
+import logging
+from collections import namedtuple
+
+from . import config, metrics
+
+# Entrada de uma listagem de pasta (arquivo ou subpasta)
+StorageEntry = namedtuple('StorageEntry', ['name', 'path', 'is_folder', 'size', 'modified'])
+
+
+class Storage:
+    # Lista arquivos e subpastas de uma pasta (FileNotFoundError se a pasta não existe)
+    def list(self, folder_url):
+        raise NotImplementedError
+
+    # Retorna a StorageEntry de um arquivo
+    def stat(self, path):
+        raise NotImplementedError
+
+    # Abre o arquivo para leitura como objeto binário com read/seek
+    def open_stream(self, path):
+        raise NotImplementedError
+
+    # Grava um arquivo (bytes ou objeto com read) em uma pasta
+    def put(self, folder_url, name, content):
+        raise NotImplementedError
+
+    # Caminho no sistema de arquivos local, quando o backend tiver um
+    def local_path(self, path):
+        return None
+
+    def list_files(self, folder_url):
+        return [entry for entry in self.list(folder_url) if not entry.is_folder]
+
+    def list_folders(self, folder_url):
+        return [entry for entry in self.list(folder_url) if entry.is_folder]
+
+    def list_pdfs(self, folder_url):
+        logging.info("Listando arquivos PDF na pasta: %s", folder_url)
+        return [entry.name for entry in self.list_files(folder_url) if entry.name.endswith(".pdf")]
+
+    def read_bytes(self, path):
+        with self.open_stream(path) as stream:
+            return stream.read()
+
+    # Copia um arquivo deste backend para uma pasta de outro backend
+    def copy(self, path, target, target_folder_url, new_file_name):
+        logging.info("Copiando arquivo de %s para %s", path, f"{target_folder_url}/{new_file_name}")
+        with metrics.stage("copy"), self.open_stream(path) as stream:
+            target.put(target_folder_url, new_file_name, stream)
+        metrics.inc("files_copied")
+        logging.info("Arquivo %s copiado com sucesso para %s", new_file_name, target_folder_url)
+
+
+class SharePointStorage(Storage):
+    def __init__(self, site_url):
+        self.site_url = site_url
+
+    # O contexto só é autenticado no primeiro acesso
+    @property
+    def ctx(self):
+        from .sharepoint import get_context
+        return get_context(self.site_url)
+
+    def list(self, folder_url):
+        ctx = self.ctx
+        with metrics.stage("crawl"):
+            folder = ctx.web.get_folder_by_server_relative_url(folder_url)
+            subfolders = folder.folders
+            files = folder.files
+            ctx.load(subfolders)
+            ctx.load(files)
+            try:
+                ctx.execute_query()
+            except Exception as e:
+                # Pasta inexistente vira o mesmo erro do espelho local; os demais sobem como estão
+                response = getattr(e, 'response', None)
+                if getattr(response, 'status_code', None) == 404:
+                    raise FileNotFoundError(f"Pasta não encontrada no SharePoint: {folder_url}") from e
+                raise
+        metrics.inc("sharepoint_requests", operation="list")
+
+        entries = [StorageEntry(sf.properties['Name'], sf.serverRelativeUrl, True, None, None) for sf in subfolders]
+        entries += [self._file_entry(file) for file in files]
+        return entries
+
+    def stat(self, path):
+        ctx = self.ctx
+        file = ctx.web.get_file_by_server_relative_url(path)
+        ctx.load(file)
+        ctx.execute_query()
+        return self._file_entry(file)
+
+    def open_stream(self, path):
+        from .sharepoint import read_file
+        with metrics.stage("download"):
+            content = read_file(self.ctx, path)
+        metrics.inc("sharepoint_requests", operation="download")
+        metrics.inc("bytes_transferred", len(content), direction="download")
+        metrics.observe("file_bytes", len(content), metrics.SIZE_BUCKETS)
+        return io.BytesIO(content)
+
+    def put(self, folder_url, name, content):
+        if hasattr(content, 'read'):
+            content = content.read()
+        target_folder = self.ctx.web.get_folder_by_server_relative_url(folder_url)
+        target_folder.upload_file(name, content).execute_query()
+        metrics.inc("sharepoint_requests", operation="upload")
+        metrics.inc("bytes_transferred", len(content), direction="upload")
+
+    def _file_entry(self, file):
+        size = file.properties.get('Length')
+        return StorageEntry(file.properties['Name'], file.serverRelativeUrl, False,
+                            int(size) if size is not None else None, file.properties.get('TimeLastModified'))
+
+
+class LocalStorage(Storage):
+    # root: diretório local com o espelho; base_url: prefixo do SharePoint que corresponde a root
+    def __init__(self, root, base_url=None):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url.rstrip('/') if base_url else None
+
+    def local_path(self, path):
+        if self.base_url and (path == self.base_url or path.startswith(self.base_url + '/')):
+            path = path[len(self.base_url):]
+        return os.path.join(self.root, path.lstrip('/'))
+
+    # Converte um caminho local de volta para o formato do SharePoint
+    def _url(self, local_path):
+        relative = os.path.relpath(local_path, self.root).replace(os.sep, '/')
+        return f"{self.base_url or ''}/{relative}"
+
+    def list(self, folder_url):
+        entries = []
+        with metrics.stage("crawl"), os.scandir(self.local_path(folder_url)) as it:
+            for dir_entry in sorted(it, key=lambda e: e.name):
+                if dir_entry.is_dir():
+                    entries.append(StorageEntry(dir_entry.name, self._url(dir_entry.path), True, None, None))
+                else:
+                    st = dir_entry.stat()
+                    entries.append(StorageEntry(dir_entry.name, self._url(dir_entry.path), False, st.st_size, st.st_mtime))
+        return entries
+
+    def stat(self, path):
+        local = self.local_path(path)
+        st = os.stat(local)
+        return StorageEntry(os.path.basename(local), path, False, st.st_size, st.st_mtime)
+
+    # Retorna um mmap somente leitura: o PdfReader lê direto das páginas mapeadas,
+    # sem cópia intermediária (o PyMuPDF abre o arquivo pelo local_path)
+    def open_stream(self, path):
+        with open(self.local_path(path), 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            metrics.inc("bytes_read", size, backend="local")
+            if size == 0:
+                return io.BytesIO(b'')
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def put(self, folder_url, name, content):
+        folder = self.local_path(folder_url)
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, name), 'wb') as file:
+            if hasattr(content, 'read'):
+                shutil.copyfileobj(content, file)
+            else:
+                file.write(content)
+
+    def copy(self, path, target, target_folder_url, new_file_name):
+        if not isinstance(target, LocalStorage):
+            return super().copy(path, target, target_folder_url, new_file_name)
+        folder = target.local_path(target_folder_url)
+        os.makedirs(folder, exist_ok=True)
+        with metrics.stage("copy"):
+            shutil.copyfile(self.local_path(path), os.path.join(folder, new_file_name))
+        metrics.inc("files_copied")
+        logging.info("Arquivo %s copiado com sucesso para %s", new_file_name, target_folder_url)
+
+
+# Função para escolher o backend: espelho local quando informado, senão SharePoint
+def get_storage(site_url, mirror_dir=None, base_url=None):
+    if mirror_dir:
+        return LocalStorage(mirror_dir, base_url)
+    return SharePointStorage(site_url)
+
+
+def get_source_storage(mirror_dir=None):
+    return get_storage(config.SITE_URL, mirror_dir, config.SITE_ROOT)
+
+
+def get_landing_zone_storage(mirror_dir=None):
+    return get_storage(config.LANDING_ZONE_URL, mirror_dir, config.LANDING_ZONE_ROOT)
@@ -0,0 +1,252 @@
+import io
+import os
+import json
+import time
+import heapq
+import logging
+import itertools
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from PyPDF2 import PdfReader
+
+from . import config, logs, metrics
+
+DARF_HEADER = "Documento de Arrecadação\nde Receitas Federais\n \n"
+COMPOSICAO_HEADER = "Total Multa JurosComposição do Documento de Arrecadação\n"
+
+# Modo em fluxo: downloads simultâneos (buffers em memória) à frente do parse
+PREFETCH = 8
+
+
+# Função para juntar o texto de todas as páginas de um PDF (uma única concatenação)
+def pdf_text_from_stream(stream):
+    pdf_reader = PdfReader(stream)
+    return ''.join(page.extract_text() or '' for page in pdf_reader.pages)
+
+
+# Função para ler o conteúdo de um PDF direto do stream do storage, sem arquivo temporário
+def read_pdf_content(storage, pdf_url):
+    with storage.open_stream(pdf_url) as stream, metrics.stage("extract_text"):
+        return pdf_text_from_stream(stream)
+
+
+# Função para extrair o CNPJ, nome da empresa, valor total, data de vencimento, data de apuração, número do documento, código e descrição do imposto
+def extract_data(pdf_content):
+    # Verificar se o conteúdo foi extraído corretamente
+    if not pdf_content.strip():
+        logging.error("Conteúdo do PDF não pôde ser extraído.")
+        return None, None, None, None, None, None, None, None, pdf_content
+
+    try:
+        # Extrair CNPJ e nome da empresa
+        start_index = pdf_content.find(DARF_HEADER) + len(DARF_HEADER)
+        cnpj = pdf_content[start_index:start_index + 18].strip()
+        end_index = pdf_content.find("\nPeríodo de Apuração", start_index)
+        company_name = pdf_content[start_index + 19:end_index].strip()
+
+        # Extrair valor total do documento
+        value_start_index = pdf_content.find("Valor Total do Documento\n") + len("Valor Total do Documento\n")
+        value_end_index = pdf_content.find("CNPJ", value_start_index)
+        total_value = pdf_content[value_start_index:value_end_index].strip()
+
+        # Extrair data de vencimento
+        due_date_start_index = pdf_content.find("Pagar este documento até\n") + len("Pagar este documento até\n")
+        due_date_end_index = pdf_content.find("Observações", due_date_start_index)
+        due_date = pdf_content[due_date_start_index:due_date_end_index].strip()
+
+        # Extrair data de apuração
+        apuration_date_start_index = pdf_content.find("Razão Social\n") + len("Razão Social\n")
+        apuration_date_end_index = pdf_content.find(" ", apuration_date_start_index)
+        apuration_date = pdf_content[apuration_date_start_index:apuration_date_end_index].strip()
+
+        # Extrair número do documento
+        doc_number_start_index = pdf_content.find("Número do Documento\n") + len("Número do Documento\n")
+        doc_number_end_index = pdf_content.find("Pagar este", doc_number_start_index)
+        doc_number = pdf_content[doc_number_start_index:doc_number_end_index].strip()
+
+        # Extrair código e descrição do imposto
+        tax_code_start_index = pdf_content.find(COMPOSICAO_HEADER) + len(COMPOSICAO_HEADER)
+        tax_code = pdf_content[tax_code_start_index:tax_code_start_index + 4].strip()
+        tax_description = pdf_content[tax_code_start_index + 4:tax_code_start_index + 40].strip()
+
+        return cnpj, company_name, total_value, due_date, apuration_date, doc_number, tax_code, tax_description, pdf_content
+    except Exception as e:
+        logging.error("Erro ao extrair dados do PDF: %s", str(e))
+        return None, None, None, None, None, None, None, None, pdf_content
+
+
+# Função para montar o registro de saída a partir do conteúdo do PDF. Com o armazém
+# de textos, o texto bruto extraído vai para o armazém e o registro leva só a
+# referência ("Content Ref").
+def build_record(pdf_name, pdf_content, text_store=None):
+    with metrics.stage("parse"):
+        cnpj, company_name, total_value, due_date, apuration_date, doc_number, tax_code, tax_description, corrected_content = extract_data(pdf_content)
+    if not corrected_content:
+        metrics.inc("pages_skipped", reason="empty")
+        return None
+    metrics.inc("records_extracted")
+    record = {
+        "File Name": pdf_name,
+        "CNPJ": cnpj,
+        "Company Name": company_name,
+        "Total Value": total_value,
+        "Due Date": due_date,
+        "Apuration Date": apuration_date,
+        "Document Number": doc_number,
+        "Tax Code": tax_code,
+        "Tax Description": tax_description,
+    }
+    if text_store is None:
+        record["Content"] = corrected_content
+    else:
+        record["Content Ref"] = text_store.put(pdf_content)
+    return record
+
+
+# Função para salvar os dados extraídos em um único arquivo JSON
+def save_all_data_to_json(data_list, output_filename):
+    with open(output_filename, 'w', encoding='utf-8') as json_file:
+        json.dump(data_list, json_file, ensure_ascii=False, indent=4)
+    logging.info("Todos os dados salvos em %s", output_filename)
+
+
+def _init_worker():
+    # Métricas herdadas do processo pai (fork) não podem voltar somadas em dobro
+    metrics.registry.drain()
+
+
+# Tarefa vazia: só para criar os processos de trabalho
+def _warm():
+    return None
+
+
+# Tarefa de um processo de trabalho: texto do PDF baixado em memória, com as métricas
+# acumuladas no processo desde a última tarefa
+def _extract_text(content):
+    with metrics.stage("extract_text"):
+        text = pdf_text_from_stream(io.BytesIO(content))
+    return text, metrics.registry.drain()
+
+
+# Função para extrair as guias em fluxo: até `prefetch` downloads simultâneos (threads,
+# conteúdo em memória) alimentam o parse em `workers` processos, e cada registro sai
+# assim que o seu arquivo termina, na ordem de conclusão: (nome do PDF, registro).
+# O total de PDFs em memória fica limitado a prefetch + workers. Com o diário, um
+# arquivo que falha (download ou leitura) é tentado de novo com a política do modo
+# sequencial (retries e espera exponencial do diário) antes de ficar como falha.
+def iter_records(storage, folder_url, pdf_files, workers=None, prefetch=PREFETCH, journal=None, text_store=None):
+    workers = workers or os.cpu_count() or 1
+    retries = journal.retries if journal is not None else 0
+    pending = deque(pdf_files)
+    downloads = {}
+    parses = {}
+    attempts = {}
+    # Arquivos que falharam esperando a nova tentativa: (quando, ordem, nome, url)
+    retry_queue = []
+    sequence = itertools.count()
+
+    def fail(pdf_name, pdf_url, stage, e):
+        if journal is not None:
+            journal.fail("parse", pdf_url, f"{type(e).__name__}: {e}")
+        attempt = attempts[pdf_url] = attempts.get(pdf_url, 0) + 1
+        if attempt <= retries:
+            delay = journal.backoff * 2 ** (attempt - 1)
+            logging.warning("Erro ao ler o PDF %s (%s): %s; nova tentativa em %.1fs.", pdf_name, stage, e, delay)
+            heapq.heappush(retry_queue, (time.time() + delay, next(sequence), pdf_name, pdf_url))
+            return
+        logging.error("Erro ao ler o PDF %s (%s): %s", pdf_name, stage, e)
+        metrics.inc("pages_skipped", reason=stage)
+
+    def download(pdf_name, pdf_url):
+        if journal is not None:
+            journal.start("parse", pdf_url)
+        downloads[downloader.submit(storage.read_bytes, pdf_url)] = (pdf_name, pdf_url)
+
+    # Os processos (fork) são criados na primeira tarefa: isso tem que acontecer antes
+    # de existirem as threads de download, senão um filho pode herdar travado o lock das
+    # métricas que uma delas segurava no momento do fork
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as parser:
+        parser.submit(_warm).result()
+        with ThreadPoolExecutor(max_workers=prefetch) as downloader:
+            while pending or downloads or parses or retry_queue:
+                while retry_queue and retry_queue[0][0] <= time.time() and len(downloads) < prefetch:
+                    _, _, pdf_name, pdf_url = heapq.heappop(retry_queue)
+                    download(pdf_name, pdf_url)
+                while pending and len(downloads) < prefetch and len(downloads) + len(parses) < prefetch + workers:
+                    pdf_name = pending.popleft()
+                    pdf_url = f"{folder_url}/{pdf_name}"
+                    unit = journal.get("parse", pdf_url) if journal is not None else None
+                    if unit is not None and unit.state == "done":
+                        metrics.inc("journal_skipped", kind="parse")
+                        yield pdf_name, unit.result
+                        continue
+                    download(pdf_name, pdf_url)
+
+                timeout = max(0.0, retry_queue[0][0] - time.time()) if retry_queue else None
+                if not downloads and not parses:
+                    if timeout:
+                        time.sleep(timeout)
+                    continue
+                done, _ = wait(list(downloads) + list(parses), timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in downloads:
+                        pdf_name, pdf_url = downloads.pop(future)
+                        try:
+                            content = future.result()
+                        except Exception as e:
+                            fail(pdf_name, pdf_url, "download", e)
+                            continue
+                        parses[parser.submit(_extract_text, content)] = (pdf_name, pdf_url)
+                        continue
+
+                    pdf_name, pdf_url = parses.pop(future)
+                    try:
+                        text, snapshot = future.result()
+                    except Exception as e:
+                        fail(pdf_name, pdf_url, "extract_text", e)
+                        continue
+                    metrics.registry.merge(snapshot)
+                    with logs.log_context(file=pdf_name):
+                        record = build_record(pdf_name, text, text_store)
+                    if journal is not None:
+                        journal.finish("parse", pdf_url, record)
+                    yield pdf_name, record
+
+
+# Função principal: extração pela camada de texto de todas as guias da landing zone.
+# Com `stream`, os PDFs são baixados e lidos em paralelo (iter_records) e cada registro
+# vai para a base local assim que fica pronto; o JSON mantém a ordem da listagem.
+def run(storage, folder_url=config.GUIAS_FOLDER_URL, output_filename=None, journal=None, text_store=None, guia_db=None,
+        stream=False, workers=None, prefetch=PREFETCH):
+    os.makedirs(config.OUTPUT_DIR, exist_ok=True)
+    pdf_files = storage.list_pdfs(folder_url)
+    logging.info("Arquivos PDF encontrados: %s", pdf_files)
+
+    all_data = []
+    if stream:
+        records = {}
+        for pdf_name, record in iter_records(storage, folder_url, pdf_files, workers, prefetch, journal, text_store):
+            if record:
+                records[pdf_name] = record
+                if guia_db is not None:
+                    guia_db.upsert([record])
+        all_data = [records[pdf_name] for pdf_name in pdf_files if pdf_name in records]
+    else:
+        for pdf_name in pdf_files:
+            logging.info("Lendo o PDF: %s", pdf_name)
+            pdf_url = f"{folder_url}/{pdf_name}"
+            with logs.log_context(file=pdf_name):
+                if journal is None:
+                    record = build_record(pdf_name, read_pdf_content(storage, pdf_url), text_store)
+                else:
+                    record = journal.run("parse", pdf_url, lambda: build_record(pdf_name, read_pdf_content(storage, pdf_url), text_store))
+            if record:
+                all_data.append(record)
+
+    if output_filename is None:
+        output_filename = os.path.join(config.OUTPUT_DIR, 'all_data.json')
+    save_all_data_to_json(all_data, output_filename)
+    if guia_db is not None and not stream:
+        guia_db.upsert(all_data)
+    return all_data
@@ -0,0 +1,313 @@
+import os
+import json
+import zlib
+import hashlib
+import logging
+import threading
+
+from . import config, metrics
+
+# Armazém do texto bruto extraído (OCR ou camada de texto), endereçado pelo conteúdo:
+# cada texto é gravado uma vez, comprimido, com o SHA-256 como nome, e os registros
+# do JSON de saída guardam só a referência ("sha256:<hex>"). Assim o JSON fica
+# pequeno e o parser pode ser rodado de novo sobre o texto sem refazer o OCR.
+#
+# Os objetos novos são gravados soltos em objects/<2 primeiros>/<resto> (escrita
+# atômica, segura com vários processos). A compactação junta os objetos soltos e os
+# pacotes existentes em um único pacote (packs/pack-<hash>.pack, objetos em
+# sequência, com o índice de posições em pack-<hash>.idx) e pode descartar os
+# objetos que nenhum JSON de saída referencia mais. Não deve rodar com escritores ativos.
+#
+# Páginas reconhecidas que o parser não transformou em registro também têm o texto
+# guardado; a referência vai para unparsed.jsonl (arquivo, página, referência), de onde
+# o reparse as recupera sem refazer o OCR, e a compactação sempre as mantém.
+
+REF_PREFIX = "sha256:"
+
+# Primeiro byte de cada objeto: como o restante foi codificado
+CODEC_ZDICT = b'd'  # zlib com dicionário de termos das guias (textos)
+CODEC_ZLIB = b'z'   # zlib simples
+
+# Dicionário de compressão: textos de guia são curtos (poucos KB) e repetem os mesmos
+# rótulos; com eles pré-carregados no zlib, cada texto comprime como se não fosse o primeiro
+ZDICT = '\n'.join([
+    "Receita Federal", "Documento de Arrecadação", "de Receitas Federais", "Documento de Arrecadação de Receitas Federais",
+    "CNPJ", "Razão Social", "Período de Apuração", "Data de Vencimento", "Número do Documento",
+    "Pagar este documento até", "Observações", "Composição do Documento de Arrecadação",
+    "Código", "Denominação", "Principal", "Multa", "Juros", "Total", "Valor Total do Documento",
+    "PIS - FATURAMENTO Principal", "COFINS CONTRIB P/ FIN. SEG. SOCIAL", "IRPJ LUCRO PRESUMIDO", "CSLL - DEMAIS Principal",
+    "SENDA", "Pagamento", "AUTENTICAÇÃO BANCÁRIA", "Código de Barras", "Valor", "Totais", "LTDA", "EIRELI",
+]).encode('utf-8')
+
+PACK_SUFFIX = ".pack"
+INDEX_SUFFIX = ".idx"
+UNPARSED_FILE = "unparsed.jsonl"
+
+
+def make_ref(digest):
+    return REF_PREFIX + digest
+
+
+def parse_ref(ref):
+    if not isinstance(ref, str) or not ref.startswith(REF_PREFIX):
+        raise ValueError(f"Referência inválida: {ref!r}")
+    return ref[len(REF_PREFIX):]
+
+
+def _encode(data):
+    compressor = zlib.compressobj(9, zdict=ZDICT)
+    return CODEC_ZDICT + compressor.compress(data) + compressor.flush()
+
+
+def _decode(blob):
+    codec, payload = blob[:1], blob[1:]
+    if codec == CODEC_ZDICT:
+        decompressor = zlib.decompressobj(zdict=ZDICT)
+        return decompressor.decompress(payload) + decompressor.flush()
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(payload)
+    raise ValueError(f"Codificação de objeto desconhecida: {codec!r}")
+
+
+class TextStore:
+    def __init__(self, root=config.TEXT_STORE_DIR):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.packs_dir = os.path.join(root, "packs")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.packs_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._unparsed_file = None
+        self._load_packs()
+
+    def close(self):
+        with self._lock:
+            if self._unparsed_file is not None:
+                self._unparsed_file.close()
+                self._unparsed_file = None
+
+    # Índices de todos os pacotes em memória: hash -> (pacote, posição, tamanho)
+    def _load_packs(self):
+        self._packs = {}
+        for name in sorted(os.listdir(self.packs_dir)):
+            if not name.endswith(INDEX_SUFFIX):
+                continue
+            pack_path = os.path.join(self.packs_dir, name[:-len(INDEX_SUFFIX)] + PACK_SUFFIX)
+            with open(os.path.join(self.packs_dir, name), 'rb') as index_file:
+                index = json.loads(zlib.decompress(index_file.read()))
+            for digest, (offset, length) in index.items():
+                self._packs[digest] = (pack_path, offset, length)
+
+    def _loose_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest[2:])
+
+    def contains(self, ref):
+        digest = parse_ref(ref)
+        return digest in self._packs or os.path.exists(self._loose_path(digest))
+
+    # Grava um texto (ou bytes) e devolve a referência; conteúdo já gravado não é regravado
+    def put(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._loose_path(digest)
+        if digest in self._packs or os.path.exists(path):
+            metrics.inc("textstore_objects", state="existing")
+            return make_ref(digest)
+
+        blob = _encode(data)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as object_file:
+            object_file.write(blob)
+        os.replace(tmp_path, path)
+        metrics.inc("textstore_objects", state="new")
+        metrics.inc("textstore_bytes", len(data), kind="raw")
+        metrics.inc("textstore_bytes", len(blob), kind="stored")
+        return make_ref(digest)
+
+    # Registra o texto de uma página que não virou registro (uma linha por página; a
+    # escrita em modo append de uma linha curta é segura com vários processos). O
+    # arquivo fica aberto até o close; cada linha é descarregada na hora.
+    def add_unparsed(self, ref, file_name, page):
+        line = json.dumps({"ref": ref, "file": file_name, "page": page}, ensure_ascii=False) + '\n'
+        with self._lock:
+            if self._unparsed_file is None:
+                self._unparsed_file = open(os.path.join(self.root, UNPARSED_FILE), 'a', encoding='utf-8')
+            self._unparsed_file.write(line)
+            self._unparsed_file.flush()
+        metrics.inc("textstore_unparsed")
+
+    # Páginas não transformadas em registro, sem repetições: [{"ref", "file", "page"}]
+    def unparsed(self):
+        path = os.path.join(self.root, UNPARSED_FILE)
+        if not os.path.exists(path):
+            return []
+        entries = {}
+        with open(path, 'r', encoding='utf-8') as unparsed_file:
+            for line in unparsed_file:
+                if line.strip():
+                    entry = json.loads(line)
+                    entries[(entry["file"], entry["page"], entry["ref"])] = entry
+        return list(entries.values())
+
+    def _read_blob(self, digest):
+        location = self._packs.get(digest)
+        if location is not None:
+            pack_path, offset, length = location
+            with open(pack_path, 'rb') as pack_file:
+                pack_file.seek(offset)
+                return pack_file.read(length)
+        try:
+            with open(self._loose_path(digest), 'rb') as object_file:
+                return object_file.read()
+        except FileNotFoundError:
+            raise KeyError(make_ref(digest))
+
+    def get(self, ref):
+        digest = parse_ref(ref)
+        data = _decode(self._read_blob(digest))
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"Objeto corrompido: {ref}")
+        return data
+
+    def get_text(self, ref):
+        return self.get(ref).decode('utf-8')
+
+    def _loose_digests(self):
+        for prefix in sorted(os.listdir(self.objects_dir)):
+            prefix_dir = os.path.join(self.objects_dir, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for rest in sorted(os.listdir(prefix_dir)):
+                if not rest.endswith(".tmp"):
+                    yield prefix + rest
+
+    def stats(self):
+        loose = list(self._loose_digests())
+        loose_bytes = sum(os.path.getsize(self._loose_path(digest)) for digest in loose)
+        packs = [name for name in os.listdir(self.packs_dir) if name.endswith(PACK_SUFFIX)]
+        pack_bytes = sum(os.path.getsize(os.path.join(self.packs_dir, name)) for name in packs)
+        return {
+            "objects": len(set(loose) | set(self._packs)),
+            "loose_objects": len(loose),
+            "loose_bytes": loose_bytes,
+            "packs": len(packs),
+            "pack_bytes": pack_bytes,
+        }
+
+    # Função para compactar o armazém: todos os objetos (ou só os de `live`, um
+    # conjunto de referências) vão para um pacote novo; os soltos e os pacotes
+    # antigos são apagados. Retorna (objetos mantidos, objetos descartados).
+    def compact(self, live=None):
+        live_digests = None if live is None else {parse_ref(ref) for ref in live} | {parse_ref(entry["ref"]) for entry in self.unparsed()}
+        with self._lock, metrics.stage("textstore_compact"):
+            loose = list(self._loose_digests())
+            digests = sorted(set(loose) | set(self._packs))
+            keep = [digest for digest in digests if live_digests is None or digest in live_digests]
+            dropped = len(digests) - len(keep)
+
+            old_packs = sorted({pack_path for pack_path, _, _ in self._packs.values()})
+            hasher = hashlib.sha256()
+            index = {}
+            tmp_pack = os.path.join(self.packs_dir, f"tmp-{os.getpid()}{PACK_SUFFIX}")
+            with open(tmp_pack, 'wb') as pack_file:
+                offset = 0
+                for digest in keep:
+                    blob = self._read_blob(digest)
+                    pack_file.write(blob)
+                    hasher.update(digest.encode('ascii'))
+                    index[digest] = [offset, len(blob)]
+                    offset += len(blob)
+
+            pack_name = f"pack-{hasher.hexdigest()[:16]}"
+            pack_path = os.path.join(self.packs_dir, pack_name + PACK_SUFFIX)
+            if keep:
+                os.replace(tmp_pack, pack_path)
+                # O índice é gravado por último: pacote sem índice é ignorado na leitura
+                tmp_index = os.path.join(self.packs_dir, pack_name + INDEX_SUFFIX + ".tmp")
+                with open(tmp_index, 'wb') as index_file:
+                    index_file.write(zlib.compress(json.dumps(index, separators=(',', ':')).encode('ascii'), 6))
+                os.replace(tmp_index, os.path.join(self.packs_dir, pack_name + INDEX_SUFFIX))
+            else:
+                os.remove(tmp_pack)
+
+            for old_pack in old_packs:
+                if old_pack != pack_path:
+                    os.remove(old_pack[:-len(PACK_SUFFIX)] + INDEX_SUFFIX)
+                    os.remove(old_pack)
+            for digest in loose:
+                os.remove(self._loose_path(digest))
+            for prefix in os.listdir(self.objects_dir):
+                prefix_dir = os.path.join(self.objects_dir, prefix)
+                if os.path.isdir(prefix_dir) and not os.listdir(prefix_dir):
+                    os.rmdir(prefix_dir)
+            self._load_packs()
+
+        metrics.inc("textstore_compacted", len(keep))
+        metrics.inc("textstore_pruned", dropped)
+        logging.info("Armazém de textos compactado: %d objetos em %s, %d descartados.", len(keep), pack_name, dropped)
+        return len(keep), dropped
+
+
+# Campos dos registros de saída que guardam referências ao armazém
+REF_FIELDS = ("Texto", "Content Ref")
+
+
+# Função para reunir as referências usadas nos JSONs de saída (para a compactação)
+def collect_refs(json_paths):
+    refs = set()
+    for path in json_paths:
+        with open(path, 'r', encoding='utf-8') as json_file:
+            for record in json.load(json_file):
+                refs.update(record[field] for field in REF_FIELDS if record.get(field))
+    return refs
+
+
+# Função para rodar o parser de novo sobre os textos guardados, sem OCR: registros
+# de OCR ("Texto") passam pelo parser das guias; os da camada de texto ("Content Ref")
+# pela extração do text_layer. As páginas que não viraram registro (unparsed.jsonl) e
+# não estão no JSON de entrada são tentadas de novo e entram na saída se o parser resolver.
+def reparse(store, input_path, output_path):
+    from .parser import process_text_and_generate_json
+
+    records = []
+    with open(input_path, 'r', encoding='utf-8') as json_file:
+        source_records = json.load(json_file)
+    for record in source_records:
+        if record.get("Texto"):
+            page_num = record["Página"] - 1 if record.get("Página") else None
+            with metrics.stage("parse"):
+                new_record = process_text_and_generate_json(store.get_text(record["Texto"]), record.get("Nome do Arquivo"), page_num)
+            if new_record:
+                new_record["Texto"] = record["Texto"]
+        elif record.get("Content Ref"):
+            from .text_layer import build_record
+            new_record = build_record(record.get("File Name"), store.get_text(record["Content Ref"]), store)
+        else:
+            logging.warning("Registro sem referência de texto mantido como está: %s", record.get("Nome do Arquivo") or record.get("File Name"))
+            new_record = record
+        if new_record:
+            records.append(new_record)
+        else:
+            metrics.inc("pages_skipped", reason="parse")
+
+    seen = {(record.get("Nome do Arquivo"), record.get("Página")) for record in source_records if record.get("Texto")}
+    recovered = 0
+    for entry in store.unparsed():
+        if (entry["file"], entry["page"]) in seen:
+            continue
+        seen.add((entry["file"], entry["page"]))
+        with metrics.stage("parse"):
+            new_record = process_text_and_generate_json(store.get_text(entry["ref"]), entry["file"], entry["page"] - 1, quiet=True)
+        if new_record:
+            new_record["Texto"] = entry["ref"]
+            records.append(new_record)
+            recovered += 1
+
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as json_file:
+        json.dump(records, json_file, ensure_ascii=False, indent=4)
+    logging.info("%d de %d registros refeitos a partir do armazém de textos em %s (%d páginas antes não lidas recuperadas)",
+                 len(records), len(source_records), output_path, recovered)
+    return records
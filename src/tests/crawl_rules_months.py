@@ -0,0 +1,43 @@
+import os
+import sys
+import json
+import logging
+import tempfile
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Diretório src/, de onde o pacote app é executado
+src_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, src_dir)
+
+from app.crawl_rules import compile_plan
+
+# Meses do plano da varredura: --month substitui a janela de anos (padrão 2024), então
+# um mês fora dela continua no plano; sem meses explícitos vale a janela inteira.
+with tempfile.TemporaryDirectory() as tmp:
+    config_path = os.path.join(tmp, "config.json")
+    with open(config_path, 'w', encoding='utf-8') as config_file:
+        json.dump({"FOLDERS_ACCESS": [{"Folder name": "Cliente A"}], "FOLDERS_IGNORED": []}, config_file)
+    years = range(2024, 2025)
+
+    plan = compile_plan(config_path, None, {"months": ["2025-05"], "clients": ["Cliente A"]})
+    months = plan.months("Cliente A", "Sub", years)
+    assert [(year, month) for year, month, _ in months] == [(2025, 5)], months
+
+    plan = compile_plan(config_path, None, {"months": ["2023-11:2024-02"]})
+    months = plan.months("Cliente A", "Sub", years)
+    assert [(year, month) for year, month, _ in months] == [(2023, 11), (2023, 12), (2024, 1), (2024, 2)], months
+
+    plan = compile_plan(config_path)
+    assert len(plan.months("Cliente A", "Sub", years)) == 12
+
+    # Camadas com meses se intersectam
+    rules_path = os.path.join(tmp, "rules.json")
+    with open(rules_path, 'w', encoding='utf-8') as rules_file:
+        json.dump([{"months": ["2025-01:2025-06"]}], rules_file)
+    plan = compile_plan(config_path, rules_path, {"months": ["2025-05:2025-09"]})
+    months = plan.months("Cliente A", "Sub", years)
+    assert [(year, month) for year, month, _ in months] == [(2025, 5), (2025, 6)], months
+
+    logging.info("Meses do plano conferidos.")
@@ -0,0 +1,78 @@
+import os
+import sys
+import time
+import json
+import logging
+import tempfile
+import subprocess
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Diretório src/, de onde o pacote app é executado
+src_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, src_dir)
+
+# Demonstração dos leases com vários processos locais: cada processo consome shards
+# de um banco compartilhado; um deles é morto no meio de um shard, que deve ser
+# assumido por outro processo depois que o lease expira. Ao fim, todos os shards
+# precisam estar concluídos e cada um processado até o fim uma única vez.
+shards = 12
+processes = 3
+ttl = 2.0
+work_seconds = 0.5
+
+# Código de cada processo: o trabalho do shard é esperar e gravar uma linha no log
+worker_code = """
+import sys, time
+from app.leases import LeaseStore, work
+store_path, log_path, ttl, work_seconds = sys.argv[1], sys.argv[2], float(sys.argv[3]), float(sys.argv[4])
+store = LeaseStore(store_path, ttl=ttl)
+def handle(shard):
+    time.sleep(work_seconds)
+    with open(log_path, 'a') as log_file:
+        log_file.write(shard.name + '\\n')
+work(store, "demo", handle, poll_seconds=0.5)
+"""
+
+with tempfile.TemporaryDirectory() as tmp:
+    store_path = os.path.join(tmp, "leases.sqlite")
+    log_path = os.path.join(tmp, "done.log")
+
+    from app.leases import LeaseStore
+    store = LeaseStore(store_path, ttl=ttl)
+    store.seed("demo", [(f"demo:{i:02d}", None) for i in range(shards)])
+
+    args = [store_path, log_path, str(ttl), str(work_seconds)]
+    workers = [subprocess.Popen([sys.executable, "-c", worker_code] + args, cwd=src_dir) for _ in range(processes)]
+
+    # Mata o primeiro processo assim que ele estiver com um shard
+    victim = f":{workers[0].pid}"
+    while not any(lease["owner"].endswith(victim) for lease in store.status("demo")["leased"]):
+        time.sleep(0.05)
+    workers[0].kill()
+    logging.info("Processo %d morto no meio de um shard.", workers[0].pid)
+
+    start = time.perf_counter()
+    for worker in workers[1:]:
+        worker.wait(timeout=120)
+    elapsed = time.perf_counter() - start
+
+    with open(log_path) as log_file:
+        done = [line.strip() for line in log_file if line.strip()]
+    status = store.status("demo")
+    store.close()
+
+logging.info("Status final: %s", json.dumps(status["shards"]))
+logging.info("%d shards concluídos por %d processos em %.1fs.", len(done), processes - 1, elapsed)
+
+failed = False
+if sorted(done) != sorted(set(done)):
+    logging.error("Shards processados mais de uma vez: %s", sorted(name for name in set(done) if done.count(name) > 1))
+    failed = True
+if len(set(done)) != shards or status["shards"].get("demo") != {"done": shards}:
+    logging.error("Nem todos os shards foram concluídos.")
+    failed = True
+if not failed:
+    logging.info("Todos os shards concluídos uma única vez, inclusive o do processo morto.")
+sys.exit(1 if failed else 0)
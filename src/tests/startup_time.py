@@ -0,0 +1,46 @@
+import os
+import sys
+import time
+import logging
+import subprocess
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Diretório src/, de onde o pacote app é executado
+src_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Módulos pesados que não podem ser carregados só para montar a CLI
+heavy_modules = ["fitz", "cv2", "PIL", "PyPDF2", "requests", "office365", "google", "dotenv", "numpy", "pandas"]
+
+# Tempo máximo aceitável de inicialização (segundos)
+max_startup_seconds = float(os.getenv('MAX_STARTUP_SECONDS', '0.5'))
+runs = 5
+
+# Verificar que importar a CLI e montar o parser não carrega módulos pesados
+check_code = (
+    "import sys; from app.cli import build_parser; build_parser(); "
+    f"print(','.join(m for m in {heavy_modules!r} if m in sys.modules))"
+)
+result = subprocess.run([sys.executable, "-c", check_code], cwd=src_dir, capture_output=True, text=True, check=True)
+loaded = result.stdout.strip()
+if loaded:
+    logging.error("Módulos pesados carregados na inicialização: %s", loaded)
+    sys.exit(1)
+logging.info("Nenhum módulo pesado carregado na inicialização.")
+
+# Medir o tempo de inicialização de cada subcomando (--help não autentica)
+failed = False
+for command in ["list", "crawl", "copy", "ocr", "parse", "reports", "load", "daemon", "serve", "shard", "text", "guias", "journal", "dedup", "classify", "sped", "reconcile", "corpus", "bench"]:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-m", "app", command, "--help"], cwd=src_dir, capture_output=True, check=True)
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    logging.info("Inicialização de '%s': %.3fs (melhor de %d)", command, best, runs)
+    if best > max_startup_seconds:
+        logging.error("Inicialização de '%s' acima do limite de %.3fs", command, max_startup_seconds)
+        failed = True
+
+sys.exit(1 if failed else 0)